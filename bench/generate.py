@@ -0,0 +1,72 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+def generate_cohort(n_rows : int, n_groups : int, censored_fraction : float = 0.4, date_fraction : float = 0.5, seed : int = 0) -> pd.DataFrame:
+    """Generate a synthetic input.tsv cohort.
+    Dataset sizes are skewed (a few large and many small datasets), every dataset has its own Weibull survival time distribution
+    and the follow up is censored independently of the survival time.
+
+    :param n_rows: the number of donors
+    :type n_rows: int
+    :param n_groups: the number of datasets
+    :type n_groups: int
+    :param censored_fraction: the fraction of donors without event at the last follow up
+    :type censored_fraction: float
+    :param date_fraction: the fraction of donors with enrolment_date and status_change_date instead of status_change_day
+    :type date_fraction: float
+    :param seed: the seed of the random generator
+    :type seed: int
+    :return: the cohort with the columns of input.tsv
+    :rtype: pd.DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    sizes = rng.dirichlet(np.full(n_groups, 0.5))
+    group = rng.choice(n_groups, n_rows, p=sizes)
+    # median survival between about half a year and ten years, per dataset
+    scale = rng.uniform(200, 4000, n_groups)[group]
+    shape = rng.uniform(0.7, 1.5, n_groups)[group]
+    days = np.ceil(scale * rng.weibull(shape)).astype(np.int64)
+    censored = rng.random(n_rows) < censored_fraction
+    # censored donors leave at a uniform time before their event
+    days[censored] = np.floor(days[censored] * rng.random(censored.sum())).astype(np.int64)
+    with_dates = rng.random(n_rows) < date_fraction
+
+    enrolment = np.datetime64("2000-01-01") + rng.integers(0, 20 * 365, n_rows).astype("timedelta64[D]")
+    status_change = enrolment + days.astype("timedelta64[D]")
+    enrolment_date = pd.Series(pd.to_datetime(enrolment).strftime("%Y-%m-%d")).where(with_dates)
+    status_change_date = pd.Series(pd.to_datetime(status_change).strftime("%Y-%m-%d")).where(with_dates)
+    return pd.DataFrame({
+        "dataset_id": pd.Series(np.char.add("dataset-", group.astype(str))),
+        "donor_id": pd.Series(np.char.add("donor-", np.arange(n_rows).astype(str))),
+        "enrolment_date": enrolment_date,
+        "status": ~censored,
+        "status_change_date": status_change_date,
+        "status_change_day": pd.Series(days, dtype=float).where(~with_dates),
+    })
+
+def write_cohort(root_path : str, n_rows : int, n_groups : int, censored_fraction : float = 0.4, date_fraction : float = 0.5, seed : int = 0) -> str:
+    """Generate a synthetic cohort and write it to input.tsv in a process directory
+
+    :param root_path: the process directory, created if missing
+    :type root_path: str
+    :return: the path of input.tsv
+    :rtype: str
+    """
+    os.makedirs(root_path, exist_ok=True)
+    input_path = os.path.join(root_path, "input.tsv")
+    generate_cohort(n_rows, n_groups, censored_fraction, date_fraction, seed).to_csv(input_path, sep="\t", index=False)
+    return input_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic input.tsv")
+    parser.add_argument("root_path", help="process directory to write input.tsv to")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--groups", type=int, default=1)
+    parser.add_argument("--censored", type=float, default=0.4, help="fraction of censored donors")
+    parser.add_argument("--dates", type=float, default=0.5, help="fraction of donors with dates instead of days")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_cohort(args.root_path, args.rows, args.groups, args.censored, args.dates, args.seed)
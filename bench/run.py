@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import argparse
+import platform
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from generate import write_cohort
+
+BASE_CASE = {"rows": 100000, "groups": 10, "censored": 0.4, "dates": 0.5}
+
+# every suite varies one parameter at a time around its base case
+SUITES = {
+    "quick": {
+        "base": {"rows": 10000, "groups": 10, "censored": 0.4, "dates": 0.5},
+        "rows": [1000, 10000, 100000],
+        "groups": [1, 10, 100],
+        "censored": [0.1, 0.4, 0.8],
+        "dates": [0.0, 0.5, 1.0],
+    },
+    "full": {
+        "base": BASE_CASE,
+        "rows": [1000, 10000, 100000, 1000000, 10000000],
+        "groups": [1, 10, 100, 1000],
+        "censored": [0.1, 0.4, 0.8],
+        "dates": [0.0, 0.5, 1.0],
+    },
+}
+
+def get_cases(suite : str) -> list:
+    """Get the cases of a benchmark suite
+
+    :param suite: the name of the suite, one of SUITES
+    :type suite: str
+    :return: the unique cases, dictionaries with the keys "rows" "groups" "censored" and "dates"
+    :rtype: list
+    """
+    grid = SUITES[suite]
+    cases = []
+    for parameter in ("rows", "groups", "censored", "dates"):
+        for value in grid[parameter]:
+            case = dict(grid["base"], **{parameter: value})
+            if case not in cases:
+                cases.append(case)
+    return cases
+
+def get_case_name(case : dict) -> str:
+    """Get the name of a case, e.g. rows=1000,groups=10,censored=0.4,dates=0.5"""
+    return ",".join(f"{key}={case[key]}" for key in ("rows", "groups", "censored", "dates"))
+
+def run_case(case : dict, repeat : int, seed : int) -> dict:
+    """Generate the cohort of a case and run the analysis on it repeat times with metrics enabled.
+    Runs in a fresh process, so the peak memory belongs to this case only.
+
+    :param case: the case
+    :type case: dict
+    :param repeat: the number of runs, the fastest run of every stage is kept
+    :type repeat: int
+    :param seed: the seed of the cohort generator
+    :type seed: int
+    :return: the best wall time of every stage and of the whole run in seconds, the peak memory in megabytes and the counts
+    :rtype: dict
+    """
+    # the result cache would turn every run after the first into a cache hit
+    os.environ.pop("UNITE_CACHE_PATH", None)
+    import app
+    with tempfile.TemporaryDirectory() as root_path:
+        write_cohort(root_path, case["rows"], case["groups"], case["censored"], case["dates"], seed)
+        options = dict(app.DEFAULT_OPTIONS, metrics=True)
+        stages, total = {}, float("inf")
+        for _ in range(repeat):
+            app.main(root_path, options)
+            with open(os.path.join(root_path, "metrics.json")) as f:
+                metrics = json.load(f)
+            for name, stage in metrics["stages"].items():
+                stages[name] = min(stages.get(name, float("inf")), stage["wall_time"])
+            total = min(total, metrics["wall_time"])
+    return {"stages": dict(stages, main=total), "peak_rss_mb": metrics["peak_rss_mb"], "counts": metrics["counts"]}
+
+def get_environment() -> dict:
+    """Describe the machine and the library versions the benchmark ran with"""
+    import numpy, pandas, scipy
+    return {
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "pandas": pandas.__version__,
+        "scipy": scipy.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+    }
+
+def run_suite(suite : str, repeat : int = 3, seed : int = 0) -> dict:
+    """Run all cases of a suite, every case in its own process
+
+    :return: a dictionary with the keys "suite", "environment" and "results" (case name to case result)
+    :rtype: dict
+    """
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for case in get_cases(suite):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            result = executor.submit(run_case, case, repeat, seed).result()
+        results[get_case_name(case)] = dict(case, **result)
+        print(f"{get_case_name(case)}: {result['stages']['main']:.3f}s, {result['peak_rss_mb']:.0f} MB", file=sys.stderr)
+    return {"suite": suite, "environment": get_environment(), "results": results}
+
+def compare(current : dict, baseline : dict, tolerance : float = 1.25, min_difference : float = 0.01) -> list:
+    """Find the stages that got slower than the baseline
+
+    :param current: the results of run_suite
+    :type current: dict
+    :param baseline: the stored results of an earlier run_suite
+    :type baseline: dict
+    :param tolerance: the allowed ratio of the current to the baseline time
+    :type tolerance: float
+    :param min_difference: differences below this many seconds are noise and never a regression
+    :type min_difference: float
+    :return: the regressions, tuples (case name, stage, baseline time, current time)
+    :rtype: list
+    """
+    regressions = []
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        for stage, seconds in result["stages"].items():
+            before = baseline["results"][name]["stages"].get(stage)
+            if before is not None and seconds > before * tolerance and seconds - before > min_difference:
+                regressions.append((name, stage, before, seconds))
+    return regressions
+
+def get_unmatched(current : dict, baseline : dict) -> list:
+    """Find the stages of the current results that the baseline does not have, e.g. stages added after it was recorded
+
+    :param current: the results of run_suite
+    :type current: dict
+    :param baseline: the stored results of an earlier run_suite
+    :type baseline: dict
+    :return: tuples (case name, stage), the stage is None if the baseline lacks the whole case
+    :rtype: list
+    """
+    unmatched = []
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            unmatched.append((name, None))
+            continue
+        unmatched.extend((name, stage) for stage in result["stages"] if stage not in baseline["results"][name]["stages"])
+    return unmatched
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the survival analysis on synthetic cohorts")
+    parser.add_argument("--suite", choices=list(SUITES), default="quick")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case, the fastest is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write the results as json, e.g. a new baseline")
+    parser.add_argument("--baseline", help="compare against the results in this json file and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="allowed ratio of current to baseline time")
+    args = parser.parse_args()
+
+    current = run_suite(args.suite, args.repeat, args.seed)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(current, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.tolerance)
+        # a baseline of another machine or an older version compares nothing or only part of the stages
+        if baseline["environment"] != current["environment"]:
+            print(f"warning: the baseline was recorded on {baseline['environment']}, not on {current['environment']}", file=sys.stderr)
+        for name, stage in get_unmatched(current, baseline):
+            print(f"warning: {name} {stage or 'all stages'} not in the baseline, record a new one with --save", file=sys.stderr)
+        for name, stage, before, seconds in regressions:
+            print(f"regression: {name} {stage} {before:.3f}s -> {seconds:.3f}s", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
@@ -1,24 +1,293 @@
 import argparse
 import pandas as pd
 import numpy as np
-from typing import Tuple
+from typing import NamedTuple, Tuple, Union
 import os
 import sys
 import json
-from sksurv.nonparametric import kaplan_meier_estimator
-from sksurv.compare import compare_survival
+import cProfile
+import tempfile
+from engine import RiskTable, GroupedSurvival, group_survival, get_censored_rows, build_risk_table
+from km import SurvivalCurves, CurveGrid, kaplan_meier, thin_curves, evaluate_curves
+from cache import get_cache, get_key
+from metrics import Metrics, is_enabled
+from logrank import MAX_CELLS, get_risk_matrix, pairwise_logrank_blocks, weighted_logrank_blocks, LOGRANK_TESTS
+from incremental import CohortState, build_state, save_state, load_state, update_state, get_risk_table, get_censored_donors, get_grouped_survival
+from resampling import bootstrap_bands, permutation_logrank
+from summary import summarize
+from cox import COX_TIES, get_design_matrix, fit_cox, get_coefficients, get_global_tests
+from streaming import SAMPLE_ROWS, MERGE_SIZE, get_chunk_rows, read_chunks, get_chunk_codes, reduce_chunk, merge_chunks, get_table_size, check_memory, check_analysis_memory, write_censored_run, merge_censored_runs
 
-def load_data(data_path : str) -> pd.DataFrame:
-    """Reads a tsv file into a pandas.DataFrame
+# the columns of input.tsv used by the analysis
+INPUT_COLUMNS = ["dataset_id", "donor_id", "enrolment_date", "status", "status_change_date", "status_change_day"]
+# the compact types of the input columns
+INPUT_DTYPES = {"dataset_id": "category", "donor_id": str, "enrolment_date": "category", "status": bool, "status_change_date": "category", "status_change_day": float}
+# the columns of an endpoint, several endpoints are given by prefixed columns (e.g. pfs_status) in one input
+ENDPOINT_COLUMNS = ["status", "status_change_date", "status_change_day"]
+# the date columns and their documented format
+DATE_COLUMNS = ["enrolment_date", "status_change_date"]
+DATE_FORMAT = "%Y-%m-%d"
+# the issues of validation.tsv, in the order they are reported
+VALIDATION_ISSUES = ["unparsable_enrolment_date", "unparsable_status_change_date", "negative_survival_days", "missing_survival_days"]
+# the file of the survival functions in every output format
+RESULT_FILES = {"tsv": "result.tsv", "parquet": "result.parquet", "feather": "result.feather", "json": "result.json"}
+# the files written to the process directory
+OUTPUT_FILES = list(RESULT_FILES.values()) + ["censored.tsv", "logrank_test.tsv", "logrank_pairwise.tsv", "validation.tsv", "state.npz", "bands.tsv", "summary.tsv", "cox.tsv", "cox_test.tsv", "grid.npz"]
 
-    :param data_path: path to the tsv file
+DEFAULT_OPTIONS = {
+    # endpoints analysed in one run from the prefixed columns {endpoint}_status, {endpoint}_status_change_date and {endpoint}_status_change_day,
+    # the results of every endpoint are written to the subdirectory {endpoint}, empty analyses the columns without prefix
+    "endpoints": [],
+    # implementation of the Kaplan-Meier estimator, "numpy" or "sksurv"
+    "backend": "numpy",
+    # parser of input.tsv, "c" or "pyarrow" (requires pyarrow)
+    "csv_engine": "c",
+    # tests comparing all groups, among "logrank", "gehan_wilcoxon", "tarone_ware" and "fleming_harrington"
+    "logrank_tests": ["logrank"],
+    # parameters (p, q) of the fleming_harrington test, p > 0 emphasises early and q > 0 late differences
+    "fleming_harrington": [0, 1],
+    # compare every pair of groups with the logrank test if there are more than two groups
+    "logrank_pairwise": True,
+    # format of the survival functions, "tsv", "parquet" or "feather" (require pyarrow) or "json"
+    "output_format": "tsv",
+    # store the survival functions as float32
+    "float32": False,
+    # drop the step points of the survival functions below this probability resolution (e.g. 1/height of the plot in pixels), 0 keeps all
+    "thinning": 0,
+    # evaluate the survival functions of all datasets on one time grid in grid.npz, a list of times or the number of evenly spaced times
+    # from 0 to the longest follow up, null disables
+    "time_grid": None,
+    # times at which summary.tsv reports the survival of every group, by default 1, 3 and 5 years in days
+    "landmarks": [365, 1095, 1826],
+    # time horizon of the restricted mean survival time in summary.tsv, null for the shortest last follow up of the groups
+    "rmst_tau": None,
+    # covariates of a Cox proportional hazards model written to cox.tsv and cox_test.tsv, extra columns of input.tsv or "dataset_id", empty disables
+    "cox_covariates": [],
+    # handling of tied event times in the Cox model, "efron" or "breslow"
+    "cox_ties": "efron",
+    # simultaneous bootstrap confidence bands of the survival functions in bands.tsv with this many replicates, 0 disables
+    "bootstrap_replicates": 0,
+    # permutation p-values of the logrank tests (column p_permutation) with this many permutations, 0 disables
+    "permutation_replicates": 0,
+    # seed of the bootstrap and the permutations
+    "seed": 0,
+    # threads of the bootstrap and the permutations, 0 for all cores
+    "threads": 0,
+    # stream the input in chunks reduced to the events and censorings at every time of every group, peak memory then grows with the
+    # number of distinct times instead of the rows. The memory budget in MB, 0 reads the whole input
+    "memory_budget": 0,
+    # keep the sufficient statistics in state.npz and update them with delta.tsv and removed.tsv in later runs
+    "incremental": False,
+    # record the time and memory of every stage to metrics.json (also enabled by UNITE_METRICS=1)
+    "metrics": False,
+    # profile the analysis to profile.prof (also enabled by UNITE_PROFILE=1)
+    "profile": False,
+}
+
+def load_options(root_path : str) -> dict:
+    """Read the analysis options from options.json in the process directory, missing options take their default
+
+    :param root_path: the process directory
+    :type root_path: str
+    :return: the options
+    :rtype: dict
+    """
+    options = dict(DEFAULT_OPTIONS)
+    options_path = os.path.join(root_path, "options.json")
+    if os.path.exists(options_path):
+        with open(options_path) as f:
+            options.update(json.load(f))
+    return check_options(options)
+
+def check_options(options : dict) -> dict:
+    """Check the values of the analysis options
+
+    :param options: the analysis options
+    :type options: dict
+    :raises ValueError: if an option has an invalid value
+    :return: the options
+    :rtype: dict
+    """
+    if options["backend"] not in ("numpy", "sksurv"):
+        raise ValueError(f"backend must be 'numpy' or 'sksurv', but was {options['backend']!r}")
+    if options["csv_engine"] not in ("c", "pyarrow"):
+        raise ValueError(f"csv_engine must be 'c' or 'pyarrow', but was {options['csv_engine']!r}")
+    for test in options["logrank_tests"]:
+        if test not in LOGRANK_TESTS:
+            raise ValueError(f"logrank_tests must be among {LOGRANK_TESTS}, but was {test!r}")
+    if options["output_format"] not in RESULT_FILES:
+        raise ValueError(f"output_format must be one of {list(RESULT_FILES)}, but was {options['output_format']!r}")
+    if not 0 <= options["thinning"] < 1:
+        raise ValueError(f"thinning must be at least 0 and less than 1, but was {options['thinning']!r}")
+    time_grid = options["time_grid"]
+    if time_grid is not None and not (isinstance(time_grid, int) and not isinstance(time_grid, bool) and time_grid > 0) and not (
+            isinstance(time_grid, list) and all(isinstance(t, (int, float)) and t >= 0 for t in time_grid)):
+        raise ValueError(f"time_grid must be a number of times, a list of non-negative times or null, but was {time_grid!r}")
+    if any(not isinstance(t, (int, float)) or t < 0 for t in options["landmarks"]):
+        raise ValueError(f"landmarks must be non-negative times, but was {options['landmarks']!r}")
+    if options["rmst_tau"] is not None and (not isinstance(options["rmst_tau"], (int, float)) or options["rmst_tau"] <= 0):
+        raise ValueError(f"rmst_tau must be a positive time or null, but was {options['rmst_tau']!r}")
+    for endpoint in options["endpoints"]:
+        if not isinstance(endpoint, str) or not endpoint or os.sep in endpoint or endpoint.startswith("."):
+            raise ValueError(f"endpoints must be names usable as directory names, but was {endpoint!r}")
+    if len(set(options["endpoints"])) != len(options["endpoints"]):
+        raise ValueError(f"endpoints must be unique, but was {options['endpoints']!r}")
+    if options["endpoints"] and options["incremental"]:
+        raise ValueError("endpoints can not be combined with incremental, the state holds one endpoint")
+    if options["cox_ties"] not in COX_TIES:
+        raise ValueError(f"cox_ties must be one of {COX_TIES}, but was {options['cox_ties']!r}")
+    if options["cox_covariates"] and options["incremental"]:
+        raise ValueError("cox_covariates can not be combined with incremental, the state does not keep the covariates")
+    for option in ["bootstrap_replicates", "permutation_replicates", "threads"]:
+        if not isinstance(options[option], int) or options[option] < 0:
+            raise ValueError(f"{option} must be a non-negative integer, but was {options[option]!r}")
+    if not isinstance(options["memory_budget"], (int, float)) or isinstance(options["memory_budget"], bool) or options["memory_budget"] < 0:
+        raise ValueError(f"memory_budget must be a non-negative number of MB, but was {options['memory_budget']!r}")
+    if options["memory_budget"]:
+        # these need the rows of every patient, not only the counts at every time
+        for option in ["endpoints", "cox_covariates", "bootstrap_replicates", "permutation_replicates", "incremental"]:
+            if options[option]:
+                raise ValueError(f"memory_budget can not be combined with {option}")
+        if options["backend"] != "numpy":
+            raise ValueError("memory_budget requires the numpy backend")
+    return options
+
+def get_input_path(root_path : str) -> str:
+    """Get the input file of the process directory, input.parquet or input.feather if present, input.tsv otherwise
+
+    :param root_path: the process directory
+    :type root_path: str
+    :return: the path to the input file
+    :rtype: str
+    """
+    for file in ["input.parquet", "input.feather"]:
+        if os.path.exists(os.path.join(root_path, file)):
+            return os.path.join(root_path, file)
+    return os.path.join(root_path, "input.tsv")
+
+def get_used_columns(options : dict) -> list:
+    """Get the columns of the input used by the analysis, the input columns, the columns of the endpoints and the covariates of the Cox model
+
+    :param options: the analysis options
+    :type options: dict
+    :return: the columns
+    :rtype: list
+    """
+    columns = INPUT_COLUMNS + [f"{endpoint}_{c}" for endpoint in options["endpoints"] for c in ENDPOINT_COLUMNS]
+    return columns + [c for c in options["cox_covariates"] if c not in columns]
+
+def get_input_dtypes(endpoints : list = ()) -> dict:
+    """Get the compact types of the input columns and of the prefixed columns of the endpoints
+
+    :param endpoints: the endpoints
+    :type endpoints: list
+    :return: the type of every column
+    :rtype: dict
+    """
+    dtypes = dict(INPUT_DTYPES)
+    for endpoint in endpoints:
+        dtypes.update({f"{endpoint}_{c}": INPUT_DTYPES[c] for c in ENDPOINT_COLUMNS})
+    return dtypes
+
+def get_input_columns(data_path : str, used_columns : list = INPUT_COLUMNS) -> list:
+    """Get the columns of the input file used by the analysis, without reading the data
+
+    :param data_path: path to the tsv, parquet or feather file
     :type data_path: str
-    :return: the dataframe
+    :param used_columns: the columns used by the analysis, see get_used_columns
+    :type used_columns: list
+    :return: the used columns present in the file, in the order of the file
+    :rtype: list
+    """
+    if data_path.endswith(".parquet"):
+        import pyarrow.parquet
+        columns = pyarrow.parquet.read_schema(data_path).names
+    elif data_path.endswith(".feather"):
+        import pyarrow.ipc
+        with pyarrow.ipc.open_file(data_path) as reader:
+            columns = reader.schema.names
+    else:
+        columns = pd.read_csv(data_path, sep="\t", nrows=0).columns
+    return [c for c in columns if c in used_columns]
+
+def parse_dates(dates : pd.Series, errors : str = "raise") -> pd.Series:
+    """Parse dates in the format yyyy-mm-dd, every distinct date is parsed only once
+
+    :param dates: the dates as strings or categorical strings
+    :type dates: pd.Series
+    :param errors: "raise" to fail on invalid dates, "coerce" to parse them as NaT
+    :type errors: str
+    :return: the parsed dates
+    :rtype: pd.Series
+    """
+    if dates.dtype != "category":
+        dates = dates.astype("category")
+    parsed = pd.to_datetime(dates.cat.categories, format=DATE_FORMAT, errors=errors)
+    return pd.Series(parsed.take(dates.cat.codes, allow_fill=True, fill_value=pd.NaT), index=dates.index, name=dates.name)
+
+def set_input_types(data : pd.DataFrame, endpoints : list = ()) -> pd.DataFrame:
+    """Convert the input columns to their types: dataset_id categorical, donor_id string, status bool, status_change_day float and the dates datetime.
+    The prefixed columns of the endpoints are converted like the ones without prefix.
+
+    :param data: the input data frame
+    :type data: pd.DataFrame
+    :param endpoints: the endpoints
+    :type endpoints: list
+    :return: the data frame with converted columns
     :rtype: pd.DataFrame
     """
-    data = pd.read_csv(data_path,sep="\t")
+    if "dataset_id" in data.columns:
+        if data["dataset_id"].dtype != "category":
+            data["dataset_id"] = data["dataset_id"].astype("category")
+        if data["dataset_id"].cat.categories.dtype != object:
+            # identifiers are strings, also if the parser inferred numbers
+            data["dataset_id"] = data["dataset_id"].cat.rename_categories(data["dataset_id"].cat.categories.astype(str))
+    if "donor_id" in data.columns and data["donor_id"].dtype != object:
+        data["donor_id"] = data["donor_id"].astype(str)
+    for prefix in [""] + [f"{endpoint}_" for endpoint in endpoints]:
+        status, day = f"{prefix}status", f"{prefix}status_change_day"
+        if status in data.columns and data[status].dtype != bool:
+            data[status] = data[status].astype(str).str.lower() == "true" if data[status].dtype == object else data[status].astype(bool)
+        if day in data.columns and data[day].dtype != float:
+            data[day] = data[day].astype(float)
+    for column in DATE_COLUMNS + [f"{endpoint}_status_change_date" for endpoint in endpoints]:
+        if column in data.columns and not pd.api.types.is_datetime64_any_dtype(data[column]):
+            try:
+                data[column] = parse_dates(data[column])
+            except (ValueError, TypeError):
+                # leave invalid dates to get_survival_days
+                pass
     return data
 
+def load_data(data_path : str, engine : str = "c", used_columns : list = INPUT_COLUMNS, endpoints : list = ()) -> pd.DataFrame:
+    """Reads the input file into a pandas.DataFrame. Only the columns used by the analysis are read and converted to compact types,
+    dataset_id is categorical, status is bool and the dates are parsed with the format yyyy-mm-dd. The types of other used columns are inferred.
+
+    :param data_path: path to the tsv file, or to a parquet or feather file with the same columns
+    :type data_path: str
+    :param engine: the parser of the tsv file, "c" or "pyarrow"
+    :type engine: str
+    :param used_columns: the columns used by the analysis, see get_used_columns
+    :type used_columns: list
+    :param endpoints: the endpoints with prefixed columns
+    :type endpoints: list
+    :return: the dataframe
+    :rtype: pd.DataFrame
+    """
+    columns = get_input_columns(data_path, used_columns)
+    if data_path.endswith(".parquet"):
+        data = pd.read_parquet(data_path, columns=columns)
+    elif data_path.endswith(".feather"):
+        data = pd.read_feather(data_path, columns=columns)
+    elif engine == "pyarrow":
+        data = pd.read_csv(data_path, sep="\t", usecols=columns, engine="pyarrow")
+    else:
+        # dates are read as categories and parsed once per distinct date
+        data = pd.read_csv(data_path, sep="\t", usecols=columns, dtype={c: t for c, t in get_input_dtypes(endpoints).items() if c in columns})
+    if list(data.columns) != columns:
+        data = data[columns]
+    return set_input_types(data, endpoints)
+
 def get_survival_days_from_dates(data : pd.DataFrame) -> Tuple[pd.Series, pd.Series]:
     """Get the number of days survival given the diagnosis date and the last follow up date.
 
@@ -29,8 +298,8 @@ def get_survival_days_from_dates(data : pd.DataFrame) -> Tuple[pd.Series, pd.Ser
     """
 
     
-    enrolment_date = pd.to_datetime(data["enrolment_date"])
-    census_date = pd.to_datetime(data["status_change_date"])
+    enrolment_date = pd.to_datetime(data["enrolment_date"], format=DATE_FORMAT)
+    census_date = pd.to_datetime(data["status_change_date"], format=DATE_FORMAT)
     survival_days = (census_date - enrolment_date).dt.days
     success=survival_days.isna()==False
     return survival_days, success
@@ -50,47 +319,86 @@ def get_survival_days_from_days(data : pd.DataFrame) -> Tuple[pd.Series, pd.Seri
     return survival_days, success
 
 
+def get_dates(data : pd.DataFrame, column : str) -> Tuple[np.ndarray, np.ndarray]:
+    """Get a date column as datetime64 values, parsing every distinct date only once
+
+    :param data: the input data frame
+    :type data: pd.DataFrame
+    :param column: the name of the date column
+    :type column: str
+    :return: a tuple with the dates (NaT if missing or invalid) and a boolean array marking the dates which are present but could not be parsed
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    """
+    if column not in data.columns:
+        return np.full(len(data), np.datetime64("NaT"), dtype="datetime64[ns]"), np.zeros(len(data), dtype=bool)
+    dates = data[column]
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = parse_dates(dates, errors="coerce")
+    dates = dates.to_numpy(dtype="datetime64[ns]")
+    return dates, np.isnat(dates) & data[column].notna().to_numpy()
+
+def derive_survival_days(data : pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, pd.DataFrame]:
+    """Get the number of days survival of every patient in one pass, from the dates if both are valid and from status_change_day otherwise.
+    Rows without a valid source are excluded and reported together with unparsable dates and negative durations.
+
+    :param data: the input data frame
+    :type data: pd.DataFrame
+    :return: a tuple with the survival days (float32, NaN if excluded), a boolean array marking the rows to use and the validation report with the columns 'row' 'donor_id' 'issue' 'excluded'
+    :rtype: Tuple[np.ndarray, np.ndarray, pd.DataFrame]
+    """
+    enrolment_date, enrolment_unparsable = get_dates(data, "enrolment_date")
+    census_date, census_unparsable = get_dates(data, "status_change_date")
+    with np.errstate(invalid="ignore"):
+        # rows with a missing date are masked below
+        days_from_dates = (census_date - enrolment_date) // np.timedelta64(1, "D")
+    from_dates = ~np.isnat(enrolment_date) & ~np.isnat(census_date)
+    if "status_change_day" in data.columns:
+        days = data["status_change_day"].to_numpy(dtype=np.float32)
+    else:
+        days = np.full(len(data), np.nan, dtype=np.float32)
+    
+    negative = (from_dates & (days_from_dates < 0)) | (days < 0)
+    from_dates &= days_from_dates >= 0
+    from_days = ~from_dates & (days >= 0)
+    valid = from_dates | from_days
+    survival_days = np.where(from_dates, days_from_dates.astype(np.float32), np.where(from_days, days, np.float32(np.nan)))
+    
+    issues = dict(zip(VALIDATION_ISSUES, [enrolment_unparsable, census_unparsable, negative, ~valid & ~negative]))
+    rows = [np.flatnonzero(mask) for mask in issues.values()]
+    rows_all = np.concatenate(rows)
+    donor_id = data["donor_id"].to_numpy()[rows_all] if "donor_id" in data.columns else np.full(len(rows_all), None)
+    report = pd.DataFrame({
+        "row": rows_all,
+        "donor_id": donor_id,
+        "issue": np.repeat(list(issues.keys()), [len(r) for r in rows]),
+        "excluded": ~valid[rows_all],
+    })
+    return survival_days, valid, report
+
 def get_survival_days(data : pd.DataFrame) -> pd.Series:
     """Get the number of days survival from the data frame.
     
     :param data: the input data frame
     :return: pd.DataFrame
     """
+    survival_days, _, _ = derive_survival_days(data)
+    return pd.Series(survival_days, name="survival_days", dtype=float)
     
-
-    # initialise data frame
-    survival_days = pd.Series(index=range(len(data)),name="survival_days",dtype=float)
-    # try to get survival days from the dates
-    s1,success = get_survival_days_from_dates(data)
-    survival_days.iloc[np.array(success)]=s1.iloc[np.array(success)]
-    # if not possible, get survival days from the days
-    survival_days.iloc[np.array(~success)]= get_survival_days_from_days(data)[0].iloc[np.array(~success)]
-    return survival_days
-    
-def estimate_survival_function(survival : pd.Series, exit_status : pd.Series) -> pd.DataFrame:
+def estimate_survival_function(survival : pd.Series, exit_status : pd.Series, backend : str = "numpy") -> pd.DataFrame:
     """Estimate the survival function and log-log confidence intervals using the Kaplan-Meier estimator
 
     :param survival: the number of days survival or until censoring
     :type survival: pd.Series
     :param exit_status: True if the patient died, False if the patient is still alive
     :type exit_status: pd.Series
+    :param backend: the implementation of the estimator, "numpy" or "sksurv"
+    :type backend: str
     :return: A dataframe with the survival function (time x survival_prob) and the log-log confidence intervals
     :rtype: pd.DataFrame
     """
-    time, survival_prob, conf_int = kaplan_meier_estimator(
-    exit_status, survival, conf_type="log-log")
-    
-    # add point to the beginning (for plotting) representing the time 0
-    time = np.concatenate([[0], time])
-    survival_prob = np.concatenate([[1], survival_prob])
-    conf_int = np.concatenate([np.array([[1],[1]]), conf_int],axis=1)
-    survival_df = pd.DataFrame({
-        'time': time,
-        'survival_prob': survival_prob,
-        'conf_int_lower': conf_int[0],
-        'conf_int_upper': conf_int[1]
-    })
-    return survival_df
+    grouped = group_survival(np.zeros(len(survival), dtype=int), survival, exit_status)
+    survival_df = get_survival_functions(grouped, backend)
+    return survival_df.drop(columns="dataset_id")
 
 def get_censored_df(survival_days : pd.Series, exit_status : pd.Series, ids : pd.Series) -> pd.DataFrame:
     """Return a data frame containing the survival days of all censored patients (those who were still alive at last follow up)
@@ -168,6 +476,7 @@ def logrank_test(survival_days : pd.Series,exit_status : pd.Series,dataset_id :
     :return: a data frame with the chi2 and p values of the logrank test
     :rtype: pd.DataFrame
     """
+    from sksurv.compare import compare_survival
     # crate a structured array with the survival days and exit status
     survival_data = np.zeros(len(survival_days), dtype=[('status', bool), ('time', float)])
     survival_data['status'] = exit_status
@@ -189,41 +498,655 @@ def concatenate_dfs_add_dataset_id(dfs : list,dataset_id : str) -> pd.DataFrame:
         df["dataset_id"]=dataset_id[i]
     return pd.concat(dfs,ignore_index=True)
 
+
+def estimate_survival_curves(grouped : GroupedSurvival, backend : str = "numpy", thinning : float = 0) -> SurvivalCurves:
+    """Estimate the survival functions of all groups
+
+    :param grouped: the survival data sorted by (group, time)
+    :type grouped: GroupedSurvival
+    :param backend: the implementation of the estimator, "numpy" estimates all groups in one batch, "sksurv" calls sksurv for every group
+    :type backend: str
+    :param thinning: drop the step points below this probability resolution, see km.thin_curves
+    :type thinning: float
+    :return: the survival functions and log-log confidence intervals of all groups, each starting with the time 0
+    :rtype: SurvivalCurves
+    """
+    if backend == "numpy":
+        curves = kaplan_meier(grouped.table)
+    else:
+        from sksurv.nonparametric import kaplan_meier_estimator
+        table = grouped.table
+        # one row per distinct time of a group plus the time 0 row of every group
+        offsets = table.offsets + np.arange(len(grouped.labels) + 1)
+        curves = SurvivalCurves(grouped.labels, np.zeros(offsets[-1]), np.ones(offsets[-1]), np.ones(offsets[-1]), np.ones(offsets[-1]), offsets)
+        for g, (row_start, row_end) in enumerate(zip(grouped.row_offsets[:-1], grouped.row_offsets[1:])):
+            out = slice(offsets[g] + 1, offsets[g + 1])
+            curves.time[out], curves.survival_prob[out], (curves.conf_int_lower[out], curves.conf_int_upper[out]) = kaplan_meier_estimator(
+                grouped.event[row_start:row_end], grouped.time[row_start:row_end], conf_type="log-log")
+    return thin_curves(curves, thinning)
+
+def get_survival_functions(grouped : GroupedSurvival, backend : str = "numpy", thinning : float = 0) -> pd.DataFrame:
+    """Estimate the survival functions of all groups into one data frame with a dataset_id column
+
+    :param grouped: the survival data sorted by (group, time)
+    :type grouped: GroupedSurvival
+    :param backend: the implementation of the estimator, see estimate_survival_curves
+    :type backend: str
+    :param thinning: drop the step points below this probability resolution, see km.thin_curves
+    :type thinning: float
+    :return: a data frame with the survival function and log-log confidence intervals of every group, each starting with the time 0
+    :rtype: pd.DataFrame
+    """
+    return estimate_survival_curves(grouped, backend, thinning).to_frame()
+
+def write_survival_functions(survival_functions : pd.DataFrame, root_path : str, output_format : str = "tsv", float32 : bool = False) -> str:
+    """Write the survival functions to the result file of the output format.
+    The json format holds an object per dataset_id with the arrays 'time' 'survival_prob' 'conf_int_lower' 'conf_int_upper'.
+
+    :param survival_functions: the survival functions of all groups, see get_survival_functions
+    :type survival_functions: pd.DataFrame
+    :param root_path: the process directory
+    :type root_path: str
+    :param output_format: "tsv", "parquet", "feather" or "json"
+    :type output_format: str
+    :param float32: store the values as float32, in tsv with 7 significant digits and in json rounded to 7 decimals
+    :type float32: bool
+    :return: the path of the result file
+    :rtype: str
+    """
+    path = os.path.join(root_path, RESULT_FILES[output_format])
+    values = ["time", "survival_prob", "conf_int_lower", "conf_int_upper"]
+    if float32:
+        survival_functions = survival_functions.astype({column: np.float32 for column in values})
+    if output_format == "tsv":
+        survival_functions.to_csv(path, sep="\t", index=False)
+    elif output_format == "parquet":
+        survival_functions.astype({"dataset_id": "category"}).to_parquet(path, index=False)
+    elif output_format == "feather":
+        survival_functions.astype({"dataset_id": "category"}).reset_index(drop=True).to_feather(path)
+    else:
+        precision = 7 if float32 else 15
+        # the rows of a dataset are contiguous
+        dataset_id = survival_functions["dataset_id"].to_numpy()
+        starts = np.flatnonzero(np.concatenate([[True], dataset_id[1:] != dataset_id[:-1]])) if len(dataset_id) else np.zeros(0, dtype=int)
+        ends = np.append(starts[1:], len(dataset_id))
+        with open(path, "w") as f:
+            f.write("{")
+            for i, (start, end) in enumerate(zip(starts, ends)):
+                group = survival_functions.iloc[start:end]
+                arrays = ",".join(f'"{column}":{group[column].to_json(orient="values", double_precision=precision)}' for column in values)
+                f.write(f'{"," if i else ""}{json.dumps(str(dataset_id[start]))}:{{{arrays}}}')
+            f.write("}")
+    return path
+
+def write_curve_grid(grid : CurveGrid, path : str, float32 : bool = False):
+    """Write the curves on the time grid to a npz file with the arrays 'labels' 'time' and the groups x times matrices 'survival_prob' 'conf_int_lower' 'conf_int_upper'
+
+    :param grid: the curves on the time grid
+    :type grid: CurveGrid
+    :param path: the path of the npz file
+    :type path: str
+    :param float32: store the values as float32
+    :type float32: bool
+    """
+    dtype = np.float32 if float32 else float
+    with open(path, "wb") as f:
+        np.savez(
+            f,
+            labels=grid.labels.astype(str),
+            time=grid.time.astype(dtype),
+            survival_prob=grid.survival_prob.astype(dtype),
+            conf_int_lower=grid.conf_int_lower.astype(dtype),
+            conf_int_upper=grid.conf_int_upper.astype(dtype),
+        )
+
+def get_censored(grouped : GroupedSurvival, survival_days : pd.Series, ids : pd.Series) -> pd.DataFrame:
+    """Return a data frame containing the survival days of the censored patients of all groups
+
+    :param grouped: the survival data sorted by (group, time)
+    :type grouped: GroupedSurvival
+    :param survival_days: the days survival of all patients in input order
+    :type survival_days: pd.Series
+    :param ids: the ids of the patients in input order
+    :type ids: pd.Series
+    :return: a data frame with the columns 'donor_id' 'days_at_censoring' 'dataset_id', grouped by dataset_id
+    :rtype: pd.DataFrame
+    """
+    rows = get_censored_rows(grouped)
+    return pd.DataFrame({
+        "donor_id": np.asarray(ids)[rows],
+        "days_at_censoring": np.asarray(survival_days)[rows],
+        "dataset_id": grouped.labels[grouped.codes[rows]]
+    })
+
+class AnalysisResult(NamedTuple):
+    """The results of an analysis, backed by numpy arrays.
+    logrank and logrank_pairwise are None if there are too few groups to compare (or pairwise comparison is disabled),
+    grouped is None for an incremental update without resampling, state is None unless the option "incremental" is set
+    and bands is None unless the option "bootstrap_replicates" is set.
+    summary holds the median, landmark survival and restricted mean survival time of every group, see summary.summarize.
+    cox and cox_test are None unless the option "cox_covariates" is set, grid is None unless the option "time_grid" is set.
+    """
+    grouped: GroupedSurvival
+    curves: SurvivalCurves
+    censored: pd.DataFrame
+    logrank: pd.DataFrame
+    logrank_pairwise: pd.DataFrame
+    validation: pd.DataFrame
+    state: CohortState = None
+    bands: pd.DataFrame = None
+    summary: pd.DataFrame = None
+    cox: pd.DataFrame = None
+    cox_test: pd.DataFrame = None
+    grid: CurveGrid = None
+
+def compare_groups(grouped : GroupedSurvival, table : RiskTable, options : dict, metrics : Metrics, max_cells : int = MAX_CELLS) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Perform the logrank tests and compare every pair of groups from the shared risk tables if there is more than one group.
+    The tests sum over blocks of the pooled event times, the risk matrix of a block has at most max_cells cells.
+
+    :param grouped: the survival data sorted by (group, time), only used for the permutation p-values
+    :type grouped: GroupedSurvival
+    :param table: the event/at-risk table of all groups
+    :type table: RiskTable
+    :param options: the analysis options
+    :type options: dict
+    :param metrics: the metrics recording the stages
+    :type metrics: Metrics
+    :param max_cells: the maximum number of cells (groups x times) of a block
+    :type max_cells: int
+    :return: a tuple with the weighted logrank tests and the pairwise logrank tests, None if there are too few groups
+    :rtype: Tuple[pd.DataFrame, pd.DataFrame]
+    """
+    logrank, pairwise = None, None
+    if len(table.labels) > 1:
+        with metrics.stage("logrank"):
+            logrank = weighted_logrank_blocks(table, options["logrank_tests"], options["fleming_harrington"], max_cells)
+        if options["permutation_replicates"]:
+            with metrics.stage("permutation"):
+                # the permutations shuffle the rows of the whole risk matrix
+                logrank["p_permutation"] = permutation_logrank(grouped, get_risk_matrix(table), options["logrank_tests"], options["fleming_harrington"],
+                    options["permutation_replicates"], options["seed"], options["threads"])
+        if len(table.labels) > 2 and options["logrank_pairwise"]:
+            with metrics.stage("logrank_pairwise"):
+                pairwise = pairwise_logrank_blocks(table, max_cells)
+    return logrank, pairwise
+
+def get_bands(grouped : GroupedSurvival, options : dict, metrics : Metrics) -> pd.DataFrame:
+    """Get the simultaneous bootstrap confidence bands of the survival functions if the option "bootstrap_replicates" is set
+
+    :param grouped: the survival data sorted by (group, time)
+    :type grouped: GroupedSurvival
+    :param options: the analysis options
+    :type options: dict
+    :param metrics: the metrics recording the stages
+    :type metrics: Metrics
+    :return: the bands, see resampling.bootstrap_bands, or None
+    :rtype: pd.DataFrame
+    """
+    if not options["bootstrap_replicates"]:
+        return None
+    with metrics.stage("bootstrap"):
+        return bootstrap_bands(grouped, options["bootstrap_replicates"], seed=options["seed"], threads=options["threads"])
+
+def get_cox(covariates : pd.DataFrame, survival_days : np.ndarray, exit_status : np.ndarray, options : dict, metrics : Metrics) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Fit the Cox proportional hazards model of the covariates, rows with a missing covariate are left out
+
+    :param covariates: the covariates of every patient with valid survival days
+    :type covariates: pd.DataFrame
+    :param survival_days: the survival days of every patient
+    :type survival_days: np.ndarray
+    :param exit_status: the event indicator of every patient
+    :type exit_status: np.ndarray
+    :param options: the analysis options
+    :type options: dict
+    :param metrics: the metrics recording the stages
+    :type metrics: Metrics
+    :return: a tuple with the hazard ratios and the global tests, see cox.get_coefficients and cox.get_global_tests, None if there is nothing to fit
+    :rtype: Tuple[pd.DataFrame, pd.DataFrame]
+    """
+    with metrics.stage("cox"):
+        x, names, complete = get_design_matrix(covariates)
+        event = np.asarray(exit_status)[complete]
+        if not names or not event.any():
+            return None, None
+        model = fit_cox(np.asarray(survival_days)[complete], event, x, names, options["cox_ties"])
+    metrics.count(cox_rows=model.n, cox_iterations=model.iterations)
+    return get_coefficients(model), get_global_tests(model)
+
+def get_grid(curves : SurvivalCurves, options : dict, metrics : Metrics) -> CurveGrid:
+    """Evaluate the survival functions on the time grid of the option "time_grid", before they are thinned
+
+    :param curves: the survival functions of all groups
+    :type curves: SurvivalCurves
+    :param options: the analysis options
+    :type options: dict
+    :param metrics: the metrics recording the stages
+    :type metrics: Metrics
+    :return: the curves on the grid, None if the option is not set
+    :rtype: CurveGrid
+    """
+    if options["time_grid"] is None:
+        return None
+    with metrics.stage("grid"):
+        time = options["time_grid"]
+        if isinstance(time, int):
+            time = np.linspace(0, curves.time.max() if len(curves.time) else 0, time)
+        return evaluate_curves(curves, np.asarray(time, dtype=float))
+
+def summarize_curves(curves : SurvivalCurves, table : RiskTable, options : dict, metrics : Metrics) -> pd.DataFrame:
+    """Summarize the survival functions at the landmarks and the time horizon of the options, before they are thinned
+
+    :param curves: the survival functions of all groups
+    :type curves: SurvivalCurves
+    :param table: the event/at-risk table of all groups the curves were estimated from
+    :type table: RiskTable
+    :param options: the analysis options
+    :type options: dict
+    :param metrics: the metrics recording the stages
+    :type metrics: Metrics
+    :return: the summary, see summary.summarize
+    :rtype: pd.DataFrame
+    """
+    with metrics.stage("summary"):
+        return summarize(curves, table, options["landmarks"], options["rmst_tau"])
+
+def analyze(data : Union[pd.DataFrame, dict], options : dict = None, metrics : Metrics = None) -> AnalysisResult:
+    """Estimate the survival functions of all groups and compare them, without reading or writing files.
+    The input has the columns of input.tsv, only status and either status_change_day or both dates are required.
+    Without donor_id the patients are identified by their row number.
+
+    :param data: a data frame or a dictionary of arrays with the columns of input.tsv, it is not modified
+    :type data: Union[pd.DataFrame, dict]
+    :param options: the analysis options, missing options take their default
+    :type options: dict
+    :param metrics: the metrics recording the stages, nothing is recorded if not given
+    :type metrics: Metrics
+    :return: the survival curves, censored patients, tests and validation report
+    :rtype: AnalysisResult
+    """
+    options = check_options(dict(DEFAULT_OPTIONS, **(options or {})))
+    if metrics is None:
+        metrics = Metrics(False)
+    # a new frame of the used columns, converting the types replaces the columns and leaves the caller's data alone
+    data = set_input_types(pd.DataFrame({c: data[c] for c in get_used_columns(options) if c in data}, copy=False))
+    missing = [c for c in options["cox_covariates"] if c not in data.columns and c != "dataset_id"]
+    if missing:
+        raise ValueError(f"the Cox covariates {missing} are not in the input")
+    
+    # get the dataset_ids of the groups
+    dataset_id = get_dataset_ids(data)
+    covariates = pd.DataFrame({c: (dataset_id if c == "dataset_id" else data[c]).reset_index(drop=True) for c in options["cox_covariates"]}) if options["cox_covariates"] else None
+    
+    # get the survival days and exit status (event binary indicator) of all patients
+    with metrics.stage("survival_days"):
+        survival_days, valid, report = derive_survival_days(data)
+        exit_status = get_exit_status(data)
+        donor_id = data["donor_id"] if "donor_id" in data.columns else pd.Series(np.arange(len(data)).astype(str))
+    
+    # the sufficient statistics of all donors, including the excluded ones which an update may make valid
+    state = None
+    if options["incremental"]:
+        with metrics.stage("state"):
+            state = build_state(dataset_id, donor_id, survival_days, exit_status)
+    
+    with metrics.stage("survival_days"):
+        # exclude the rows without valid survival days
+        if not valid.all():
+            dataset_id, survival_days, exit_status, donor_id = dataset_id[valid], survival_days[valid], exit_status[valid], donor_id[valid]
+            covariates = covariates[valid] if covariates is not None else None
+    metrics.count(excluded_rows=len(valid) - valid.sum())
+    
+    # sort once by (group, time) and build the event/at-risk tables of all groups
+    with metrics.stage("grouping"):
+        grouped = group_survival(dataset_id, survival_days, exit_status)
+    metrics.count(groups=len(grouped.labels), distinct_times=len(grouped.table.time))
+    
+    with metrics.stage("kaplan_meier"):
+        curves = estimate_survival_curves(grouped, options["backend"])
+    summary = summarize_curves(curves, grouped.table, options, metrics)
+    grid = get_grid(curves, options, metrics)
+    with metrics.stage("kaplan_meier"):
+        curves = thin_curves(curves, options["thinning"])
+    metrics.count(curve_points=len(curves.time))
+    
+    with metrics.stage("censored"):
+        censored = get_censored(grouped, survival_days, donor_id)
+    
+    logrank, pairwise = compare_groups(grouped, grouped.table, options, metrics)
+    cox, cox_test = get_cox(covariates, survival_days, exit_status, options, metrics) if covariates is not None else (None, None)
+    return AnalysisResult(grouped, curves, censored, logrank, pairwise, report, state, get_bands(grouped, options, metrics), summary, cox, cox_test, grid)
+
+def get_endpoint_data(data : pd.DataFrame, endpoint : str) -> pd.DataFrame:
+    """Get the input of one endpoint, the shared columns and the prefixed columns of the endpoint under the names without prefix.
+    The columns are not copied, parsed dates and the categorical dataset_ids are shared by all endpoints.
+
+    :param data: the input with the prefixed columns of the endpoints
+    :type data: pd.DataFrame
+    :param endpoint: the endpoint
+    :type endpoint: str
+    :raises ValueError: if the input has no status column of the endpoint
+    :return: the input of the endpoint with the columns of input.tsv
+    :rtype: pd.DataFrame
+    """
+    if f"{endpoint}_status" not in data.columns:
+        raise ValueError(f"the input has no column {endpoint}_status of the endpoint {endpoint!r}")
+    columns = {c: data[c] for c in data.columns if c not in ENDPOINT_COLUMNS}
+    columns.update({c: data[f"{endpoint}_{c}"] for c in ENDPOINT_COLUMNS if f"{endpoint}_{c}" in data.columns})
+    return pd.DataFrame(columns, copy=False)
+
+def analyze_endpoints(data : Union[pd.DataFrame, dict], options : dict, metrics : Metrics = None) -> dict:
+    """Analyze every endpoint of the option "endpoints" in one pass over the input, see analyze.
+    The input is converted once, the endpoints share the parsed enrolment dates and the dataset_ids.
+
+    :param data: a data frame or a dictionary of arrays with the shared columns of input.tsv and the prefixed columns of every endpoint, it is not modified
+    :type data: Union[pd.DataFrame, dict]
+    :param options: the analysis options, missing options take their default
+    :type options: dict
+    :param metrics: the metrics recording the stages, nothing is recorded if not given
+    :type metrics: Metrics
+    :return: the results of every endpoint in the order of the option
+    :rtype: dict
+    """
+    options = check_options(dict(DEFAULT_OPTIONS, **(options or {})))
+    data = set_input_types(pd.DataFrame({c: data[c] for c in get_used_columns(options) if c in data}, copy=False), options["endpoints"])
+    return {endpoint: analyze(get_endpoint_data(data, endpoint), options, metrics) for endpoint in options["endpoints"]}
+
+def update_analysis(state : CohortState, delta : Union[pd.DataFrame, dict], removed : pd.Series, options : dict = None, metrics : Metrics = None) -> AnalysisResult:
+    """Update an analysis with added, updated and removed donors. Only the changes of these donors are merged into the sufficient statistics,
+    the results are the ones of a full analysis of the updated donors (updated donors in place, added donors appended).
+    The survival functions are always estimated with the numpy backend.
+
+    :param state: the sufficient statistics of the analysis, see AnalysisResult.state
+    :type state: CohortState
+    :param delta: the added or updated donors with the columns of input.tsv, donor_id is required
+    :type delta: Union[pd.DataFrame, dict]
+    :param removed: the donor_ids of the removed donors
+    :type removed: pd.Series
+    :param options: the analysis options, missing options take their default
+    :type options: dict
+    :param metrics: the metrics recording the stages, nothing is recorded if not given
+    :type metrics: Metrics
+    :return: the results, validation reports the rows of the delta
+    :rtype: AnalysisResult
+    """
+    options = check_options(dict(DEFAULT_OPTIONS, **(options or {})))
+    if metrics is None:
+        metrics = Metrics(False)
+    delta = set_input_types(pd.DataFrame({c: delta[c] for c in INPUT_COLUMNS if c in delta}, copy=False))
+    
+    with metrics.stage("survival_days"):
+        survival_days, valid, report = derive_survival_days(delta)
+    with metrics.stage("state"):
+        state = update_state(state, get_dataset_ids(delta), delta["donor_id"], survival_days, get_exit_status(delta), removed)
+        table = get_risk_table(state)
+    metrics.count(delta_rows=len(delta), removed_rows=len(removed), groups=len(table.labels), distinct_times=len(table.time))
+    
+    with metrics.stage("kaplan_meier"):
+        curves = kaplan_meier(table)
+    summary = summarize_curves(curves, table, options, metrics)
+    grid = get_grid(curves, options, metrics)
+    with metrics.stage("kaplan_meier"):
+        curves = thin_curves(curves, options["thinning"])
+    metrics.count(curve_points=len(curves.time))
+    with metrics.stage("censored"):
+        censored = get_censored_donors(state)
+    
+    # resampling needs the donors of every group
+    grouped = None
+    if options["bootstrap_replicates"] or options["permutation_replicates"]:
+        with metrics.stage("grouping"):
+            grouped = get_grouped_survival(state)
+    logrank, pairwise = compare_groups(grouped, table, options, metrics)
+    return AnalysisResult(grouped, curves, censored, logrank, pairwise, report, state, get_bands(grouped, options, metrics), summary, grid=grid)
+
+def write_analysis(result : AnalysisResult, root_path : str, options : dict, metrics : Metrics):
+    """Write the results of an analysis to the process directory
+
+    :param result: the results of analyze
+    :type result: AnalysisResult
+    :param root_path: the process directory
+    :type root_path: str
+    :param options: the analysis options
+    :type options: dict
+    :param metrics: the metrics recording the stages
+    :type metrics: Metrics
+    """
+    if len(result.validation):
+        with metrics.stage("write"):
+            result.validation.to_csv(os.path.join(root_path,"validation.tsv"), sep="\t", index=False)
+    with metrics.stage("write"):
+        write_survival_functions(result.curves.to_frame(), root_path, options["output_format"], options["float32"])
+    if result.censored is not None:
+        with metrics.stage("write"):
+            result.censored.to_csv(os.path.join(root_path,"censored.tsv"), sep="\t", index=False)
+    if result.logrank is not None:
+        with metrics.stage("write"):
+            result.logrank.to_csv(os.path.join(root_path,"logrank_test.tsv"), sep="\t", index=False)
+    if result.logrank_pairwise is not None:
+        with metrics.stage("write"):
+            result.logrank_pairwise.to_csv(os.path.join(root_path,"logrank_pairwise.tsv"), sep="\t", index=False)
+    if result.summary is not None:
+        with metrics.stage("write"):
+            result.summary.to_csv(os.path.join(root_path,"summary.tsv"), sep="\t", index=False)
+    if result.cox is not None:
+        with metrics.stage("write"):
+            result.cox.to_csv(os.path.join(root_path,"cox.tsv"), sep="\t", index=False)
+            result.cox_test.to_csv(os.path.join(root_path,"cox_test.tsv"), sep="\t", index=False)
+    if result.grid is not None:
+        with metrics.stage("write"):
+            write_curve_grid(result.grid, os.path.join(root_path, "grid.npz"), options["float32"])
+    if result.bands is not None:
+        with metrics.stage("write"):
+            result.bands.to_csv(os.path.join(root_path,"bands.tsv"), sep="\t", index=False)
+    if result.state is not None:
+        with metrics.stage("write"):
+            save_state(result.state, os.path.join(root_path, "state.npz"))
+
+def get_output_files(options : dict) -> list:
+    """Get the paths of the files an analysis may write, relative to the process directory
+
+    :param options: the analysis options
+    :type options: dict
+    :return: the paths, in the subdirectory of every endpoint if the option "endpoints" is set
+    :rtype: list
+    """
+    if not options["endpoints"]:
+        return OUTPUT_FILES
+    return [os.path.join(endpoint, file) for endpoint in options["endpoints"] for file in OUTPUT_FILES]
+
+def run_analysis(root_path : str, options : dict, metrics : Metrics):
+    """Read the input of the process directory, analyze it and write the results to the process directory.
+    With the option "memory_budget" the input is analysed in chunks, see run_streaming. The stages are recorded in metrics.
+    
+    :param root_path: the process directory containing input.tsv
+    :type root_path: str
+    :param options: the analysis options
+    :type options: dict
+    :param metrics: the metrics recording the stages
+    :type metrics: Metrics
+    """
+    # apply the added, updated and removed donors to the state of the previous run
+    if options["incremental"] and os.path.exists(os.path.join(root_path, "state.npz")) and (
+            os.path.exists(os.path.join(root_path, "delta.tsv")) or os.path.exists(os.path.join(root_path, "removed.tsv"))):
+        run_update(root_path, options, metrics)
+        return
+    
+    # results of a previous run are stale and may be links into the cache, never write through them
+    data_path = get_input_path(root_path)
+    output_files = get_output_files(options)
+    for file in output_files:
+        if os.path.exists(os.path.join(root_path, file)):
+            os.remove(os.path.join(root_path, file))
+    
+    # reuse the results of an identical analysis, the key hashes the input file before it is parsed
+    cache = get_cache()
+    if cache is not None:
+        with metrics.stage("cache"):
+            key = get_key(data_path, {k: v for k, v in options.items() if k not in ("metrics", "profile")})
+            hit = cache.restore(key, root_path)
+        metrics.count(cache_hit=hit)
+        if hit:
+            return
     
-def main(root_path : str):
+    if options["memory_budget"]:
+        run_streaming(root_path, options, metrics)
+    else:
+        with metrics.stage("load"):
+            data = load_data(data_path, options["csv_engine"], get_used_columns(options), options["endpoints"])
+        metrics.count(rows=len(data))
+        if options["endpoints"]:
+            for endpoint, result in analyze_endpoints(data, options, metrics).items():
+                os.makedirs(os.path.join(root_path, endpoint), exist_ok=True)
+                write_analysis(result, os.path.join(root_path, endpoint), options, metrics)
+        else:
+            write_analysis(analyze(data, options, metrics), root_path, options, metrics)
+    
+    if cache is not None:
+        with metrics.stage("cache"):
+            cache.store(key, root_path, output_files)
+
+def run_streaming(root_path : str, options : dict, metrics : Metrics):
+    """Analyze the input of the process directory in chunks and write the results to the process directory.
+    Every chunk is reduced to the events and censorings at every distinct time of every group and the chunks are merged into one risk table
+    whenever they have as many entries as the table, the Kaplan-Meier estimates, the logrank tests and the summary only need this table.
+    The censored patients of every chunk are written to a run file sorted by group and the runs are merged into censored.tsv.
+    The results are the ones of run_analysis.
+
+    A chunk takes half of the memory budget, the merges of the table the other half. After the last chunk the table stays in memory
+    and every later step is estimated beforehand to fit into the rest of the budget, the logrank tests sum over blocks of event times.
+
+    :param root_path: the process directory containing the input file
+    :type root_path: str
+    :param options: the analysis options, the option "memory_budget" is set
+    :type options: dict
+    :param metrics: the metrics recording the stages
+    :type metrics: Metrics
+    :raises MemoryError: if merging the table or a later step would exceed the memory budget
+    """
+    data_path = get_input_path(root_path)
+    columns = get_input_columns(data_path)
+    budget = options["memory_budget"] * 1024 ** 2
+    with metrics.stage("load"):
+        sample = next(read_chunks(data_path, SAMPLE_ROWS, columns, INPUT_DTYPES), pd.DataFrame(columns=columns))
+        chunk_rows = get_chunk_rows(sample, budget)
+    del sample
+    
+    labels = np.zeros(0, dtype=object)
+    table = build_risk_table(np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0, dtype=bool), np.zeros(0, dtype=np.int64), labels)
+    chunk_tables, reports, runs, start, excluded = [], [], [], 0, 0
+    with tempfile.TemporaryDirectory(dir=root_path) as run_path:
+        chunks = read_chunks(data_path, chunk_rows, columns, INPUT_DTYPES)
+        while True:
+            with metrics.stage("load"):
+                data = next(chunks, None)
+                if data is None:
+                    break
+                data = set_input_types(data)
+            with metrics.stage("survival_days"):
+                survival_days, valid, report = derive_survival_days(data)
+                report["row"] += start
+                reports.append(report)
+                exit_status = get_exit_status(data).to_numpy()[valid]
+                donor_id = data["donor_id"].to_numpy()[valid] if "donor_id" in data.columns else (start + np.flatnonzero(valid)).astype(str).astype(object)
+                survival_days = survival_days[valid]
+            excluded += len(valid) - valid.sum()
+            with metrics.stage("grouping"):
+                codes, labels = get_chunk_codes(get_dataset_ids(data)[valid], labels)
+                chunk_tables.append(reduce_chunk(codes, survival_days, exit_status, labels))
+                # merging as soon as the chunks are as large as the table rebuilds the table a logarithmic number of times while it grows,
+                # merging before the next chunk would not fit keeps the merges within the budget
+                entries = sum(len(chunk.time) for chunk in chunk_tables)
+                if entries >= len(table.time) or (len(table.time) + entries + len(chunk_tables[-1].time)) * MERGE_SIZE > budget / 2:
+                    check_memory("merging the chunks", (len(table.time) + entries) * MERGE_SIZE, budget / 2)
+                    table, chunk_tables = merge_chunks(table, chunk_tables, labels), []
+            with metrics.stage("censored"):
+                censored = ~exit_status
+                runs.append(os.path.join(run_path, f"{len(runs)}.tsv"))
+                write_censored_run(runs[-1], pd.DataFrame({
+                    "donor_id": donor_id[censored],
+                    "days_at_censoring": survival_days[censored],
+                    "dataset_id": labels[codes[censored]],
+                }), codes[censored])
+            metrics.count(rows=start + len(data), chunks=len(runs), chunk_rows=chunk_rows)
+            start += len(data)
+            del data
+        with metrics.stage("censored"):
+            merge_censored_runs(runs, os.path.join(root_path, "censored.tsv"), ["donor_id", "days_at_censoring", "dataset_id"])
+    if chunk_tables:
+        with metrics.stage("grouping"):
+            check_memory("merging the chunks", (len(table.time) + sum(len(chunk.time) for chunk in chunk_tables)) * MERGE_SIZE, budget / 2)
+            table, chunk_tables = merge_chunks(table, chunk_tables, labels), []
+    
+    # the issues of all chunks in the order of a single pass, every chunk lists its rows by issue
+    report = pd.concat(reports, ignore_index=True) if reports else pd.DataFrame(columns=["row", "donor_id", "issue", "excluded"])
+    report = report.iloc[np.argsort(pd.Categorical(report["issue"], categories=VALIDATION_ISSUES).codes, kind="stable")].reset_index(drop=True)
+    metrics.count(excluded_rows=int(excluded), groups=len(table.labels), distinct_times=len(table.time))
+    
+    # the table stays in memory, the later steps share the rest of the budget
+    n_grid = 0 if options["time_grid"] is None else options["time_grid"] if isinstance(options["time_grid"], int) else len(options["time_grid"])
+    max_cells = check_analysis_memory(table, n_grid, len(table.labels) > 2 and options["logrank_pairwise"], budget - get_table_size(table))
+    with metrics.stage("kaplan_meier"):
+        curves = kaplan_meier(table)
+    summary = summarize_curves(curves, table, options, metrics)
+    grid = get_grid(curves, options, metrics)
+    with metrics.stage("kaplan_meier"):
+        curves = thin_curves(curves, options["thinning"])
+    metrics.count(curve_points=len(curves.time))
+    logrank, pairwise = compare_groups(None, table, options, metrics, max_cells)
+    write_analysis(AnalysisResult(None, curves, None, logrank, pairwise, report, summary=summary, grid=grid), root_path, options, metrics)
+
+def run_update(root_path : str, options : dict, metrics : Metrics):
+    """Update the results of the process directory with the donors in delta.tsv and removed.tsv.
+    delta.tsv has the columns of input.tsv and holds the added or updated donors, removed.tsv has a donor_id column with the removed donors.
+    Applying the same update twice gives the same results.
+
+    :param root_path: the process directory containing state.npz
+    :type root_path: str
+    :param options: the analysis options
+    :type options: dict
+    :param metrics: the metrics recording the stages
+    :type metrics: Metrics
+    """
+    with metrics.stage("load"):
+        state = load_state(os.path.join(root_path, "state.npz"))
+        delta_path = os.path.join(root_path, "delta.tsv")
+        delta = load_data(delta_path, options["csv_engine"]) if os.path.exists(delta_path) else pd.DataFrame({"donor_id": [], "status": []})
+        removed_path = os.path.join(root_path, "removed.tsv")
+        removed = pd.read_csv(removed_path, sep="\t", usecols=["donor_id"], dtype=str)["donor_id"] if os.path.exists(removed_path) else pd.Series([], dtype=str)
+    
+    # the results of the previous run may be links into the cache, never write through them
+    for file in OUTPUT_FILES:
+        if os.path.exists(os.path.join(root_path, file)):
+            os.remove(os.path.join(root_path, file))
+    
+    result = update_analysis(state, delta, removed, options, metrics)
+    write_analysis(result, root_path, options, metrics)
+
+def main(root_path : str, options : dict = None):
     """Main function to estimate the survival functions from the input data and write the result to a file result.tsv. Also writes censored.tsv which contains the survival days of all right censored patients.
     Does this separately for each group dataset_id in the input data (in the "dataset_id") column.
+    The data is sorted once by (group, time) and all groups are estimated from the shared arrays.
+    With the option "metrics" or UNITE_METRICS=1 the stages are recorded to metrics.json, with "profile" or UNITE_PROFILE=1 the run is profiled to profile.prof.
     
-    :param type: the type of survival days to get. This can be either "progress" for progression free survival or "vital" for overall survival
+    :param root_path: the process directory containing input.tsv
     :type root_path: str
+    :param options: the analysis options, missing options take their default, read from options.json in the process directory if not given
+    :type options: dict
+    :raises ValueError: if an option has an invalid value
     """
-    # load the data
-    data = load_data(os.path.join(root_path,"input.tsv"))
+    options = load_options(root_path) if options is None else check_options(dict(DEFAULT_OPTIONS, **options))
     
-    # get the dataset_ids of the groups
-    dataset_id = get_dataset_ids(data)
-    # get the data subsetted by dataset_id
-    subsets,unique_dataset_ids = get_subsets(data,dataset_id)
-    
-    # get the survival days and exit status (event binary indicator) for each group
-    survival_days = [get_survival_days(subset) for subset in subsets]
-    exit_status = [get_exit_status(subset) for subset in subsets]
-    
-    # get the survival function and censored data data frame for each group
-    survival_functions, censored_dfs = zip(*[get_survival_function_and_censored_dfs(s,e,d.donor_id) for s,e,d in zip(survival_days,exit_status,subsets)])    
-    
-    # write the survival functions to a file
-    survival_functions_df = concatenate_dfs_add_dataset_id(survival_functions,unique_dataset_ids)
-    survival_functions_df.to_csv(os.path.join(root_path,"result.tsv"), sep="\t", index=False)
-    
-    # write the censored data to a file
-    censored_df = concatenate_dfs_add_dataset_id(censored_dfs,unique_dataset_ids)
-    censored_df.to_csv(os.path.join(root_path,"censored.tsv"), sep="\t", index=False)
-       
-    # perform the logrank test if there is more than one group
-    if len(unique_dataset_ids) > 1:
-        logrank = logrank_test(pd.concat(survival_days),pd.concat(exit_status),dataset_id)
-        logrank.to_csv(os.path.join(root_path,"logrank_test.tsv"), sep="\t", index=False)
+    metrics = Metrics(options["metrics"] or is_enabled("UNITE_METRICS"))
+    profiler = cProfile.Profile() if options["profile"] or is_enabled("UNITE_PROFILE") else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        run_analysis(root_path, options, metrics)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(root_path, "profile.prof"))
+        metrics.write(os.path.join(root_path, "metrics.json"))
     
 
 if __name__ == "__main__":
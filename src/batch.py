@@ -0,0 +1,110 @@
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+# the pool forks from this process, every worker process starts with the analysis imported
+from worker import run_job, get_process_limit
+from app import get_input_path
+
+def get_process_paths(patterns : list) -> list:
+    """Expand the given process directories and glob patterns to the process directories containing an input file (see app.get_input_path)
+
+    :param patterns: process directories or glob patterns
+    :type patterns: list
+    :return: the sorted unique process directories
+    :rtype: list
+    """
+    paths = set()
+    for pattern in patterns:
+        for path in glob.glob(pattern):
+            if os.path.isfile(get_input_path(path)):
+                paths.add(os.path.abspath(path))
+    return sorted(paths)
+
+def run_and_record(root_path : str) -> dict:
+    """Run the analysis for one process directory and write the outcome to status.json in the process directory
+
+    :param root_path: the process directory containing input.tsv
+    :type root_path: str
+    :return: the status, a dictionary with the keys "status", "duration" and "error" if the job failed
+    :rtype: dict
+    """
+    start = time.perf_counter()
+    status = run_job(root_path)
+    status["duration"] = time.perf_counter() - start
+    write_status(root_path, status)
+    return status
+
+def write_status(root_path : str, status : dict):
+    """Write the status of a job to status.json in the process directory
+
+    :param root_path: the process directory
+    :type root_path: str
+    :param status: the status of the job
+    :type status: dict
+    """
+    with open(os.path.join(root_path, "status.json"), "w") as f:
+        json.dump(status, f)
+
+def collect(futures : dict, statuses : dict) -> list:
+    """Collect the statuses of finished jobs
+
+    :param futures: the process directory of every submitted job
+    :type futures: dict
+    :param statuses: the status of every process directory, updated with the finished jobs
+    :type statuses: dict
+    :return: the process directories of the jobs lost to a process that terminated abruptly
+    :rtype: list
+    """
+    lost = []
+    for future in as_completed(futures):
+        try:
+            statuses[futures[future]] = future.result()
+        except BrokenProcessPool:
+            lost.append(futures[future])
+    return lost
+
+def main(paths : list, limit : int) -> dict:
+    """Run the analysis for many process directories on a pool of at most limit processes.
+    A failing job is recorded in its status.json and does not stop the other jobs. A process that dies (e.g. killed out of memory)
+    breaks the pool and every job running on it, these jobs are run again each in its own process, so only the job killing its process fails.
+
+    :param paths: the process directories
+    :type paths: list
+    :param limit: the number of processes
+    :type limit: int
+    :return: the status of every process directory
+    :rtype: dict
+    """
+    statuses = {}
+    with ProcessPoolExecutor(max_workers=limit) as executor:
+        lost = collect({executor.submit(run_and_record, path): path for path in paths}, statuses)
+    for start in range(0, len(lost), limit):
+        executors = {path: ProcessPoolExecutor(max_workers=1) for path in lost[start:start + limit]}
+        try:
+            for path in collect({executor.submit(run_and_record, path): path for path, executor in executors.items()}, statuses):
+                # the process died before the job could record its status
+                statuses[path] = {"status": "error", "error": "analysis process terminated abruptly"}
+                write_status(path, statuses[path])
+        finally:
+            for executor in executors.values():
+                executor.shutdown()
+    return statuses
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the survival analysis for many process directories")
+    parser.add_argument("paths", nargs="+", help="process directories or glob patterns")
+    parser.add_argument("--limit", type=int, default=get_process_limit(), help="number of processes")
+    args = parser.parse_args()
+    statuses = main(get_process_paths(args.paths), args.limit)
+    failed = sorted(path for path, status in statuses.items() if status["status"] != "ok")
+    print(f"{len(statuses) - len(failed)} succeeded, {len(failed)} failed")
+    for path in failed:
+        print(f"failed: {path}", file=sys.stderr)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import tempfile
+from contextlib import contextmanager
+
+# the version of the results, bump it with every change of the result values or file formats so that older entries are not served
+CACHE_VERSION = 1
+
+def get_key(data_path : str, options : dict, version : int = CACHE_VERSION) -> str:
+    """Get the cache key of an analysis, the hash of the result version, the analysis options and the bytes of the input file.
+    The file is hashed as it is, before it is parsed, so a hit skips reading the input.
+
+    :param data_path: the path of the input file
+    :type data_path: str
+    :param options: the analysis options
+    :type options: dict
+    :param version: the version of the results
+    :type version: int
+    :return: the hex digest of the key
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+    digest.update(f"version {version}\n".encode())
+    digest.update(json.dumps(options, sort_keys=True).encode())
+    # the format of the input is part of its name
+    digest.update(os.path.basename(data_path).encode())
+    with open(data_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def list_files(path : str) -> list:
+    """List the files below a directory
+
+    :param path: the directory
+    :type path: str
+    :return: the paths of the files relative to the directory
+    :rtype: list
+    """
+    return [os.path.relpath(os.path.join(directory, file), path) for directory, _, files in os.walk(path) for file in files]
+
+class ResultCache:
+    """Result files of previous analyses stored under cache_path/{key}, evicted by age and total size"""
+
+    def __init__(self, cache_path : str, max_size : int, max_age : float):
+        """
+        :param cache_path: the cache directory
+        :type cache_path: str
+        :param max_size: the maximum total size of the cached files in bytes
+        :type max_size: int
+        :param max_age: the maximum time in seconds since an entry was last used
+        :type max_age: float
+        """
+        self.cache_path = cache_path
+        self.max_size = max_size
+        self.max_age = max_age
+        os.makedirs(cache_path, exist_ok=True)
+
+    @contextmanager
+    def _lock(self):
+        with open(os.path.join(self.cache_path, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _count(self, counter : str, n : int = 1):
+        with self._lock():
+            stats = self.stats()
+            stats[counter] += n
+            with open(os.path.join(self.cache_path, "stats.json"), "w") as f:
+                json.dump(stats, f)
+
+    def stats(self) -> dict:
+        """Get the hit, miss and eviction counters
+
+        :return: a dictionary with the keys "hits", "misses" and "evictions"
+        :rtype: dict
+        """
+        stats = {"hits": 0, "misses": 0, "evictions": 0}
+        stats_path = os.path.join(self.cache_path, "stats.json")
+        if os.path.exists(stats_path):
+            with open(stats_path) as f:
+                stats.update(json.load(f))
+        return stats
+
+    def restore(self, key : str, root_path : str) -> bool:
+        """Link (or copy if linking is not possible) the cached result files of the key into the process directory
+
+        :param key: the cache key
+        :type key: str
+        :param root_path: the process directory
+        :type root_path: str
+        :return: True on a cache hit, False otherwise
+        :rtype: bool
+        """
+        entry_path = os.path.join(self.cache_path, key)
+        try:
+            if not os.path.isdir(entry_path):
+                raise FileNotFoundError(entry_path)
+            for file in list_files(entry_path):
+                target = os.path.join(root_path, file)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                if os.path.exists(target):
+                    os.remove(target)
+                try:
+                    os.link(os.path.join(entry_path, file), target)
+                except OSError:
+                    shutil.copyfile(os.path.join(entry_path, file), target)
+            # mark the entry as recently used
+            os.utime(entry_path)
+        except FileNotFoundError:
+            # not cached or evicted meanwhile
+            self._count("misses")
+            return False
+        self._count("hits")
+        return True
+
+    def store(self, key : str, root_path : str, files : list):
+        """Copy the result files of the process directory into the cache and evict old entries
+
+        :param key: the cache key
+        :type key: str
+        :param root_path: the process directory
+        :type root_path: str
+        :param files: the names of the result files relative to the process directory, files which were not written are skipped
+        :type files: list
+        """
+        entry_path = os.path.join(self.cache_path, key)
+        temp_path = tempfile.mkdtemp(dir=self.cache_path, prefix=".")
+        for file in files:
+            if os.path.exists(os.path.join(root_path, file)):
+                os.makedirs(os.path.dirname(os.path.join(temp_path, file)), exist_ok=True)
+                shutil.copyfile(os.path.join(root_path, file), os.path.join(temp_path, file))
+        try:
+            # publish the complete entry at once
+            os.rename(temp_path, entry_path)
+        except OSError:
+            # stored by a concurrent job
+            shutil.rmtree(temp_path)
+        self.evict()
+
+    def evict(self):
+        """Remove the entries not used for longer than max_age, then the least recently used ones until the cache fits into max_size"""
+        entries = []
+        now = time.time()
+        for key in os.listdir(self.cache_path):
+            entry_path = os.path.join(self.cache_path, key)
+            if key.startswith(".") or not os.path.isdir(entry_path):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(entry_path, file)) for file in list_files(entry_path))
+                entries.append((os.path.getmtime(entry_path), size, entry_path))
+            except FileNotFoundError:
+                continue
+        entries.sort()
+        total_size = sum(size for _, size, _ in entries)
+        evicted = 0
+        for used, size, entry_path in entries:
+            if now - used <= self.max_age and total_size <= self.max_size:
+                break
+            shutil.rmtree(entry_path, ignore_errors=True)
+            total_size -= size
+            evicted += 1
+        if evicted:
+            self._count("evictions", evicted)
+
+def get_cache() -> ResultCache:
+    """Get the result cache configured by UNITE_CACHE_PATH, UNITE_CACHE_SIZE (megabytes, default 1024) and UNITE_CACHE_AGE (hours, default 168)
+
+    :return: the cache or None if UNITE_CACHE_PATH is not set
+    :rtype: ResultCache
+    """
+    cache_path = os.environ.get("UNITE_CACHE_PATH")
+    if not cache_path:
+        return None
+    max_size = int(float(os.environ.get("UNITE_CACHE_SIZE", 1024)) * 1024 * 1024)
+    max_age = float(os.environ.get("UNITE_CACHE_AGE", 168)) * 3600
+    return ResultCache(cache_path, max_size, max_age)
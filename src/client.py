@@ -0,0 +1,55 @@
+import os
+import sys
+import json
+import socket
+
+DEFAULT_SOCKET_PATH = "/tmp/unite-analysis-surv.sock"
+
+def get_socket_path() -> str:
+    """Get the path of the unix socket the worker listens on
+
+    :return: the value of UNITE_WORKER_SOCKET or the default socket path
+    :rtype: str
+    """
+    return os.environ.get("UNITE_WORKER_SOCKET", DEFAULT_SOCKET_PATH)
+
+def submit(root_path : str, socket_path : str = None) -> dict:
+    """Submit a process directory to the running worker and wait for the job to finish
+
+    :param root_path: the process directory containing input.tsv
+    :type root_path: str
+    :param socket_path: the unix socket of the worker, defaults to get_socket_path()
+    :type socket_path: str
+    :return: the response of the worker with the key "status" ("ok" or "error") and "error" if the job failed
+    :rtype: dict
+    """
+    socket_path = socket_path or get_socket_path()
+    request = json.dumps({"path": os.path.abspath(root_path)}) + "\n"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path)
+        connection.sendall(request.encode())
+        with connection.makefile("r") as response:
+            return json.loads(response.readline())
+
+def main(root_path : str):
+    """Run the analysis for a process directory, preferably in the warm worker.
+    Falls back to running the analysis in this interpreter if no worker is listening.
+
+    :param root_path: the process directory containing input.tsv
+    :type root_path: str
+    """
+    try:
+        response = submit(root_path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        # no worker running, pay the import cost here
+        import app
+        app.main(root_path)
+        return
+    if response["status"] != "ok":
+        sys.stderr.write(response.get("error", "analysis failed\n"))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    root_path = sys.argv[1]
+    main(root_path)
@@ -0,0 +1,226 @@
+import numpy as np
+import pandas as pd
+from typing import NamedTuple, Tuple
+from scipy.special import chdtrc, ndtr, ndtri
+
+# the handling of tied event times
+COX_TIES = ["efron", "breslow"]
+
+class CoxModel(NamedTuple):
+    """A fitted Cox proportional hazards model.
+    information is the observed information (negative Hessian of the log partial likelihood) at the estimate,
+    score_chi2 the score test of all coefficients being 0.
+    """
+    names: list
+    coef: np.ndarray
+    information: np.ndarray
+    loglik: float
+    loglik_null: float
+    score_chi2: float
+    n: int
+    events: int
+    iterations: int
+
+def get_design_matrix(covariates : pd.DataFrame) -> Tuple[np.ndarray, list, np.ndarray]:
+    """Encode the covariates as a design matrix. Numeric and bool columns are used as they are,
+    other columns get an indicator of every value but the first appearing one (the reference).
+
+    :param covariates: the covariates of every row
+    :type covariates: pd.DataFrame
+    :return: a tuple with the design matrix of the complete rows, the name of every column of it and the mask of the complete rows
+    :rtype: Tuple[np.ndarray, list, np.ndarray]
+    """
+    columns, names = [], []
+    complete = np.ones(len(covariates), dtype=bool)
+    for column in covariates.columns:
+        values = covariates[column]
+        if pd.api.types.is_bool_dtype(values) or (pd.api.types.is_numeric_dtype(values) and not isinstance(values.dtype, pd.CategoricalDtype)):
+            values = values.to_numpy(dtype=float, na_value=np.nan)
+            complete &= ~np.isnan(values)
+            columns.append(values)
+            names.append(column)
+        else:
+            codes, levels = pd.factorize(values)
+            complete &= codes >= 0
+            for code in range(1, len(levels)):
+                columns.append((codes == code).astype(float))
+                names.append(f"{column}={levels[code]}")
+    matrix = np.column_stack(columns) if columns else np.zeros((len(covariates), 0))
+    return matrix[complete], names, complete
+
+def get_partial_likelihood(x : np.ndarray, time_index : np.ndarray, starts : np.ndarray, event_rows : np.ndarray,
+        event_starts : np.ndarray, event_fraction : np.ndarray, event_sum : np.ndarray, beta : np.ndarray) -> Tuple[float, np.ndarray, np.ndarray]:
+    """Get the log partial likelihood, its gradient and the observed information of the rows sorted by time.
+    The sums over the risk sets are reverse cumulative sums over the distinct times, the sums over the events of the risk set sums
+    of x x^T are swapped into one weighted product x diag(v) x^T. Ties are handled by the Efron approximation,
+    the l-th of the d events at a time removes l/d of the tied events from the risk set (0 for all events with Breslow),
+    the sums over the tied events reduce to sums of scalars per event.
+
+    :param x: the centered design matrix with the rows sorted by time, transposed (covariates x rows) for the segmented sums
+    :type x: np.ndarray
+    :param time_index: the distinct time of every row
+    :type time_index: np.ndarray
+    :param starts: the first row of every distinct time
+    :type starts: np.ndarray
+    :param event_rows: the rows of the events
+    :type event_rows: np.ndarray
+    :param event_starts: the first of the event_rows of every distinct time with events
+    :type event_starts: np.ndarray
+    :param event_fraction: the fraction l/d of the tied events removed from the risk set of every event
+    :type event_fraction: np.ndarray
+    :param event_sum: the sum of the covariates of all events
+    :type event_sum: np.ndarray
+    :param beta: the coefficients
+    :type beta: np.ndarray
+    :return: a tuple with the log partial likelihood, the gradient and the information
+    :rtype: Tuple[float, np.ndarray, np.ndarray]
+    """
+    eta = beta @ x
+    shift = eta.max() if len(eta) else 0.0
+    w = np.exp(eta - shift)
+    wx = x * w
+    # the risk set sums of every distinct time with events
+    k = time_index[event_rows[event_starts]]
+    s0 = np.cumsum(np.add.reduceat(w, starts)[::-1])[::-1][k]
+    s1 = np.cumsum(np.add.reduceat(wx, starts, axis=1)[:, ::-1], axis=1)[:, ::-1][:, k]
+    d = np.diff(np.append(event_starts, len(event_rows)))
+    group = np.repeat(np.arange(len(d)), d)
+    efron = event_fraction.any()
+    # the sums over the tied events
+    e0 = np.add.reduceat(w[event_rows], event_starts) if efron else np.zeros(len(d))
+    e1 = np.add.reduceat(wx[:, event_rows], event_starts, axis=1) if efron else np.zeros_like(s1)
+
+    phi = s0[group] - event_fraction * e0[group]
+    # the mean covariates of the risk sets are (s1 - a e1) / phi, their sums over the events of a time need the sums of these scalars
+    def sums(values : np.ndarray) -> np.ndarray:
+        return np.add.reduceat(values, event_starts)
+    r1, ra = sums(1 / phi), sums(event_fraction / phi)
+    r2, ra2, raa2 = sums(phi ** -2), sums(event_fraction * phi ** -2), sums(event_fraction ** 2 * phi ** -2)
+    loglik = beta @ event_sum - (np.log(phi) + shift).sum()
+    gradient = event_sum - s1 @ r1 + e1 @ ra
+    cross = (s1 * ra2) @ e1.T
+    mean_products = (s1 * r2) @ s1.T - cross - cross.T + (e1 * raa2) @ e1.T
+    # every row is in the risk sets of the events up to its time, a tied event is partly removed from its own
+    inverse = np.zeros(len(starts))
+    inverse[k] = r1
+    v = w * np.cumsum(inverse)[time_index]
+    v[event_rows] -= w[event_rows] * ra[group]
+    information = (x * v) @ x.T - mean_products
+    return loglik, gradient, information
+
+def fit_cox(time : np.ndarray, event : np.ndarray, x : np.ndarray, names : list, ties : str = "efron", tol : float = 1e-9, max_iter : int = 50) -> CoxModel:
+    """Fit a Cox proportional hazards model by Newton-Raphson with step halving
+
+    :param time: the survival time of every row
+    :type time: np.ndarray
+    :param event: True if the row had an event, False if censored
+    :type event: np.ndarray
+    :param x: the design matrix (rows x covariates)
+    :type x: np.ndarray
+    :param names: the name of every covariate
+    :type names: list
+    :param ties: the handling of tied event times, "efron" or "breslow"
+    :type ties: str
+    :param tol: the convergence tolerance of the relative change of the log partial likelihood
+    :type tol: float
+    :param max_iter: the maximum number of iterations
+    :type max_iter: int
+    :raises ValueError: if the covariates are collinear or constant
+    :return: the fitted model
+    :rtype: CoxModel
+    """
+    order = np.argsort(time, kind="stable")
+    time, event = np.asarray(time, dtype=float)[order], np.asarray(event, dtype=bool)[order]
+    # centering changes only the baseline hazard
+    x = np.ascontiguousarray(np.asarray(x, dtype=float)[order].T)
+    x -= x.mean(axis=1, keepdims=True)
+    starts = np.flatnonzero(np.append(True, time[1:] != time[:-1]))
+    time_index = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(time))))
+    event_rows = np.flatnonzero(event)
+    k = time_index[event_rows]
+    event_starts = np.flatnonzero(np.append(True, k[1:] != k[:-1])) if len(k) else np.zeros(0, dtype=np.int64)
+    event_fraction = np.zeros(len(event_rows))
+    if ties == "efron":
+        # the rank l of every event among the d events of its time
+        d = np.diff(np.append(event_starts, len(k)))
+        event_fraction = (np.arange(len(k)) - np.repeat(event_starts, d)) / np.repeat(d, d)
+    event_sum = x[:, event_rows].sum(axis=1)
+
+    def likelihood(beta : np.ndarray) -> Tuple[float, np.ndarray, np.ndarray]:
+        return get_partial_likelihood(x, time_index, starts, event_rows, event_starts, event_fraction, event_sum, beta)
+
+    def solve(information : np.ndarray, gradient : np.ndarray) -> np.ndarray:
+        try:
+            return np.linalg.solve(information, gradient)
+        except np.linalg.LinAlgError:
+            raise ValueError(f"the Cox covariates {names} are collinear or constant") from None
+
+    beta = np.zeros(len(x))
+    loglik, gradient, information = likelihood(beta)
+    step = solve(information, gradient)
+    loglik_null, score_chi2 = loglik, float(gradient @ step)
+    iterations = 0
+    while iterations < max_iter:
+        iterations += 1
+        candidate = beta + step
+        new_loglik, new_gradient, new_information = likelihood(candidate)
+        # halve the step until the likelihood does not decrease
+        halvings = 0
+        while not new_loglik >= loglik - tol * abs(loglik) and halvings < 30:
+            step = step / 2
+            candidate = beta + step
+            new_loglik, new_gradient, new_information = likelihood(candidate)
+            halvings += 1
+        converged = abs(new_loglik - loglik) <= tol * (abs(loglik) + tol)
+        beta, loglik, gradient, information = candidate, new_loglik, new_gradient, new_information
+        if converged:
+            break
+        step = solve(information, gradient)
+    return CoxModel(names, beta, information, float(loglik), float(loglik_null), score_chi2, len(time), len(event_rows), iterations)
+
+def get_coefficients(model : CoxModel, conf_level : float = 0.95) -> pd.DataFrame:
+    """Get the hazard ratios of the covariates with their confidence intervals and Wald tests
+
+    :param model: the fitted model
+    :type model: CoxModel
+    :param conf_level: the level of the two-sided confidence intervals
+    :type conf_level: float
+    :return: a data frame with the columns 'covariate' 'coef' 'se' 'hazard_ratio' 'hr_lower' 'hr_upper' 'z' 'p', one row per covariate
+    :rtype: pd.DataFrame
+    """
+    se = np.sqrt(np.diag(np.linalg.inv(model.information)))
+    z = model.coef / se
+    quantile = ndtri(0.5 + conf_level / 2)
+    return pd.DataFrame({
+        "covariate": model.names,
+        "coef": model.coef,
+        "se": se,
+        "hazard_ratio": np.exp(model.coef),
+        "hr_lower": np.exp(model.coef - quantile * se),
+        "hr_upper": np.exp(model.coef + quantile * se),
+        "z": z,
+        "p": 2 * ndtr(-np.abs(z)),
+    })
+
+def get_global_tests(model : CoxModel) -> pd.DataFrame:
+    """Get the likelihood ratio, Wald and score tests of all coefficients being 0
+
+    :param model: the fitted model
+    :type model: CoxModel
+    :return: a data frame with the columns 'test' 'chi2' 'df' 'p' 'n' 'events', one row per test
+    :rtype: pd.DataFrame
+    """
+    chi2 = np.array([
+        2 * (model.loglik - model.loglik_null),
+        model.coef @ model.information @ model.coef,
+        model.score_chi2,
+    ])
+    df = len(model.names)
+    return pd.DataFrame({
+        "test": ["likelihood_ratio", "wald", "score"],
+        "chi2": chi2,
+        "df": df,
+        "p": chdtrc(df, chi2),
+        "n": model.n,
+        "events": model.events,
+    })
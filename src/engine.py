@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+from typing import NamedTuple, Tuple
+
+class RiskTable(NamedTuple):
+    """Event/at-risk table of all groups stored in shared arrays.
+    The rows of group g are offsets[g]:offsets[g+1], sorted by time.
+    """
+    labels: np.ndarray
+    time: np.ndarray
+    n_events: np.ndarray
+    n_censored: np.ndarray
+    n_at_risk: np.ndarray
+    offsets: np.ndarray
+
+class GroupedSurvival(NamedTuple):
+    """Survival data of all groups sorted once by (group, time).
+    The rows of group g are row_offsets[g]:row_offsets[g+1] of time and event.
+    """
+    labels: np.ndarray
+    codes: np.ndarray
+    order: np.ndarray
+    row_offsets: np.ndarray
+    time: np.ndarray
+    event: np.ndarray
+    table: RiskTable
+
+def factorize_groups(dataset_id : pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """Encode the dataset_ids as integer codes
+
+    :param dataset_id: the dataset_id of every row
+    :type dataset_id: pd.Series
+    :return: a tuple with the code of every row and the unique dataset_ids in order of first appearance (the order of dataset_id.unique())
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    """
+    # categorical dataset_ids are factorized from their codes
+    codes, labels = pd.factorize(dataset_id if isinstance(dataset_id, pd.Series) else np.asarray(dataset_id), use_na_sentinel=False)
+    return codes.astype(np.int64), np.asarray(labels)
+
+def get_offsets(sorted_codes : np.ndarray, n_groups : int) -> np.ndarray:
+    """Get the boundaries of the groups in an array sorted by group code
+
+    :param sorted_codes: the group codes, sorted ascending
+    :type sorted_codes: np.ndarray
+    :param n_groups: the number of groups
+    :type n_groups: int
+    :return: an array of length n_groups+1, group g spans offsets[g]:offsets[g+1]
+    :rtype: np.ndarray
+    """
+    return np.searchsorted(sorted_codes, np.arange(n_groups + 1), side="left")
+
+def build_risk_table(codes : np.ndarray, time : np.ndarray, events : np.ndarray, counts : np.ndarray, labels : np.ndarray) -> RiskTable:
+    """Build the event/at-risk table of all groups with segmented reductions.
+    The input has to be sorted by (code, time). Every entry stands for counts[i] subjects leaving at time[i], events[i] of them by an event.
+
+    :param codes: the group code of every entry
+    :type codes: np.ndarray
+    :param time: the time of every entry
+    :type time: np.ndarray
+    :param events: the number of events of every entry
+    :type events: np.ndarray
+    :param counts: the number of subjects of every entry
+    :type counts: np.ndarray
+    :param labels: the dataset_id of every group code
+    :type labels: np.ndarray
+    :return: the risk table
+    :rtype: RiskTable
+    """
+    n = len(time)
+    if n == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return RiskTable(labels, np.zeros(0, dtype=float), empty, empty, empty, np.zeros(len(labels) + 1, dtype=np.int64))
+    # a new table row starts wherever the group or the time changes
+    new = np.empty(n, dtype=bool)
+    new[0] = True
+    np.not_equal(codes[1:], codes[:-1], out=new[1:])
+    new[1:] |= time[1:] != time[:-1]
+    starts = np.flatnonzero(new)
+
+    table_codes = codes[starts]
+    n_events = np.add.reduceat(events.astype(np.int64), starts)
+    n_total = np.add.reduceat(counts.astype(np.int64), starts)
+    offsets = get_offsets(table_codes, len(labels))
+
+    # at risk = subjects leaving at or after this time within the group (suffix sum per group)
+    suffix = np.append(np.cumsum(n_total[::-1])[::-1], 0)
+    n_at_risk = suffix[:-1] - np.repeat(suffix[offsets[1:]], np.diff(offsets))
+    return RiskTable(labels, time[starts].astype(float), n_events, n_total - n_events, n_at_risk, offsets)
+
+def group_survival(dataset_id : pd.Series, survival_days : pd.Series, exit_status : pd.Series) -> GroupedSurvival:
+    """Sort the survival data once by (group, time) and compute the risk table of every group
+
+    :param dataset_id: the dataset_id of every patient
+    :type dataset_id: pd.Series
+    :param survival_days: the number of days survival or until censoring
+    :type survival_days: pd.Series
+    :param exit_status: True if the patient died, False if the patient is still alive
+    :type exit_status: pd.Series
+    :return: the grouped survival data
+    :rtype: GroupedSurvival
+    """
+    codes, labels = factorize_groups(dataset_id)
+    time = np.asarray(survival_days, dtype=float)
+    event = np.asarray(exit_status, dtype=bool)
+    order = np.lexsort((time, codes))
+    sorted_codes = codes[order]
+    time, event = time[order], event[order]
+    table = build_risk_table(sorted_codes, time, event, np.ones(len(time), dtype=np.int64), labels)
+    return GroupedSurvival(labels, codes, order, get_offsets(sorted_codes, len(labels)), time, event, table)
+
+def get_censored_rows(grouped : GroupedSurvival) -> np.ndarray:
+    """Get the positions of all censored patients in the input, grouped by dataset_id and in input order within a group
+
+    :param grouped: the grouped survival data
+    :type grouped: GroupedSurvival
+    :return: the row positions of the censored patients
+    :rtype: np.ndarray
+    """
+    rows = np.sort(grouped.order[~grouped.event])
+    return rows[np.argsort(grouped.codes[rows], kind="stable")]
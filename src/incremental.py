@@ -0,0 +1,262 @@
+import numpy as np
+import pandas as pd
+from typing import NamedTuple
+from engine import RiskTable, GroupedSurvival, factorize_groups, build_risk_table, group_survival
+
+class CohortState(NamedTuple):
+    """Sufficient statistics of an analysis, to update it with added, removed or updated donors without the full input.
+    table holds the events and censorings at every distinct time of every group (codes into labels, possibly empty groups),
+    the ledger the group code, survival days (NaN if excluded) and status of every donor in input order.
+    """
+    labels: np.ndarray
+    table: RiskTable
+    donor_id: np.ndarray
+    donor_codes: np.ndarray
+    survival_days: np.ndarray
+    status: np.ndarray
+
+def as_strings(values : pd.Series) -> np.ndarray:
+    """Get the values as an object array of strings, as donor_ids and dataset_ids are written"""
+    return pd.Series(values, copy=False).astype(str).to_numpy(dtype=object)
+
+def get_table_codes(table : RiskTable) -> np.ndarray:
+    """Get the group code of every row of a risk table"""
+    return np.repeat(np.arange(len(table.offsets) - 1), np.diff(table.offsets))
+
+def build_state(dataset_id : pd.Series, donor_id : pd.Series, survival_days : np.ndarray, exit_status : pd.Series) -> CohortState:
+    """Build the sufficient statistics of all donors, including the donors excluded for invalid survival days
+
+    :param dataset_id: the dataset_id of every donor
+    :type dataset_id: pd.Series
+    :param donor_id: the unique donor_id of every donor
+    :type donor_id: pd.Series
+    :param survival_days: the survival days of every donor, NaN if excluded
+    :type survival_days: np.ndarray
+    :param exit_status: True if the donor died, False if the donor is still alive
+    :type exit_status: pd.Series
+    :raises ValueError: if the donor_ids are not unique
+    :return: the state
+    :rtype: CohortState
+    """
+    donor_id = as_strings(donor_id)
+    if not pd.Index(donor_id).is_unique:
+        raise ValueError("incremental updates require unique donor_ids")
+    codes, labels = factorize_groups(dataset_id)
+    survival_days = np.asarray(survival_days, dtype=np.float32)
+    status = np.asarray(exit_status, dtype=bool)
+    valid = np.flatnonzero(~np.isnan(survival_days))
+    order = valid[np.lexsort((survival_days[valid], codes[valid]))]
+    table = build_risk_table(codes[order], survival_days[order].astype(float), status[order], np.ones(len(order), dtype=np.int64), labels)
+    return CohortState(labels.astype(str).astype(object), table, donor_id, codes, survival_days, status)
+
+def save_state(state : CohortState, path : str):
+    """Write the state to a npz file
+
+    :param state: the state
+    :type state: CohortState
+    :param path: the path of the npz file
+    :type path: str
+    """
+    with open(path, "wb") as f:
+        np.savez(
+            f,
+            labels=state.labels.astype(str),
+            table_time=state.table.time,
+            table_events=state.table.n_events,
+            table_censored=state.table.n_censored,
+            table_offsets=state.table.offsets,
+            # the donor_ids as one utf-8 buffer, tsv values never contain a newline
+            donor_id=np.frombuffer("\n".join(state.donor_id).encode(), dtype=np.uint8),
+            donor_codes=state.donor_codes,
+            survival_days=state.survival_days,
+            status=state.status,
+        )
+
+def load_state(path : str) -> CohortState:
+    """Read the state from a npz file written by save_state
+
+    :param path: the path of the npz file
+    :type path: str
+    :return: the state
+    :rtype: CohortState
+    """
+    with np.load(path) as f:
+        labels = f["labels"].astype(object)
+        codes = np.repeat(np.arange(len(labels)), np.diff(f["table_offsets"]))
+        table = build_risk_table(codes, f["table_time"], f["table_events"], f["table_events"] + f["table_censored"], labels)
+        donor_id = np.array(f["donor_id"].tobytes().decode().split("\n"), dtype=object) if len(f["donor_codes"]) else np.zeros(0, dtype=object)
+        return CohortState(labels, table, donor_id, f["donor_codes"], f["survival_days"], f["status"])
+
+def merge_entries(table : RiskTable, codes : np.ndarray, time : np.ndarray, events : np.ndarray, counts : np.ndarray, labels : np.ndarray) -> RiskTable:
+    """Merge entries into a risk table. The entries are inserted at their place in the sorted table and times left without subjects are dropped,
+    so the result is the table of the updated donors.
+
+    :param table: the risk table, it may have fewer groups than labels
+    :type table: RiskTable
+    :param codes: the group code of every entry
+    :type codes: np.ndarray
+    :param time: the time of every entry
+    :type time: np.ndarray
+    :param events: the change of the number of events of every entry
+    :type events: np.ndarray
+    :param counts: the change of the number of subjects of every entry, -1 for a removed and 1 for an added subject
+    :type counts: np.ndarray
+    :param labels: the dataset_id of every group code
+    :type labels: np.ndarray
+    :return: the updated risk table
+    :rtype: RiskTable
+    """
+    offsets = np.append(table.offsets, np.full(len(labels) + 1 - len(table.offsets), table.offsets[-1]))
+    order = np.lexsort((time, codes))
+    codes, time, events, counts = codes[order], time[order], events[order], counts[order]
+    # only the groups touched by the entries are searched
+    positions = np.empty(len(codes), dtype=np.int64)
+    group_starts = np.flatnonzero(np.append(True, codes[1:] != codes[:-1])) if len(codes) else np.zeros(0, dtype=np.int64)
+    for start, end in zip(group_starts, np.append(group_starts[1:], len(codes))):
+        code = codes[start]
+        positions[start:end] = offsets[code] + np.searchsorted(table.time[offsets[code]:offsets[code + 1]], time[start:end], side="left")
+    table_codes = np.repeat(np.arange(len(labels)), np.diff(offsets))
+    merged = build_risk_table(
+        np.insert(table_codes, positions, codes),
+        np.insert(table.time, positions, time),
+        np.insert(table.n_events, positions, events),
+        np.insert(table.n_events + table.n_censored, positions, counts),
+        labels,
+    )
+    n_total = merged.n_events + merged.n_censored
+    if (n_total < 0).any() or (merged.n_events < 0).any():
+        raise ValueError("the update removes donors which are not in the table")
+    keep = n_total > 0
+    return build_risk_table(get_table_codes(merged)[keep], merged.time[keep], merged.n_events[keep], n_total[keep], labels)
+
+def update_state(state : CohortState, dataset_id : pd.Series, donor_id : pd.Series, survival_days : np.ndarray, exit_status : pd.Series, removed : pd.Series) -> CohortState:
+    """Add or update donors and remove donors. The table is updated by the changes of the affected donors only.
+    Updated donors keep their place in the ledger, added donors are appended in the order of the delta.
+
+    :param state: the state
+    :type state: CohortState
+    :param dataset_id: the dataset_id of every added or updated donor
+    :type dataset_id: pd.Series
+    :param donor_id: the donor_id of every added or updated donor, donors already in the state are updated
+    :type donor_id: pd.Series
+    :param survival_days: the survival days of every added or updated donor, NaN if excluded
+    :type survival_days: np.ndarray
+    :param exit_status: the status of every added or updated donor
+    :type exit_status: pd.Series
+    :param removed: the donor_ids of the removed donors, donors not in the state are ignored
+    :type removed: pd.Series
+    :raises ValueError: if a donor is added or updated more than once, or added or updated and removed
+    :return: the updated state
+    :rtype: CohortState
+    """
+    dataset_id = as_strings(dataset_id)
+    donor_id = as_strings(donor_id)
+    removed = as_strings(removed)
+    survival_days = np.asarray(survival_days, dtype=np.float32)
+    status = np.asarray(exit_status, dtype=bool)
+    if not pd.Index(donor_id).is_unique:
+        raise ValueError("a donor can only be added or updated once per update")
+    if np.isin(removed, donor_id).any():
+        raise ValueError("a donor can not be added or updated and removed in the same update")
+
+    # new datasets get new codes
+    labels = state.labels
+    new_labels = pd.unique(dataset_id[pd.Index(labels).get_indexer(dataset_id) < 0])
+    if len(new_labels):
+        labels = np.concatenate([labels, new_labels]).astype(object)
+    codes = pd.Index(labels).get_indexer(dataset_id)
+
+    ledger = pd.Index(state.donor_id)
+    positions = ledger.get_indexer(donor_id)
+    removed_positions = ledger.get_indexer(removed)
+    removed_positions = np.unique(removed_positions[removed_positions >= 0])
+
+    # the table loses the previous values of the updated and removed donors and gains the values of the added and updated donors
+    previous = np.concatenate([positions[positions >= 0], removed_positions])
+    previous = previous[~np.isnan(state.survival_days[previous])]
+    valid = ~np.isnan(survival_days)
+    table = merge_entries(
+        state.table,
+        np.concatenate([state.donor_codes[previous], codes[valid]]),
+        np.concatenate([state.survival_days[previous], survival_days[valid]]).astype(float),
+        np.concatenate([-state.status[previous].astype(np.int64), status[valid].astype(np.int64)]),
+        np.concatenate([np.full(len(previous), -1, dtype=np.int64), np.ones(valid.sum(), dtype=np.int64)]),
+        labels,
+    )
+
+    # updated donors are overwritten in place, removed donors dropped and added donors appended
+    ledger_codes, ledger_days, ledger_status = state.donor_codes.copy(), state.survival_days.copy(), state.status.copy()
+    updated = positions >= 0
+    ledger_codes[positions[updated]] = codes[updated]
+    ledger_days[positions[updated]] = survival_days[updated]
+    ledger_status[positions[updated]] = status[updated]
+    keep = np.ones(len(ledger), dtype=bool)
+    keep[removed_positions] = False
+    return CohortState(
+        labels,
+        table,
+        np.concatenate([state.donor_id[keep], donor_id[~updated]]),
+        np.concatenate([ledger_codes[keep], codes[~updated]]),
+        np.concatenate([ledger_days[keep], survival_days[~updated]]),
+        np.concatenate([ledger_status[keep], status[~updated]]),
+    )
+
+def get_group_order(state : CohortState) -> np.ndarray:
+    """Get the codes of the groups with valid donors in the order of their first valid donor, the order of a full analysis
+
+    :param state: the state
+    :type state: CohortState
+    :return: the codes
+    :rtype: np.ndarray
+    """
+    codes = state.donor_codes[~np.isnan(state.survival_days)]
+    unique, first = np.unique(codes, return_index=True)
+    return unique[np.argsort(first)]
+
+def get_risk_table(state : CohortState) -> RiskTable:
+    """Get the risk table of the valid donors of the state with the groups in the order of a full analysis
+
+    :param state: the state
+    :type state: CohortState
+    :return: the risk table
+    :rtype: RiskTable
+    """
+    order = get_group_order(state)
+    recode = np.full(len(state.labels), -1, dtype=np.int64)
+    recode[order] = np.arange(len(order))
+    codes = recode[get_table_codes(state.table)]
+    # the groups keep their rows sorted by time
+    rows = np.argsort(codes, kind="stable")
+    rows = rows[codes[rows] >= 0]
+    table = state.table
+    return build_risk_table(codes[rows], table.time[rows], table.n_events[rows], table.n_events[rows] + table.n_censored[rows], state.labels[order])
+
+def get_censored_donors(state : CohortState) -> pd.DataFrame:
+    """Get the censored donors of the state, grouped by dataset_id and in input order within a group, as in a full analysis
+
+    :param state: the state
+    :type state: CohortState
+    :return: a data frame with the columns 'donor_id' 'days_at_censoring' 'dataset_id'
+    :rtype: pd.DataFrame
+    """
+    order = get_group_order(state)
+    recode = np.full(len(state.labels), -1, dtype=np.int64)
+    recode[order] = np.arange(len(order))
+    rows = np.flatnonzero(~np.isnan(state.survival_days) & ~state.status)
+    rows = rows[np.argsort(recode[state.donor_codes[rows]], kind="stable")]
+    return pd.DataFrame({
+        "donor_id": state.donor_id[rows],
+        "days_at_censoring": state.survival_days[rows],
+        "dataset_id": state.labels[state.donor_codes[rows]],
+    })
+
+def get_grouped_survival(state : CohortState) -> GroupedSurvival:
+    """Get the survival data of the valid donors of the state sorted by (group, time), with the groups in the order of a full analysis
+
+    :param state: the state
+    :type state: CohortState
+    :return: the grouped survival data
+    :rtype: GroupedSurvival
+    """
+    valid = ~np.isnan(state.survival_days)
+    return group_survival(state.labels[state.donor_codes[valid]], state.survival_days[valid], state.status[valid])
@@ -0,0 +1,184 @@
+import numpy as np
+import pandas as pd
+from typing import NamedTuple
+from scipy.special import ndtri
+from engine import RiskTable
+
+class SurvivalCurves(NamedTuple):
+    """Kaplan-Meier curves of all groups stored in shared arrays.
+    The curve of group g is offsets[g]:offsets[g+1] and starts with the time 0 row.
+    """
+    labels: np.ndarray
+    time: np.ndarray
+    survival_prob: np.ndarray
+    conf_int_lower: np.ndarray
+    conf_int_upper: np.ndarray
+    offsets: np.ndarray
+
+    def to_frame(self) -> pd.DataFrame:
+        """Get the curves of all groups as one data frame with the columns 'time' 'survival_prob' 'conf_int_lower' 'conf_int_upper' 'dataset_id'"""
+        return pd.DataFrame({
+            'time': self.time,
+            'survival_prob': self.survival_prob,
+            'conf_int_lower': self.conf_int_lower,
+            'conf_int_upper': self.conf_int_upper,
+            'dataset_id': np.repeat(self.labels, np.diff(self.offsets))
+        })
+
+def segmented_accumulate(ufunc : np.ufunc, values : np.ndarray, offsets : np.ndarray) -> np.ndarray:
+    """Accumulate the values separately within every segment offsets[g]:offsets[g+1].
+    Segments of similar length are stacked into padded blocks and accumulated along the rows,
+    so the result is exactly the one of calling ufunc.accumulate on every segment on its own.
+
+    :param ufunc: the ufunc to accumulate (np.multiply for cumprod, np.add for cumsum)
+    :type ufunc: np.ufunc
+    :param values: the values of all segments
+    :type values: np.ndarray
+    :param offsets: the segment boundaries
+    :type offsets: np.ndarray
+    :return: the accumulated values
+    :rtype: np.ndarray
+    """
+    out = np.empty_like(values)
+    sizes = np.diff(offsets)
+    if len(values) == 0:
+        return out
+    # bucket b holds the segments with 2**(b-1) < size <= 2**b, padding wastes at most half of a block
+    buckets = np.ceil(np.log2(np.maximum(sizes, 1))).astype(int)
+    for b in np.unique(buckets[sizes > 0]):
+        segments = np.flatnonzero((buckets == b) & (sizes > 0))
+        width = sizes[segments].max()
+        index = offsets[segments][:, None] + np.arange(width)
+        valid = np.arange(width) < sizes[segments][:, None]
+        block = np.full(index.shape, ufunc.identity, dtype=values.dtype)
+        block[valid] = values[index[valid]]
+        out[index[valid]] = ufunc.accumulate(block, axis=1)[valid]
+    return out
+
+def kaplan_meier(table : RiskTable, conf_level : float = 0.95) -> SurvivalCurves:
+    """Estimate the survival functions of all groups with the Kaplan-Meier estimator,
+    with Greenwood variance and log-log confidence intervals (the same estimates as sksurv.nonparametric.kaplan_meier_estimator)
+
+    :param table: the event/at-risk table of all groups
+    :type table: RiskTable
+    :param conf_level: the level of the two-sided confidence intervals
+    :type conf_level: float
+    :return: the survival curves of all groups, each starting with the time 0 row
+    :rtype: SurvivalCurves
+    """
+    n_events = table.n_events
+    n_at_risk = table.n_at_risk
+    # account for 0/0 = nan
+    ratio = np.divide(n_events, n_at_risk, out=np.zeros(len(n_events), dtype=float), where=n_events != 0)
+    ratio_var = np.divide(
+        n_events,
+        n_at_risk * (n_at_risk - n_events),
+        out=np.zeros(len(n_events), dtype=float),
+        where=(n_events != 0) & (n_at_risk != n_events),
+    )
+    survival_prob = segmented_accumulate(np.multiply, 1.0 - ratio, table.offsets)
+    sigma = np.sqrt(segmented_accumulate(np.add, ratio_var, table.offsets))
+
+    # pointwise log-minus-log transformed confidence intervals
+    z = -ndtri((1.0 - conf_level) / 2.0)
+    eps = np.finfo(survival_prob.dtype).eps
+    log_p = np.zeros_like(survival_prob)
+    np.log(survival_prob, where=survival_prob > eps, out=log_p)
+    theta = np.zeros_like(survival_prob)
+    np.true_divide(sigma, log_p, where=log_p < -eps, out=theta)
+    theta = theta * z
+    conf_int = np.exp(np.exp(np.stack([-theta, theta])) * log_p)
+    conf_int[:, survival_prob <= eps] = 0.0
+    conf_int[:, 1.0 - survival_prob <= eps] = 1.0
+
+    # every group gets a time 0 row in front of its curve, written in place
+    n_groups = len(table.labels)
+    offsets = table.offsets + np.arange(n_groups + 1)
+    rows = np.ones(offsets[-1], dtype=bool)
+    rows[offsets[:-1]] = False
+    curves = SurvivalCurves(
+        table.labels,
+        np.zeros(offsets[-1], dtype=float),
+        np.ones(offsets[-1], dtype=float),
+        np.ones(offsets[-1], dtype=float),
+        np.ones(offsets[-1], dtype=float),
+        offsets,
+    )
+    curves.time[rows] = table.time
+    curves.survival_prob[rows] = survival_prob
+    curves.conf_int_lower[rows] = conf_int[0]
+    curves.conf_int_upper[rows] = conf_int[1]
+    return curves
+
+def thin_curves(curves : SurvivalCurves, tolerance : float) -> SurvivalCurves:
+    """Drop the step points that are not visible at the given probability resolution, e.g. 1/height of a plot in pixels.
+    The probabilities are binned to the resolution and a point is only kept where the bin of the survival probability
+    or of a confidence limit changes, so the drawn curve and confidence envelope stay within tolerance of the full ones.
+    The first and the last point of every curve are always kept.
+
+    :param curves: the survival curves of all groups
+    :type curves: SurvivalCurves
+    :param tolerance: the probability resolution, 0 keeps every point
+    :type tolerance: float
+    :return: the thinned survival curves
+    :rtype: SurvivalCurves
+    """
+    if tolerance <= 0 or len(curves.time) == 0:
+        return curves
+    keep = np.zeros(len(curves.time), dtype=bool)
+    for values in (curves.survival_prob, curves.conf_int_lower, curves.conf_int_upper):
+        bins = np.floor(values / tolerance)
+        # nan != nan, points without a confidence limit are kept
+        keep[1:] |= bins[1:] != bins[:-1]
+    sizes = np.diff(curves.offsets)
+    keep[curves.offsets[:-1][sizes > 0]] = True
+    keep[curves.offsets[1:][sizes > 0] - 1] = True
+    offsets = np.concatenate([[0], np.cumsum(keep)])[curves.offsets]
+    return SurvivalCurves(
+        curves.labels,
+        curves.time[keep],
+        curves.survival_prob[keep],
+        curves.conf_int_lower[keep],
+        curves.conf_int_upper[keep],
+        offsets,
+    )
+
+class CurveGrid(NamedTuple):
+    """Survival curves of all groups evaluated on a shared time grid.
+    Row g of survival_prob, conf_int_lower and conf_int_upper belongs to group labels[g], column t to time[t].
+    """
+    labels: np.ndarray
+    time: np.ndarray
+    survival_prob: np.ndarray
+    conf_int_lower: np.ndarray
+    conf_int_upper: np.ndarray
+
+def evaluate_curves(curves : SurvivalCurves, time : np.ndarray) -> CurveGrid:
+    """Evaluate the step functions of all groups at the same times with one binary search.
+    The curve points are keyed by (group, rank of the time) so all groups x times lookups are a single searchsorted.
+    After the last follow up of a group its survival is unknown (NaN) unless it already dropped to 0.
+
+    :param curves: the survival curves of all groups, each starting with the time 0 row
+    :type curves: SurvivalCurves
+    :param time: the non-negative times
+    :type time: np.ndarray
+    :return: the curves and confidence intervals of all groups at the times
+    :rtype: CurveGrid
+    """
+    time = np.asarray(time, dtype=float)
+    n_groups = len(curves.labels)
+    codes = np.repeat(np.arange(n_groups), np.diff(curves.offsets))
+    times = np.unique(np.concatenate([curves.time, time]))
+    keys = codes * len(times) + np.searchsorted(times, curves.time)
+    queries = np.arange(n_groups)[:, None] * len(times) + np.searchsorted(times, time)
+    # the last point at or before the time, every group has a point at time 0
+    rows = np.searchsorted(keys, queries, side="right") - 1
+    last = curves.offsets[1:] - 1
+    known = (time <= curves.time[last][:, None]) | (curves.survival_prob[last] == 0)[:, None]
+    return CurveGrid(
+        curves.labels,
+        time,
+        np.where(known, curves.survival_prob[rows], np.nan),
+        np.where(known, curves.conf_int_lower[rows], np.nan),
+        np.where(known, curves.conf_int_upper[rows], np.nan),
+    )
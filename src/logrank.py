@@ -0,0 +1,375 @@
+import numpy as np
+import pandas as pd
+from typing import Iterator, NamedTuple, Tuple
+from scipy.special import chdtrc
+from engine import RiskTable
+
+class RiskMatrix(NamedTuple):
+    """Numbers at risk and events of all groups on the pooled grid of event times.
+    Row g of n_at_risk and n_events belongs to group labels[g], column t to time[t].
+    """
+    labels: np.ndarray
+    time: np.ndarray
+    n_at_risk: np.ndarray
+    n_events: np.ndarray
+
+# the default maximum number of cells (groups x times) of the risk matrix of a block of event times
+MAX_CELLS = 1 << 20
+
+def get_event_times(table : RiskTable) -> np.ndarray:
+    """Get the pooled event times of all groups, the sorted times with an event in any group"""
+    return np.unique(table.time[table.n_events > 0])
+
+def get_risk_matrix(table : RiskTable, grid : np.ndarray = None) -> RiskMatrix:
+    """Evaluate the risk tables of all groups on the pooled event times with one vectorized lookup
+
+    :param table: the event/at-risk table of all groups
+    :type table: RiskTable
+    :param grid: sorted pooled event times to evaluate on, all of them by default
+    :type grid: np.ndarray
+    :return: the numbers at risk and events of every group at every time of the grid
+    :rtype: RiskMatrix
+    """
+    n_groups = len(table.labels)
+    grid = get_event_times(table) if grid is None else grid
+    n_times = len(grid)
+    codes = np.repeat(np.arange(n_groups), np.diff(table.offsets))
+    # (group, position of the time on the grid) as one key, ascending over the whole table.
+    # a time between grid[r-1] and grid[r] gets 2r, the time grid[r] itself 2r+1
+    position = np.searchsorted(grid, table.time, side="left")
+    exact = position < n_times
+    exact[exact] = grid[position[exact]] == table.time[exact]
+    table_keys = codes * (2 * n_times + 2) + 2 * position + exact
+    grid_keys = np.arange(n_groups)[:, None] * (2 * n_times + 2) + 2 * np.arange(n_times) + 1
+    # the first row of the group at or after the grid time
+    index = np.searchsorted(table_keys, grid_keys, side="left")
+    found = index < table.offsets[1:, None]
+    index = np.minimum(index, len(table.time) - 1)
+    n_at_risk = np.where(found, table.n_at_risk[index], 0)
+    n_events = np.where(found & (table.time[index] == grid), table.n_events[index], 0)
+    return RiskMatrix(table.labels, grid, n_at_risk, n_events)
+
+def get_risk_blocks(table : RiskTable, max_cells : int) -> Iterator[RiskMatrix]:
+    """Evaluate the risk tables of all groups on consecutive blocks of the pooled event times, so that the dense matrices stay small
+
+    :param table: the event/at-risk table of all groups
+    :type table: RiskTable
+    :param max_cells: the maximum number of cells (groups x times) of a block, a block has at least one time
+    :type max_cells: int
+    :return: an iterator over the risk matrices of the blocks in time order
+    :rtype: Iterator[RiskMatrix]
+    """
+    grid = get_event_times(table)
+    block = max(1, max_cells // max(len(table.labels), 1))
+    for start in range(0, len(grid), block):
+        yield get_risk_matrix(table, grid[start:start + block])
+
+def get_pooled_totals(table : RiskTable) -> Tuple[np.ndarray, np.ndarray]:
+    """Get the numbers at risk and events of all groups together at the pooled event times, straight from the table
+
+    :param table: the event/at-risk table of all groups
+    :type table: RiskTable
+    :return: a tuple with the number at risk and the number of events at every pooled event time
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    """
+    grid = get_event_times(table)
+    # an entry is at risk at the grid times up to its own time
+    position = np.searchsorted(grid, table.time, side="right")
+    leaving = np.bincount(position, table.n_events + table.n_censored, minlength=len(grid) + 1)
+    n_total = np.cumsum(leaving[::-1])[::-1][1:]
+    events = table.n_events > 0
+    d_total = np.bincount(position[events] - 1, table.n_events[events], minlength=len(grid))
+    return n_total, d_total
+
+def adjust_holm(p : np.ndarray) -> np.ndarray:
+    """Adjust p-values for multiple testing with the Holm step-down method, NaN p-values are not counted
+
+    :param p: the p-values
+    :type p: np.ndarray
+    :return: the adjusted p-values
+    :rtype: np.ndarray
+    """
+    out = np.full(len(p), np.nan)
+    tested = np.flatnonzero(~np.isnan(p))
+    m = len(tested)
+    order = tested[np.argsort(p[tested], kind="stable")]
+    out[order] = np.minimum(np.maximum.accumulate((m - np.arange(m)) * p[order]), 1.0)
+    return out
+
+def adjust_bh(p : np.ndarray) -> np.ndarray:
+    """Adjust p-values for multiple testing with the Benjamini-Hochberg method (false discovery rate), NaN p-values are not counted
+
+    :param p: the p-values
+    :type p: np.ndarray
+    :return: the adjusted p-values
+    :rtype: np.ndarray
+    """
+    out = np.full(len(p), np.nan)
+    tested = np.flatnonzero(~np.isnan(p))
+    m = len(tested)
+    order = tested[np.argsort(p[tested], kind="stable")][::-1]
+    out[order] = np.minimum(np.minimum.accumulate(m / np.arange(m, 0, -1) * p[order]), 1.0)
+    return out
+
+def get_pairwise_sums(matrix : RiskMatrix) -> Tuple[np.ndarray, np.ndarray]:
+    """Get the observed - expected events and their variances of the two-sample logrank test of every pair of groups.
+    A pair only contributes at the event times of its two groups, so every pair is evaluated on the union of their event times:
+    group i against all later groups at the event times of i, and every later group j at its own event times without an event of i.
+    The sums over disjoint blocks of event times add up to the sums over all of them.
+
+    :param matrix: the numbers at risk and events of all groups on pooled event times
+    :type matrix: RiskMatrix
+    :return: a tuple with the observed - expected events of the first group of every pair and their variances, the pairs (i, j) with i < j in order
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    """
+    n_groups = len(matrix.labels)
+    n = matrix.n_at_risk.astype(float)
+    d = matrix.n_events.astype(float)
+    # the event times of every group, sorted by group
+    event_groups, event_times = np.nonzero(d > 0)
+    event_starts = np.searchsorted(event_groups, np.arange(n_groups + 1))
+    event_n, event_d = n[event_groups, event_times], d[event_groups, event_times]
+    differences, variances = [], []
+    for i in range(n_groups - 1):
+        times = event_times[event_starts[i]:event_starts[i + 1]]
+        # the event times of i, for all later groups at once, only the pair is at risk
+        n_i, d_i = n[i, times], d[i, times]
+        n_j, d_j = n[i + 1:, times], d[i + 1:, times]
+        n_pair, d_pair = n_i + n_j, d_i + d_j
+        # i has events, so someone is at risk, the expected events of i are its share of the events of the pair
+        share = n_i / n_pair
+        expected = share * d_pair
+        difference = d_i.sum() - expected.sum(axis=1)
+        # the hypergeometric variance share (1 - share) d (n - d) / (n - 1), 0 if only one is at risk
+        variance = (expected * (1 - share) * (n_pair - d_pair) / np.maximum(n_pair - 1, 1)).sum(axis=1)
+        # the event times of the later groups without an event of i, while i is at risk
+        rest = slice(event_starts[i + 1], None)
+        times = event_times[rest]
+        n_i = n[i, times]
+        other = (d[i, times] == 0) & (n_i > 0)
+        j = event_groups[rest][other] - i - 1
+        n_i, n_j, d_j = n_i[other], event_n[rest][other], event_d[rest][other]
+        n_pair = n_i + n_j
+        share = n_i / n_pair
+        expected = share * d_j
+        difference -= np.bincount(j, expected, minlength=n_groups - 1 - i)
+        variance += np.bincount(j, expected * (1 - share) * (n_pair - d_j) / np.maximum(n_pair - 1, 1), minlength=n_groups - 1 - i)
+        differences.append(difference)
+        variances.append(variance)
+    if not differences:
+        return np.zeros(0), np.zeros(0)
+    return np.concatenate(differences), np.concatenate(variances)
+
+def get_pairwise_tests(labels : np.ndarray, difference : np.ndarray, variance : np.ndarray) -> pd.DataFrame:
+    """Get the two-sample logrank tests of every pair of groups from their sums, with Holm and Benjamini-Hochberg adjusted p-values
+
+    :param labels: the labels of the groups
+    :type labels: np.ndarray
+    :param difference: the observed - expected events of every pair, see get_pairwise_sums
+    :type difference: np.ndarray
+    :param variance: the variances of every pair
+    :type variance: np.ndarray
+    :return: a data frame with the columns 'dataset_id_1' 'dataset_id_2' 'chi2' 'p' 'p_holm' 'p_bh', one row per pair
+    :rtype: pd.DataFrame
+    """
+    first, second = np.triu_indices(len(labels), 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        chi2 = difference ** 2 / variance
+    p = chdtrc(1, chi2)
+    return pd.DataFrame({
+        "dataset_id_1": labels[first],
+        "dataset_id_2": labels[second],
+        "chi2": chi2,
+        "p": p,
+        "p_holm": adjust_holm(p),
+        "p_bh": adjust_bh(p),
+    })
+
+def pairwise_logrank(matrix : RiskMatrix) -> pd.DataFrame:
+    """Perform the two-sample logrank test for every pair of groups from the shared risk matrix,
+    with Holm and Benjamini-Hochberg adjusted p-values, see get_pairwise_sums.
+
+    :param matrix: the numbers at risk and events of all groups on the pooled event times
+    :type matrix: RiskMatrix
+    :return: a data frame with the columns 'dataset_id_1' 'dataset_id_2' 'chi2' 'p' 'p_holm' 'p_bh', one row per pair
+    :rtype: pd.DataFrame
+    """
+    return get_pairwise_tests(matrix.labels, *get_pairwise_sums(matrix))
+
+def pairwise_logrank_blocks(table : RiskTable, max_cells : int) -> pd.DataFrame:
+    """Perform the two-sample logrank test for every pair of groups like pairwise_logrank,
+    summing over blocks of the pooled event times instead of one dense risk matrix, see get_risk_blocks.
+
+    :param table: the event/at-risk table of all groups
+    :type table: RiskTable
+    :param max_cells: the maximum number of cells of a block
+    :type max_cells: int
+    :return: a data frame with the columns 'dataset_id_1' 'dataset_id_2' 'chi2' 'p' 'p_holm' 'p_bh', one row per pair
+    :rtype: pd.DataFrame
+    """
+    n_pairs = len(table.labels) * (len(table.labels) - 1) // 2
+    difference, variance = np.zeros(n_pairs), np.zeros(n_pairs)
+    for matrix in get_risk_blocks(table, max_cells):
+        block_difference, block_variance = get_pairwise_sums(matrix)
+        difference += block_difference
+        variance += block_variance
+    return get_pairwise_tests(table.labels, difference, variance)
+
+LOGRANK_TESTS = ["logrank", "gehan_wilcoxon", "tarone_ware", "fleming_harrington"]
+
+def get_weights(matrix : RiskMatrix, tests : list, fleming_harrington : Tuple[float, float] = (0, 1)) -> np.ndarray:
+    """Get the weights of the event times for every test of the weighted logrank family
+
+    :param matrix: the numbers at risk and events of all groups on the pooled event times
+    :type matrix: RiskMatrix
+    :param tests: the tests, among "logrank" (1), "gehan_wilcoxon" (N), "tarone_ware" (sqrt(N)) and "fleming_harrington" (S(t-)^p * (1-S(t-))^q)
+    :type tests: list
+    :param fleming_harrington: the parameters (p, q) of the Fleming-Harrington weights, p > 0 emphasises early and q > 0 late differences
+    :type fleming_harrington: Tuple[float, float]
+    :return: an array (tests x times) with the weights
+    :rtype: np.ndarray
+    """
+    return get_pooled_weights(matrix.n_at_risk.sum(axis=0), matrix.n_events.sum(axis=0), tests, fleming_harrington)
+
+def get_pooled_weights(n_total : np.ndarray, d_total : np.ndarray, tests : list, fleming_harrington : Tuple[float, float] = (0, 1)) -> np.ndarray:
+    """Get the weights of the event times for every test from the numbers at risk and events of all groups together, see get_weights
+
+    :param n_total: the number at risk at every pooled event time
+    :type n_total: np.ndarray
+    :param d_total: the number of events at every pooled event time
+    :type d_total: np.ndarray
+    :param tests: the tests, see get_weights
+    :type tests: list
+    :param fleming_harrington: the parameters (p, q) of the Fleming-Harrington weights
+    :type fleming_harrington: Tuple[float, float]
+    :return: an array (tests x times) with the weights
+    :rtype: np.ndarray
+    """
+    n_total = np.asarray(n_total, dtype=float)
+    d_total = np.asarray(d_total, dtype=float)
+    weights = np.ones((len(tests), len(n_total)), dtype=float)
+    for i, test in enumerate(tests):
+        if test == "gehan_wilcoxon":
+            weights[i] = n_total
+        elif test == "tarone_ware":
+            weights[i] = np.sqrt(n_total)
+        elif test == "fleming_harrington":
+            # pooled Kaplan-Meier estimate just before every event time
+            survival = np.cumprod(1.0 - d_total / n_total)
+            survival = np.concatenate([[1.0], survival[:-1]])
+            p, q = fleming_harrington
+            weights[i] = survival ** p * (1.0 - survival) ** q
+        elif test != "logrank":
+            raise ValueError(f"test must be one of {LOGRANK_TESTS}, but was {test!r}")
+    return weights
+
+def get_score(n_at_risk : np.ndarray, n_events : np.ndarray, weights : np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Get the weighted observed - expected events of every group and their covariance, for many risk matrices at once (e.g. permutations of the groups).
+    The covariances of all tests are computed in one matrix product. The sums over disjoint blocks of event times add up to the sums over all of them.
+
+    :param n_at_risk: the numbers at risk, an array (... x groups x times)
+    :type n_at_risk: np.ndarray
+    :param n_events: the numbers of events, an array (... x groups x times)
+    :type n_events: np.ndarray
+    :param weights: the weights of the tests, an array (tests x times)
+    :type weights: np.ndarray
+    :return: a tuple with the statistics, an array (... x tests x groups), and the covariances, an array (... x tests x groups x groups)
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    """
+    n = n_at_risk.astype(float)
+    d = n_events.astype(float)
+    n_total = n.sum(axis=-2, keepdims=True)
+    d_total = d.sum(axis=-2, keepdims=True)
+    share = n / n_total
+    # observed - expected events of every group, weighted
+    statistic = np.swapaxes((d - share * d_total) @ weights.T, -1, -2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale = np.where(n_total > 1, d_total * (n_total - d_total) / (n_total - 1), 0.0)
+    # covariance of every test: sum_t w^2 scale (diag(share) - share share^T)
+    factor = weights ** 2 * scale
+    covariance = -(share[..., None, :, :] * factor[..., :, None, :]) @ np.swapaxes(share, -1, -2)[..., None, :, :]
+    groups = np.arange(share.shape[-2])
+    covariance[..., groups, groups] += factor @ np.swapaxes(share, -1, -2)
+    return statistic, covariance
+
+def solve_chi2(statistic : np.ndarray, covariance : np.ndarray) -> np.ndarray:
+    """Get the chi2 statistics of the k-sample weighted logrank tests from their scores, see get_score
+
+    :param statistic: the weighted observed - expected events, an array (... x tests x groups)
+    :type statistic: np.ndarray
+    :param covariance: their covariances, an array (... x tests x groups x groups)
+    :type covariance: np.ndarray
+    :return: the chi2 statistics, an array (... x tests), NaN if the covariance is singular
+    :rtype: np.ndarray
+    """
+    df = statistic.shape[-1] - 1
+    covariance, statistic = covariance[..., :df, :df], statistic[..., :df]
+    try:
+        return (np.linalg.solve(covariance, statistic[..., None])[..., 0] * statistic).sum(axis=-1)
+    except np.linalg.LinAlgError:
+        # no events to compare in some of the matrices, solve one by one
+        chi2 = np.full(statistic.shape[:-1], np.nan)
+        for index in np.ndindex(chi2.shape):
+            try:
+                chi2[index] = np.linalg.solve(covariance[index], statistic[index]) @ statistic[index]
+            except np.linalg.LinAlgError:
+                pass
+        return chi2
+
+def get_chi2(n_at_risk : np.ndarray, n_events : np.ndarray, weights : np.ndarray) -> np.ndarray:
+    """Get the chi2 statistics of the k-sample weighted logrank tests, for many risk matrices at once (e.g. permutations of the groups).
+
+    :param n_at_risk: the numbers at risk, an array (... x groups x times)
+    :type n_at_risk: np.ndarray
+    :param n_events: the numbers of events, an array (... x groups x times)
+    :type n_events: np.ndarray
+    :param weights: the weights of the tests, an array (tests x times)
+    :type weights: np.ndarray
+    :return: the chi2 statistics, an array (... x tests), NaN if the covariance is singular
+    :rtype: np.ndarray
+    """
+    return solve_chi2(*get_score(n_at_risk, n_events, weights))
+
+def weighted_logrank(matrix : RiskMatrix, tests : list = ["logrank"], fleming_harrington : Tuple[float, float] = (0, 1)) -> pd.DataFrame:
+    """Perform the k-sample weighted logrank tests comparing the survival curves of all groups.
+    All tests share the risk matrix, the covariances of all tests are computed in one matrix product.
+
+    :param matrix: the numbers at risk and events of all groups on the pooled event times
+    :type matrix: RiskMatrix
+    :param tests: the tests, see get_weights
+    :type tests: list
+    :param fleming_harrington: the parameters (p, q) of the Fleming-Harrington weights
+    :type fleming_harrington: Tuple[float, float]
+    :return: a data frame with the columns 'test' 'chi2' 'p', one row per test
+    :rtype: pd.DataFrame
+    """
+    chi2 = get_chi2(matrix.n_at_risk, matrix.n_events, get_weights(matrix, tests, fleming_harrington))
+    return pd.DataFrame({"test": tests, "chi2": chi2, "p": chdtrc(len(matrix.labels) - 1, chi2)})
+
+def weighted_logrank_blocks(table : RiskTable, tests : list = ["logrank"], fleming_harrington : Tuple[float, float] = (0, 1), max_cells : int = MAX_CELLS) -> pd.DataFrame:
+    """Perform the k-sample weighted logrank tests like weighted_logrank,
+    summing the scores over blocks of the pooled event times instead of one dense risk matrix, see get_risk_blocks.
+
+    :param table: the event/at-risk table of all groups
+    :type table: RiskTable
+    :param tests: the tests, see get_weights
+    :type tests: list
+    :param fleming_harrington: the parameters (p, q) of the Fleming-Harrington weights
+    :type fleming_harrington: Tuple[float, float]
+    :param max_cells: the maximum number of cells of a block
+    :type max_cells: int
+    :return: a data frame with the columns 'test' 'chi2' 'p', one row per test
+    :rtype: pd.DataFrame
+    """
+    # the Fleming-Harrington weights depend on all earlier event times
+    weights = get_pooled_weights(*get_pooled_totals(table), tests, fleming_harrington)
+    n_groups = len(table.labels)
+    statistic, covariance = np.zeros((len(tests), n_groups)), np.zeros((len(tests), n_groups, n_groups))
+    start = 0
+    for matrix in get_risk_blocks(table, max_cells):
+        block_statistic, block_covariance = get_score(matrix.n_at_risk, matrix.n_events, weights[:, start:start + len(matrix.time)])
+        statistic += block_statistic
+        covariance += block_covariance
+        start += len(matrix.time)
+    chi2 = solve_chi2(statistic, covariance)
+    return pd.DataFrame({"test": tests, "chi2": chi2, "p": chdtrc(n_groups - 1, chi2)})
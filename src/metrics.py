@@ -0,0 +1,85 @@
+import os
+import json
+import time
+import resource
+from contextlib import contextmanager
+
+def get_peak_memory() -> float:
+    """Get the peak resident memory of this process
+
+    :return: the peak memory in megabytes
+    :rtype: float
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def is_enabled(variable : str) -> bool:
+    """Check if an opt-in environment variable is set to a true value
+
+    :param variable: the name of the environment variable
+    :type variable: str
+    :rtype: bool
+    """
+    return os.environ.get(variable, "").lower() in ("1", "true", "yes")
+
+class Metrics:
+    """Wall time, CPU time and peak memory of the stages of an analysis, together with counts like rows and groups.
+    A disabled instance records nothing, so the stages can always be wrapped.
+    """
+
+    def __init__(self, enabled : bool):
+        """
+        :param enabled: whether to record anything
+        :type enabled: bool
+        """
+        self.enabled = enabled
+        self.stages = {}
+        self.counts = {}
+
+    @contextmanager
+    def stage(self, name : str):
+        """Record the code run in the with block as the stage name, repeated stages add up
+
+        :param name: the name of the stage
+        :type name: str
+        """
+        if not self.enabled:
+            yield
+            return
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, {"wall_time": 0.0, "cpu_time": 0.0, "calls": 0})
+            entry["wall_time"] += time.perf_counter() - wall
+            entry["cpu_time"] += time.process_time() - cpu
+            entry["calls"] += 1
+            entry["peak_rss_mb"] = get_peak_memory()
+
+    def count(self, **counts):
+        """Record counts, e.g. count(rows=1000, groups=3)"""
+        if self.enabled:
+            self.counts.update({key: int(value) for key, value in counts.items()})
+
+    def to_dict(self) -> dict:
+        """Get the recorded metrics
+
+        :return: a dictionary with the keys "stages", "counts", "wall_time", "cpu_time" and "peak_rss_mb"
+        :rtype: dict
+        """
+        return {
+            "stages": self.stages,
+            "counts": self.counts,
+            "wall_time": sum(stage["wall_time"] for stage in self.stages.values()),
+            "cpu_time": sum(stage["cpu_time"] for stage in self.stages.values()),
+            "peak_rss_mb": get_peak_memory(),
+        }
+
+    def write(self, path : str):
+        """Write the recorded metrics to a json file if enabled
+
+        :param path: the path of the json file
+        :type path: str
+        """
+        if self.enabled:
+            with open(path, "w") as f:
+                json.dump(self.to_dict(), f, indent=2)
@@ -0,0 +1,195 @@
+import os
+import numpy as np
+import pandas as pd
+from typing import Callable, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from engine import GroupedSurvival
+from logrank import RiskMatrix, get_weights, get_chi2
+
+# the number of array elements of one chunk of replicates, bounds the memory of every thread
+CHUNK_ELEMENTS = 2 ** 22
+
+def get_chunks(replicates : int, size : int, seed : np.random.SeedSequence) -> list:
+    """Split the replicates into chunks with their own random streams.
+    The streams only depend on the seed and the chunk size, not on the number of threads.
+
+    :param replicates: the number of replicates
+    :type replicates: int
+    :param size: the number of replicates of a chunk
+    :type size: int
+    :param seed: the seed of all chunks
+    :type seed: np.random.SeedSequence
+    :return: tuples (number of replicates, random generator) of every chunk
+    :rtype: list
+    """
+    sizes = [min(size, replicates - start) for start in range(0, replicates, size)]
+    return [(n, np.random.default_rng(s)) for n, s in zip(sizes, seed.spawn(len(sizes)))]
+
+def run_chunks(function : Callable, chunks : list, threads : int) -> list:
+    """Run function(size, rng) for every chunk on a pool of threads, numpy releases the GIL in the array operations
+
+    :param function: the function computing a chunk of replicates
+    :type function: Callable
+    :param chunks: the chunks, see get_chunks
+    :type chunks: list
+    :param threads: the number of threads, 0 for all cores
+    :type threads: int
+    :return: the results of all chunks in order
+    :rtype: list
+    """
+    threads = threads or os.cpu_count()
+    if threads == 1 or len(chunks) == 1:
+        return [function(size, rng) for size, rng in chunks]
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(lambda chunk: function(*chunk), chunks))
+
+def get_time_starts(time : np.ndarray) -> np.ndarray:
+    """Get the first position of every distinct time in sorted times"""
+    return np.flatnonzero(np.append(True, time[1:] != time[:-1])) if len(time) else np.zeros(0, dtype=np.int64)
+
+def batch_kaplan_meier(weights : np.ndarray, event : np.ndarray, starts : np.ndarray) -> np.ndarray:
+    """Estimate the survival function of many weighted samples of the same subjects at once
+
+    :param weights: the weight of every subject in every sample (samples x subjects), e.g. the bootstrap counts
+    :type weights: np.ndarray
+    :param event: the event indicator of every subject, sorted by time
+    :type event: np.ndarray
+    :param starts: the first subject of every distinct time
+    :type starts: np.ndarray
+    :return: the survival function of every sample at every distinct time (samples x times)
+    :rtype: np.ndarray
+    """
+    n_events = np.add.reduceat(weights * event, starts, axis=1)
+    n_total = np.add.reduceat(weights, starts, axis=1)
+    n_at_risk = np.cumsum(n_total[:, ::-1], axis=1)[:, ::-1]
+    ratio = np.divide(n_events, n_at_risk, out=np.zeros_like(n_events), where=n_at_risk > 0)
+    return np.cumprod(1.0 - ratio, axis=1)
+
+def get_bootstrap_band(time : np.ndarray, event : np.ndarray, replicates : int, conf_level : float, seed : np.random.SeedSequence, threads : int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Get the simultaneous equal precision confidence band of the survival function of one group by the bootstrap.
+    The critical value is the conf_level quantile of the largest deviation of a bootstrap curve from the estimate relative to the Greenwood standard error.
+
+    :param time: the times of the group, sorted
+    :type time: np.ndarray
+    :param event: the event indicators of the group
+    :type event: np.ndarray
+    :param replicates: the number of bootstrap replicates
+    :type replicates: int
+    :param conf_level: the simultaneous coverage of the band
+    :type conf_level: float
+    :param seed: the seed of the random streams of the chunks
+    :type seed: np.random.SeedSequence
+    :param threads: the number of threads, 0 for all cores
+    :type threads: int
+    :return: a tuple with the distinct times, the survival function, the lower and the upper limit of the band
+    :rtype: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+    """
+    n = len(time)
+    starts = get_time_starts(time)
+    event = event.astype(float)
+    survival = batch_kaplan_meier(np.ones((1, n)), event, starts)[0]
+    # Greenwood standard error
+    n_events = np.add.reduceat(event, starts)
+    n_at_risk = n - starts
+    variance = np.cumsum(np.divide(n_events, n_at_risk * (n_at_risk - n_events), out=np.zeros(len(starts)), where=n_at_risk > n_events))
+    std = survival * np.sqrt(variance)
+    scaled = std > 0
+
+    def deviations(size : int, rng : np.random.Generator) -> np.ndarray:
+        # how often every subject is drawn, the multinomial counts of n draws with replacement
+        draws = rng.integers(0, n, size=(size, n)) + np.arange(size)[:, None] * n
+        weights = np.bincount(draws.ravel(), minlength=size * n).reshape(size, n).astype(float)
+        curves = batch_kaplan_meier(weights, event, starts)
+        if not scaled.any():
+            return np.zeros(size)
+        return (np.abs(curves[:, scaled] - survival[scaled]) / std[scaled]).max(axis=1)
+
+    chunks = get_chunks(replicates, max(1, CHUNK_ELEMENTS // max(n, 1)), seed)
+    critical = np.quantile(np.concatenate(run_chunks(deviations, chunks, threads)), conf_level)
+    return time[starts], survival, np.clip(survival - critical * std, 0, 1), np.clip(survival + critical * std, 0, 1)
+
+def bootstrap_bands(grouped : GroupedSurvival, replicates : int, conf_level : float = 0.95, seed : int = 0, threads : int = 0) -> pd.DataFrame:
+    """Get simultaneous bootstrap confidence bands of the survival functions of all groups, resampling every group on its own
+
+    :param grouped: the survival data sorted by (group, time)
+    :type grouped: GroupedSurvival
+    :param replicates: the number of bootstrap replicates
+    :type replicates: int
+    :param conf_level: the simultaneous coverage of the bands
+    :type conf_level: float
+    :param seed: the seed of the random generator
+    :type seed: int
+    :param threads: the number of threads, 0 for all cores
+    :type threads: int
+    :return: a data frame with the columns 'time' 'band_lower' 'band_upper' 'dataset_id', every group starting with the time 0
+    :rtype: pd.DataFrame
+    """
+    seeds = np.random.SeedSequence(seed).spawn(len(grouped.labels))
+    frames = []
+    for g, label in enumerate(grouped.labels):
+        rows = slice(grouped.row_offsets[g], grouped.row_offsets[g + 1])
+        time, _, lower, upper = get_bootstrap_band(grouped.time[rows], grouped.event[rows], replicates, conf_level, seeds[g], threads)
+        frames.append(pd.DataFrame({
+            "time": np.append(0.0, time),
+            "band_lower": np.append(1.0, lower),
+            "band_upper": np.append(1.0, upper),
+            "dataset_id": label,
+        }))
+    if not frames:
+        return pd.DataFrame({"time": np.zeros(0), "band_lower": np.zeros(0), "band_upper": np.zeros(0), "dataset_id": np.zeros(0, dtype=object)})
+    return pd.concat(frames, ignore_index=True)
+
+def permutation_logrank(grouped : GroupedSurvival, matrix : RiskMatrix, tests : list, fleming_harrington : Tuple[float, float] = (0, 1),
+        replicates : int = 1000, seed : int = 0, threads : int = 0) -> np.ndarray:
+    """Get the permutation p-values of the k-sample weighted logrank tests, permuting the group labels of the subjects.
+    The pooled numbers at risk and events and so the weights do not change under permutation.
+    The p-value is (1 + number of permutations with a chi2 at least the observed) / (1 + replicates).
+    A permutation whose chi2 is undefined (a singular covariance, e.g. a group never at risk at an event time) counts as at least the observed,
+    so the p-value stays conservative. The p-value of a test whose observed chi2 is undefined (no events to compare) is NaN.
+
+    :param grouped: the survival data sorted by (group, time)
+    :type grouped: GroupedSurvival
+    :param matrix: the observed risk matrix
+    :type matrix: RiskMatrix
+    :param tests: the tests, see logrank.get_weights
+    :type tests: list
+    :param fleming_harrington: the parameters (p, q) of the Fleming-Harrington weights
+    :type fleming_harrington: Tuple[float, float]
+    :param replicates: the number of permutations
+    :type replicates: int
+    :param seed: the seed of the random generator
+    :type seed: int
+    :param threads: the number of threads, 0 for all cores
+    :type threads: int
+    :return: the p-value of every test, NaN if its observed chi2 is undefined
+    :rtype: np.ndarray
+    """
+    weights = get_weights(matrix, tests, fleming_harrington)
+    observed = get_chi2(matrix.n_at_risk, matrix.n_events, weights)
+    if np.isnan(observed).all():
+        return np.full(len(observed), np.nan)
+    n_groups = len(grouped.labels)
+    # pool all subjects sorted by time
+    order = np.argsort(grouped.time, kind="stable")
+    time, event = grouped.time[order], grouped.event[order]
+    codes = np.repeat(np.arange(n_groups), np.diff(grouped.row_offsets))[order].astype(np.int32)
+    starts = get_time_starts(time)
+    # the columns of the pooled event times in the distinct times
+    grid = np.add.reduceat(event.astype(np.int64), starts) > 0 if len(starts) else np.zeros(0, dtype=bool)
+
+    def statistics(size : int, rng : np.random.Generator) -> np.ndarray:
+        labels = rng.permuted(np.broadcast_to(codes, (size, len(codes))), axis=1)
+        n_at_risk = np.empty((size, n_groups, grid.sum()))
+        n_events = np.empty((size, n_groups, grid.sum()))
+        for g in range(n_groups):
+            member = labels == g
+            total = np.add.reduceat(member, starts, axis=1)
+            n_at_risk[:, g] = np.cumsum(total[:, ::-1], axis=1)[:, ::-1][:, grid]
+            n_events[:, g] = np.add.reduceat(member & event, starts, axis=1)[:, grid]
+        return get_chi2(n_at_risk, n_events, weights)
+
+    size = max(1, CHUNK_ELEMENTS // max(len(codes), n_groups * len(tests) * max(grid.sum(), 1)))
+    chi2 = np.concatenate(run_chunks(statistics, get_chunks(replicates, size, np.random.SeedSequence(seed)), threads))
+    # ties up to rounding count as at least the observed
+    extreme = (chi2 >= observed * (1 - 1e-10)) | np.isnan(chi2)
+    return np.where(np.isnan(observed), np.nan, (1 + extreme.sum(axis=0)) / (1 + replicates))
@@ -0,0 +1,250 @@
+import os
+import heapq
+import resource
+import numpy as np
+import pandas as pd
+from typing import Iterator, Tuple
+from engine import RiskTable, build_risk_table
+from incremental import merge_entries, get_table_codes
+
+# the number of rows of the sample estimating the memory of a row
+SAMPLE_ROWS = 1000
+# the memory of a chunk while it is parsed and reduced, in multiples of the memory of its parsed columns
+CHUNK_OVERHEAD = 8
+# the memory while the tables of the chunks are merged, in bytes per entry of the merged table
+MERGE_SIZE = 192
+# the memory while the Kaplan-Meier estimates are computed and written, in bytes per entry of the table,
+# and the memory of the estimates kept for the later steps
+CURVE_SIZE = 128
+POINT_SIZE = 40
+# the memory of a block of the risk matrix while the logrank tests are computed, in bytes per group and time,
+# and of looking up the block or the time grid in the table, in bytes per entry of the table
+CELL_SIZE = 96
+LOOKUP_SIZE = 40
+# the memory while the curves are evaluated on the time grid, in bytes per group and time
+GRID_SIZE = 48
+# the memory of the pairwise logrank tests, in bytes per pair of groups
+PAIR_SIZE = 160
+# the maximum number of run files merged at once
+MERGE_FAN_IN = 64
+
+def get_chunk_rows(sample : pd.DataFrame, memory_budget : float) -> int:
+    """Get the number of rows of a chunk, so that a chunk takes at most half of the memory budget while it is processed
+
+    :param sample: the first rows of the input, parsed
+    :type sample: pd.DataFrame
+    :param memory_budget: the memory budget in bytes
+    :type memory_budget: float
+    :return: the number of rows of a chunk, at least SAMPLE_ROWS
+    :rtype: int
+    """
+    row_size = sample.memory_usage(index=False, deep=True).sum() / max(len(sample), 1)
+    return max(SAMPLE_ROWS, int(memory_budget / 2 / (CHUNK_OVERHEAD * max(row_size, 1))))
+
+def read_chunks(data_path : str, chunk_rows : int, columns : list, dtypes : dict) -> Iterator[pd.DataFrame]:
+    """Read the input file in chunks of rows, only one chunk is held in memory at a time
+
+    :param data_path: path to the tsv file, or to a parquet or feather file with the same columns
+    :type data_path: str
+    :param chunk_rows: the maximum number of rows of a chunk
+    :type chunk_rows: int
+    :param columns: the columns to read, in the order of the file
+    :type columns: list
+    :param dtypes: the types of the columns of the tsv file
+    :type dtypes: dict
+    :return: an iterator over the chunks in input order
+    :rtype: Iterator[pd.DataFrame]
+    """
+    if data_path.endswith(".parquet"):
+        import pyarrow.parquet
+        for batch in pyarrow.parquet.ParquetFile(data_path).iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas()
+    elif data_path.endswith(".feather"):
+        import pyarrow
+        import pyarrow.ipc
+        # the record batches are memory mapped and sliced without copies
+        with pyarrow.memory_map(data_path) as source:
+            reader = pyarrow.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i).select(columns)
+                for start in range(0, batch.num_rows, chunk_rows):
+                    yield batch.slice(start, chunk_rows).to_pandas()
+    else:
+        with pd.read_csv(data_path, sep="\t", usecols=columns, dtype={c: t for c, t in dtypes.items() if c in columns}, chunksize=chunk_rows) as reader:
+            yield from reader
+
+def get_chunk_codes(dataset_id : pd.Series, labels : np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Get the group codes of the dataset_ids of a chunk, new dataset_ids get new codes in order of first appearance
+
+    :param dataset_id: the dataset_ids of the chunk
+    :type dataset_id: pd.Series
+    :param labels: the dataset_ids of the previous chunks
+    :type labels: np.ndarray
+    :return: a tuple with the code of every row and the dataset_ids of all chunks so far
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    """
+    chunk_codes, chunk_labels = pd.factorize(dataset_id, use_na_sentinel=False)
+    chunk_labels = np.asarray(chunk_labels).astype(str).astype(object)
+    positions = pd.Index(labels).get_indexer(chunk_labels)
+    new = positions < 0
+    if new.any():
+        positions[new] = len(labels) + np.arange(new.sum())
+        labels = np.concatenate([labels, chunk_labels[new]]).astype(object)
+    return positions[chunk_codes].astype(np.int64), labels
+
+def reduce_chunk(codes : np.ndarray, survival_days : np.ndarray, exit_status : np.ndarray, labels : np.ndarray) -> RiskTable:
+    """Reduce the valid rows of a chunk to the events and censorings at every distinct time of every group
+
+    :param codes: the group code of every valid row of the chunk
+    :type codes: np.ndarray
+    :param survival_days: the survival days of every valid row
+    :type survival_days: np.ndarray
+    :param exit_status: the event indicator of every valid row
+    :type exit_status: np.ndarray
+    :param labels: the dataset_ids of all chunks so far
+    :type labels: np.ndarray
+    :return: the risk table of the chunk
+    :rtype: RiskTable
+    """
+    time = np.asarray(survival_days, dtype=float)
+    order = np.lexsort((time, codes))
+    return build_risk_table(codes[order], time[order], np.asarray(exit_status, dtype=bool)[order], np.ones(len(order), dtype=np.int64), labels)
+
+def merge_chunks(table : RiskTable, chunks : list, labels : np.ndarray) -> RiskTable:
+    """Merge the risk tables of several chunks into the table at once, so the table is rebuilt once for all of them
+
+    :param table: the risk table of the earlier chunks
+    :type table: RiskTable
+    :param chunks: the risk tables of the later chunks, see reduce_chunk
+    :type chunks: list
+    :param labels: the dataset_ids of all chunks so far
+    :type labels: np.ndarray
+    :return: the risk table of all chunks
+    :rtype: RiskTable
+    """
+    codes = np.concatenate([get_table_codes(chunk) for chunk in chunks])
+    time = np.concatenate([chunk.time for chunk in chunks])
+    n_events = np.concatenate([chunk.n_events for chunk in chunks])
+    counts = np.concatenate([chunk.n_events + chunk.n_censored for chunk in chunks])
+    return merge_entries(table, codes, time, n_events, counts, labels)
+
+def get_table_size(table : RiskTable) -> int:
+    """Get the memory of the arrays of a risk table in bytes"""
+    return sum(values.nbytes for values in [table.time, table.n_events, table.n_censored, table.n_at_risk, table.offsets])
+
+def check_memory(step : str, size : float, available : float):
+    """Raise a MemoryError before a step allocates more memory than is available
+
+    :param step: the step, e.g. "merging the chunks"
+    :type step: str
+    :param size: the estimated memory of the step in bytes
+    :type size: float
+    :param available: the memory left of the budget in bytes
+    :type available: float
+    :raises MemoryError: if the step does not fit
+    """
+    if size > available:
+        raise MemoryError(f"{step} needs about {size / 1024 ** 2:.1f} MB, but only {available / 1024 ** 2:.1f} MB of the memory_budget are left")
+
+def check_analysis_memory(table : RiskTable, n_grid : int, pairwise : bool, available : float) -> int:
+    """Check that every step after the last chunk fits into the memory left of the budget, before any of them starts.
+    The estimates of the survival functions stay in memory for the later steps, the logrank tests sum over blocks of event times
+    sized to the memory left.
+
+    :param table: the risk table of all chunks
+    :type table: RiskTable
+    :param n_grid: the number of times of the time grid, 0 without a grid
+    :type n_grid: int
+    :param pairwise: whether every pair of groups is compared
+    :type pairwise: bool
+    :param available: the memory left of the budget with the table in memory, in bytes
+    :type available: float
+    :return: the maximum number of cells (groups x times) of a block of the risk matrix
+    :rtype: int
+    :raises MemoryError: if a step does not fit
+    """
+    n_entries, n_groups = len(table.time), len(table.labels)
+    check_memory("the survival functions", n_entries * CURVE_SIZE, available)
+    available -= (n_entries + n_groups) * POINT_SIZE
+    check_memory("the time grid", n_groups * n_grid * GRID_SIZE + n_entries * LOOKUP_SIZE, available)
+    if pairwise:
+        check_memory("the pairwise logrank tests", n_groups * (n_groups - 1) // 2 * PAIR_SIZE, available)
+    # every block looks up all entries of the table
+    check_memory("a block of the risk matrix", n_entries * LOOKUP_SIZE + n_groups * CELL_SIZE, available)
+    return int((available - n_entries * LOOKUP_SIZE) // CELL_SIZE)
+
+def write_censored_run(path : str, censored : pd.DataFrame, codes : np.ndarray):
+    """Write the censored patients of a chunk sorted by group to a run file, every line prefixed with the group code
+
+    :param path: the path of the run file
+    :type path: str
+    :param censored: the censored patients of the chunk with the columns of censored.tsv, in input order
+    :type censored: pd.DataFrame
+    :param codes: the group code of every censored patient
+    :type codes: np.ndarray
+    """
+    order = np.argsort(codes, kind="stable")
+    run = censored.iloc[order]
+    run.insert(0, "code", codes[order])
+    run.to_csv(path, sep="\t", index=False, header=False)
+
+def get_fan_in() -> int:
+    """Get the number of run files merged at once, at most MERGE_FAN_IN and a quarter of the open files allowed to the process"""
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    return MERGE_FAN_IN if soft == resource.RLIM_INFINITY else max(2, min(MERGE_FAN_IN, soft // 4))
+
+def get_code(line : str) -> int:
+    """Get the group code prefixing a line of a run file"""
+    return int(line[:line.index("\t")])
+
+def merge_runs(paths : list, output, keep_codes : bool):
+    """Merge run files sorted by group code into an open file, lines of equal codes keep the order of the runs
+
+    :param paths: the run files
+    :type paths: list
+    :param output: the file written to
+    :type output: file
+    :param keep_codes: keep the group code prefixing every line, to merge the output again
+    :type keep_codes: bool
+    """
+    files = []
+    try:
+        for path in paths:
+            files.append(open(path))
+        for line in heapq.merge(*files, key=get_code):
+            output.write(line if keep_codes else line[line.index("\t") + 1:])
+    finally:
+        for f in files:
+            f.close()
+
+def merge_censored_runs(paths : list, output_path : str, columns : list, fan_in : int = None):
+    """Merge the run files of all chunks into censored.tsv, grouped by the group code and in input order within a group.
+    At most fan_in files are open at once, more runs are merged in several passes over consecutive runs. Every run file is removed once merged.
+
+    :param paths: the run files in input order
+    :type paths: list
+    :param output_path: the path of censored.tsv
+    :type output_path: str
+    :param columns: the columns of censored.tsv
+    :type columns: list
+    :param fan_in: the number of runs merged at once, see get_fan_in by default
+    :type fan_in: int
+    """
+    fan_in = fan_in or get_fan_in()
+    merges = 0
+    while len(paths) > fan_in:
+        merged = []
+        for start in range(0, len(paths), fan_in):
+            # consecutive runs keep the input order of equal codes
+            merged.append(os.path.join(os.path.dirname(paths[start]), f"merged-{merges}.tsv"))
+            merges += 1
+            with open(merged[-1], "w") as output:
+                merge_runs(paths[start:start + fan_in], output, True)
+            for path in paths[start:start + fan_in]:
+                os.remove(path)
+        paths = merged
+    with open(output_path, "w") as output:
+        output.write("\t".join(columns) + "\n")
+        merge_runs(paths, output, False)
+    for path in paths:
+        os.remove(path)
@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+from engine import RiskTable
+from km import SurvivalCurves, segmented_accumulate, evaluate_curves
+
+def get_first_below(values : np.ndarray, offsets : np.ndarray, threshold : float) -> np.ndarray:
+    """Get the first row of every segment with a value at or below the threshold
+
+    :param values: the values of all segments, every segment has at least one row
+    :type values: np.ndarray
+    :param offsets: the segment boundaries
+    :type offsets: np.ndarray
+    :param threshold: the threshold
+    :type threshold: float
+    :return: the row of every segment, -1 if no value of the segment reaches the threshold
+    :rtype: np.ndarray
+    """
+    rows = np.where(values <= threshold, np.arange(len(values)), len(values))
+    first = np.minimum.reduceat(rows, offsets[:-1])
+    return np.where(first < offsets[1:], first, -1)
+
+def get_quantile_times(curves : SurvivalCurves, probability : float = 0.5) -> pd.DataFrame:
+    """Get the time at which every survival function first drops to the probability, with the confidence interval
+    from the times at which the pointwise confidence limits drop to it (Brookmeyer-Crowley)
+
+    :param curves: the survival curves of all groups, each starting with the time 0 row
+    :type curves: SurvivalCurves
+    :param probability: the survival probability, 0.5 for the median
+    :type probability: float
+    :return: a data frame with the columns 'time' 'lower' 'upper', one row per group, NaN if not reached
+    :rtype: pd.DataFrame
+    """
+    columns = {"time": curves.survival_prob, "lower": curves.conf_int_lower, "upper": curves.conf_int_upper}
+    out = {}
+    for column, values in columns.items():
+        rows = get_first_below(values, curves.offsets, probability)
+        out[column] = np.where(rows >= 0, curves.time[rows], np.nan)
+    return pd.DataFrame(out)
+
+def get_landmark_survival(curves : SurvivalCurves, landmarks : list) -> pd.DataFrame:
+    """Evaluate the survival functions and their confidence intervals at landmark times, see km.evaluate_curves.
+    After the last follow up of a group the survival is unknown (NaN) unless it already dropped to 0.
+
+    :param curves: the survival curves of all groups, each starting with the time 0 row
+    :type curves: SurvivalCurves
+    :param landmarks: the landmark times
+    :type landmarks: list
+    :return: a data frame with the columns 'survival_{t}' 'survival_{t}_lower' 'survival_{t}_upper' for every landmark t, one row per group
+    :rtype: pd.DataFrame
+    """
+    grid = evaluate_curves(curves, landmarks)
+    out = {}
+    for landmark, time in enumerate(grid.time):
+        name = format_time(time)
+        for suffix, values in [("", grid.survival_prob), ("_lower", grid.conf_int_lower), ("_upper", grid.conf_int_upper)]:
+            out[f"survival_{name}{suffix}"] = values[:, landmark]
+    return pd.DataFrame(out, index=range(len(curves.labels)))
+
+def format_time(time : float) -> str:
+    """Format a time for a column name, without decimals if it is whole"""
+    return str(int(time)) if float(time).is_integer() else str(time)
+
+def get_rmst(curves : SurvivalCurves, table : RiskTable, tau : float) -> pd.DataFrame:
+    """Get the restricted mean survival time up to tau, the area under every survival function from 0 to tau,
+    with the variance sum_j A_j^2 d_j / (n_j (n_j - d_j)) over the event times t_j up to tau, where A_j is the area from t_j to tau.
+    The RMST of a group followed up shorter than tau is unknown (NaN) unless its survival already dropped to 0.
+
+    :param curves: the survival curves of all groups, each starting with the time 0 row followed by the rows of the table
+    :type curves: SurvivalCurves
+    :param table: the event/at-risk table of all groups the curves were estimated from
+    :type table: RiskTable
+    :param tau: the time horizon
+    :type tau: float
+    :return: a data frame with the columns 'rmst' 'rmst_variance', one row per group
+    :rtype: pd.DataFrame
+    """
+    # every step spans from its time to the next time of the group (or tau)
+    following = np.append(curves.time[1:], np.inf)
+    following[curves.offsets[1:] - 1] = np.inf
+    width = np.clip(np.minimum(following, tau) - curves.time, 0, None)
+    area = curves.survival_prob * width
+    rmst = np.add.reduceat(area, curves.offsets[:-1])
+
+    # area from every time to tau, the suffix sums within the groups
+    reverse = segmented_accumulate(np.add, area[::-1], len(area) - curves.offsets[::-1])[::-1]
+    # the table rows follow the time 0 row of their group
+    rows = np.ones(len(curves.time), dtype=bool)
+    rows[curves.offsets[:-1]] = False
+    remaining = reverse[rows]
+    d, n = table.n_events.astype(float), table.n_at_risk.astype(float)
+    terms = np.divide(remaining ** 2 * d, n * (n - d), out=np.zeros(len(d)), where=(n > d) & (table.time <= tau))
+    variance = np.add.reduceat(terms, table.offsets[:-1]) if len(terms) else np.zeros(0)
+
+    last = curves.offsets[1:] - 1
+    known = (tau <= curves.time[last]) | (curves.survival_prob[last] == 0)
+    return pd.DataFrame({"rmst": np.where(known, rmst, np.nan), "rmst_variance": np.where(known, variance, np.nan)})
+
+def get_default_tau(curves : SurvivalCurves) -> float:
+    """Get the largest time horizon at which the RMST of all groups is known, the shortest last follow up of the groups"""
+    return float(curves.time[curves.offsets[1:] - 1].min()) if len(curves.labels) else 0.0
+
+def summarize(curves : SurvivalCurves, table : RiskTable, landmarks : list = (365, 1095, 1826), tau : float = None) -> pd.DataFrame:
+    """Summarize the survival function of every group by the number of patients and events, the median survival with its confidence interval,
+    the survival at landmark times and the restricted mean survival time up to tau. Only the estimated curves and tables are used.
+
+    :param curves: the survival curves of all groups (not thinned), each starting with the time 0 row followed by the rows of the table
+    :type curves: SurvivalCurves
+    :param table: the event/at-risk table of all groups the curves were estimated from
+    :type table: RiskTable
+    :param landmarks: the landmark times, by default 1, 3 and 5 years in days
+    :type landmarks: list
+    :param tau: the time horizon of the RMST, by default the shortest last follow up of the groups
+    :type tau: float
+    :return: a data frame with the columns 'dataset_id' 'n' 'events' 'median' 'median_lower' 'median_upper' 'survival_{t}' 'survival_{t}_lower' 'survival_{t}_upper' 'rmst_tau' 'rmst' 'rmst_variance', one row per group
+    :rtype: pd.DataFrame
+    """
+    if tau is None:
+        tau = get_default_tau(curves)
+    # every group has at least one time, everyone is at risk at the first
+    n = table.n_at_risk[table.offsets[:-1]]
+    events = np.add.reduceat(table.n_events, table.offsets[:-1]) if len(table.time) else np.zeros(0, dtype=np.int64)
+    median = get_quantile_times(curves, 0.5)
+    return pd.concat([
+        pd.DataFrame({
+            "dataset_id": curves.labels,
+            "n": n,
+            "events": events,
+            "median": median.time,
+            "median_lower": median.lower,
+            "median_upper": median.upper,
+        }),
+        get_landmark_survival(curves, landmarks),
+        pd.DataFrame({"rmst_tau": np.full(len(curves.labels), float(tau))}),
+        get_rmst(curves, table, tau),
+    ], axis=1)
@@ -0,0 +1,84 @@
+import os
+import sys
+import json
+import signal
+import argparse
+import traceback
+import socketserver
+
+# imported once here, every job forked from this process finds them warm
+import app
+import sksurv.nonparametric
+import sksurv.compare
+from client import get_socket_path
+
+def get_process_limit() -> int:
+    """Get the maximum number of jobs running at the same time
+
+    :return: the value of UNITE_PROCESS_LIMIT or 10
+    :rtype: int
+    """
+    return int(os.environ.get("UNITE_PROCESS_LIMIT", 10))
+
+def run_job(root_path : str) -> dict:
+    """Run the analysis for one process directory and report the outcome
+
+    :param root_path: the process directory containing input.tsv
+    :type root_path: str
+    :return: a dictionary with the key "status" ("ok" or "error") and "error" with the traceback if the job failed
+    :rtype: dict
+    """
+    try:
+        app.main(root_path)
+    except Exception:
+        return {"status": "error", "error": traceback.format_exc()}
+    return {"status": "ok"}
+
+class JobHandler(socketserver.StreamRequestHandler):
+    """Reads one json line {"path": ...} from the client, runs the job and writes the json response back"""
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            response = run_job(request["path"])
+        except Exception:
+            response = {"status": "error", "error": traceback.format_exc()}
+        self.wfile.write((json.dumps(response) + "\n").encode())
+
+class WorkerServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server forking a child per job, so jobs run in parallel and a crashing job can not take the worker down"""
+
+    def __init__(self, socket_path : str, max_children : int = 10):
+        self.max_children = max_children
+        if os.path.exists(socket_path):
+            # stale socket of a previous worker
+            os.remove(socket_path)
+        super().__init__(socket_path, JobHandler)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+def main(socket_path : str, max_children : int):
+    """Serve analysis jobs on a unix socket until terminated
+
+    :param socket_path: the unix socket to listen on
+    :type socket_path: str
+    :param max_children: the maximum number of jobs running at the same time
+    :type max_children: int
+    """
+    server = WorkerServer(socket_path, max_children)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep the survival analysis warm and serve jobs on a unix socket")
+    parser.add_argument("--socket", default=get_socket_path(), help="unix socket to listen on")
+    parser.add_argument("--limit", type=int, default=get_process_limit(), help="maximum number of concurrent jobs")
+    args = parser.parse_args()
+    main(args.socket, args.limit)
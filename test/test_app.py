@@ -4,9 +4,9 @@ import sys
 sys.path.append("./src")
 from app import estimate_survival_function
 import pytest
-from unittest.mock import patch
 import pandas as pd
-from app import get_exit_status,get_survival_days_from_dates, get_survival_days_from_days, get_survival_days, load_data, get_censored_df,  get_dataset_ids,get_subsets,  logrank_test, main
+from app import get_exit_status,get_survival_days_from_dates, get_survival_days_from_days, get_survival_days, load_data, get_censored_df,  get_dataset_ids,get_subsets,  logrank_test, main, get_input_path, derive_survival_days, load_options, check_options, DEFAULT_OPTIONS, analyze, analyze_endpoints
+import json
 import numpy as np
 import os
 from collections import Counter
@@ -50,6 +50,50 @@ def test_load_data():
      expected_columns = ["dataset_id","donor_id","enrolment_date","status","status_change_date","status_change_day"]
      assert list(data.columns) == expected_columns
 
+@pytest.fixture
+def input_path(mock_data_df, tmp_path):
+    mock_data_df["extra_column"] = 1
+    mock_data_df.to_csv(os.path.join(tmp_path, "input.tsv"), sep="\t", index=False)
+    return os.path.join(tmp_path, "input.tsv")
+
+@pytest.mark.parametrize("engine", ["c", "pyarrow"])
+def test_load_data_types(input_path, engine):
+    if engine == "pyarrow":
+        pytest.importorskip("pyarrow")
+    data = load_data(input_path, engine)
+    
+    # only the used columns are read
+    assert list(data.columns) == ["enrolment_date", "status_change_date", "status_change_day", "status", "dataset_id", "donor_id"]
+    # the columns have compact types
+    assert data.dataset_id.dtype == "category"
+    assert data.donor_id.dtype == object
+    assert data.status.dtype == bool
+    assert data.status_change_day.dtype == float
+    assert data.enrolment_date.dtype == "datetime64[ns]"
+    assert data.status_change_date.isna().tolist() == [False, True, False]
+    assert list(data.donor_id) == ["1", "2", "3"]
+
+@pytest.mark.parametrize("file", ["input.parquet", "input.feather"])
+def test_load_data_columnar(input_path, tmp_path, file):
+    pytest.importorskip("pyarrow")
+    data = load_data(input_path)
+    path = os.path.join(tmp_path, file)
+    if file.endswith(".parquet"):
+        pd.read_csv(input_path, sep="\t").to_parquet(path)
+    else:
+        pd.read_csv(input_path, sep="\t").to_feather(path)
+    # the columnar input is preferred over input.tsv
+    assert get_input_path(str(tmp_path)) == path
+    pd.testing.assert_frame_equal(load_data(path), data, check_categorical=False)
+
+def test_load_data_invalid_dates(input_path):
+    with open(input_path, "a") as f:
+        f.write("2020-13-45\t2020-12-01\t5\tTrue\tA\t4\t1\n")
+    data = load_data(input_path)
+    # the valid date column is parsed, the invalid one is left as read
+    assert data.status_change_date.dtype == "datetime64[ns]"
+    assert data.enrolment_date.dtype == "category"
+
 def test_get_dataset_ids(mock_data_df):
     """ test the dataset_ids column is returned or a series of 0s if the column is not present"""
     assert get_dataset_ids(mock_data_df).equals(pd.Series(["A", "B", "A"]))
@@ -137,6 +181,51 @@ def test_get_survival_days(mock_data_df):
     expected_survival_days = pd.Series([20, 14],index=[1,2],name="survival_days",dtype=float)
 
 
+def test_derive_survival_days(mock_data_df):
+    survival_days, valid, report = derive_survival_days(mock_data_df)
+    
+    # the same days as get_survival_days, in compact float32
+    assert survival_days.dtype == np.float32
+    np.testing.assert_array_equal(survival_days, [9, 20, 14])
+    assert valid.all()
+    assert report.empty
+    
+def test_derive_survival_days_report():
+    data = pd.DataFrame({
+        "enrolment_date": ["2020-01-01", "2020-01-01", "2020-02-30", "2020-03-01", None, "2020-01-01"],
+        "status_change_date": ["2020-01-10", "2019-12-01", "2020-03-15", "2020-03-15", None, None],
+        "status_change_day": [None, 5, 14, None, None, -3],
+        "status": [False, True, False, True, True, False],
+        "donor_id": ["1", "2", "3", "4", "5", "6"]
+    })
+    survival_days, valid, report = derive_survival_days(data)
+    
+    # dates are preferred, the day is used if the dates are invalid or give a negative duration
+    np.testing.assert_array_equal(survival_days, [9, 5, 14, 14, np.nan, np.nan])
+    assert list(valid) == [True, True, True, True, False, False]
+    
+    expected = pd.DataFrame({
+        "row": [2, 1, 5, 4],
+        "donor_id": ["3", "2", "6", "5"],
+        "issue": ["unparsable_enrolment_date", "negative_survival_days", "negative_survival_days", "missing_survival_days"],
+        "excluded": [False, False, True, True]
+    })
+    pd.testing.assert_frame_equal(report, expected)
+
+def test_main_excludes_invalid_rows(mock_data_df, tmp_path):
+    mock_data_df["status"] = [True, True, False]
+    mock_data_df["status_change_day"] = [9, 20, None]
+    mock_data_df["status_change_date"] = ["2020-01-10", None, None]
+    mock_data_df.to_csv(os.path.join(tmp_path, "input.tsv"), sep="\t", index=False)
+    main(str(tmp_path))
+    
+    report = pd.read_csv(os.path.join(tmp_path, "validation.tsv"), sep="\t")
+    assert list(report.issue) == ["missing_survival_days"]
+    # the excluded patient is neither in the survival function nor censored
+    result = pd.read_csv(os.path.join(tmp_path, "result.tsv"), sep="\t")
+    assert list(result.time[result.dataset_id == "A"]) == [0, 9]
+    assert pd.read_csv(os.path.join(tmp_path, "censored.tsv"), sep="\t").empty
+
 def test_get_exit_status(mock_data_df):
     exit_status = get_exit_status(mock_data_df)
     
@@ -191,82 +280,214 @@ def test_get_censored_df(mock_data_for_censored):
     }, index=[1, 3])
     pd.testing.assert_frame_equal(result, expected_data)
 
-@pytest.fixture
-def mode():
-    return "progression"
-
-#@pytest.mark.parametrize("mode", ["progression", "survival"])
-
-@patch("app.load_data")
-@patch("app.get_dataset_ids")
-@patch("app.get_subsets")
-@patch("app.get_survival_days")
-@patch("app.get_exit_status")
-@patch("app.get_survival_function_and_censored_dfs")
-@patch("app.logrank_test")
-@patch("app.pd.DataFrame.to_csv")
-def test_main(mock_to_csv, mock_logrank_test, mock_get_survival_function_and_censored_dfs, mock_get_exit_status, mock_get_survival_days, mock_get_subsets, mock_get_dataset_ids, mock_load_data,mock_data_df, tmp_path,mode):
-    # Mock the load_data function to return the mock data
-    mock_load_data.return_value = mock_data_df
-
-    # Mock the get_dataset_ids function to return the dataset_ids
-    mock_get_dataset_ids.return_value = mock_data_df.dataset_id
-    
-    # Mock the get_subsets function to return subsets of the data
-    mock_get_subsets.return_value = ([mock_data_df.iloc[:2], mock_data_df.iloc[2:]], ["A", "B"])
-    
-    # Mock the get_survival_days function to return survival days - 'side effect' is used to return different values for each call
-    mock_get_survival_days.side_effect = [pd.Series([9, 19]), pd.Series([14, 9])]
-    
-    # Mock the get_exit_status function to return exit status
-    mock_get_exit_status.side_effect = [pd.Series([False, True]), pd.Series([False, True])]
-    
-    # Mock the get_survival_function_and_censored_dfs function to return survival functions and censored data frames
-    mock_get_survival_function_and_censored_dfs.side_effect = [
-        (pd.DataFrame({"time": [9, 19], "survival_prob": [0.9, 0.8]}), pd.DataFrame({"donor_id": ["A"], "days_at_censoring": [9]})),
-        (pd.DataFrame({"time": [14, 9], "survival_prob": [0.7, 0.6]}), pd.DataFrame({"donor_id": ["C"], "days_at_censoring": [14]}))
-    ]
-    
-
-    # Mock the logrank_test function to return a DataFrame
-    mock_logrank_test.return_value = pd.DataFrame({"test_statistic": [1.23], "p_value": [0.45]})
-    
+def test_main(mock_data_df, tmp_path):
+    mock_data_df["status"] = [True, True, False]
+    mock_data_df.to_csv(os.path.join(tmp_path, "input.tsv"), sep="\t", index=False)
     
     # Call the main function
     main(str(tmp_path))
     
-    # Check if the load_data function was called
-    mock_load_data.assert_called_once_with(os.path.join(str(tmp_path), "input.tsv"))
+    # Check the result files were written
+    for file in ["result.tsv", "censored.tsv", "logrank_test.tsv"]:
+        assert os.path.exists(os.path.join(tmp_path, file))
     
-    # Check if the get_dataset_ids function was called
-    mock_get_dataset_ids.assert_called_once_with(mock_data_df)
-    
-    # Check if the get_subsets function was called
-    mock_get_subsets.assert_called_once_with(mock_data_df, mock_data_df.dataset_id)
-    
-    # Check if the get_survival_days function was called twice
-    assert mock_get_survival_days.call_count == 2
-    
-    # Check if the get_exit_status function was called twice
-    assert mock_get_exit_status.call_count == 2
-    
-    # Check if the get_survival_function_and_censored_dfs function was called twice
-    assert mock_get_survival_function_and_censored_dfs.call_count == 2
-    
-    # Check if the to_csv function was called for each survival function and censored data frame
-    assert mock_to_csv.call_count == 3
-    
-    # Check if the logrank_test function was called
-    mock_logrank_test.assert_called_once()
+    # the survival functions are the per group estimates, each starting at time 0
+    result = pd.read_csv(os.path.join(tmp_path, "result.tsv"), sep="\t")
+    assert list(result.columns) == ["time", "survival_prob", "conf_int_lower", "conf_int_upper", "dataset_id"]
+    survival_days = get_survival_days(mock_data_df)
+    for l in ["A", "B"]:
+        mask = np.array(mock_data_df.dataset_id == l)
+        expected = estimate_survival_function(survival_days[mask], mock_data_df.status[mask])
+        actual = result[result.dataset_id == l].drop(columns="dataset_id").reset_index(drop=True)
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+    
+    # the censored patients are grouped by dataset_id
+    censored = pd.read_csv(os.path.join(tmp_path, "censored.tsv"), sep="\t", dtype={"donor_id": str})
+    expected = pd.DataFrame({"donor_id": ["3"], "days_at_censoring": [14.0], "dataset_id": ["A"]})
+    pd.testing.assert_frame_equal(censored, expected)
+
+def test_main_single_group(mock_data_df, tmp_path):
+    """ the logrank test is only written if there is more than one group """
+    mock_data_df.drop("dataset_id", axis=1).to_csv(os.path.join(tmp_path, "input.tsv"), sep="\t", index=False)
+    main(str(tmp_path))
+    assert os.path.exists(os.path.join(tmp_path, "result.tsv"))
+    assert not os.path.exists(os.path.join(tmp_path, "logrank_test.tsv"))
+
+@pytest.mark.parametrize("output_format", ["tsv", "parquet", "feather", "json"])
+@pytest.mark.parametrize("float32", [False, True])
+def test_main_output_format(mock_data_df, tmp_path, output_format, float32):
+    if output_format in ("parquet", "feather"):
+        pytest.importorskip("pyarrow")
+    mock_data_df["status"] = [True, True, False]
+    mock_data_df.to_csv(os.path.join(tmp_path, "input.tsv"), sep="\t", index=False)
+    main(str(tmp_path), dict(DEFAULT_OPTIONS, output_format=output_format, float32=float32))
+    path = os.path.join(tmp_path, f"result.{output_format}")
+    if output_format == "tsv":
+        result = pd.read_csv(path, sep="\t")
+    elif output_format == "parquet":
+        result = pd.read_parquet(path)
+    elif output_format == "feather":
+        result = pd.read_feather(path)
+    else:
+        with open(path) as f:
+            result = pd.concat([pd.DataFrame(curve).assign(dataset_id=l) for l, curve in json.load(f).items()], ignore_index=True)
+    result["dataset_id"] = result["dataset_id"].astype(str)
+    # the same survival functions as the default result.tsv
+    main(str(tmp_path))
+    assert not os.path.exists(path) or output_format == "tsv"
+    expected = pd.read_csv(os.path.join(tmp_path, "result.tsv"), sep="\t")
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False, rtol=1e-6 if float32 else 1e-12, atol=1e-7 if float32 else 0)
+
+def test_analyze(mock_data_df, tmp_path):
+    """ analyze gives the results main writes, without touching the input """
+    mock_data_df["status"] = [True, True, False]
+    before = mock_data_df.copy()
+    result = analyze(mock_data_df)
+    pd.testing.assert_frame_equal(mock_data_df, before)
+    mock_data_df.to_csv(os.path.join(tmp_path, "input.tsv"), sep="\t", index=False)
+    main(str(tmp_path))
     
-    # Verify the filenames used in to_csv calls
-    expected_files = [
-        os.path.join(str(tmp_path), "result.tsv"),
-        os.path.join(str(tmp_path), "censored.tsv"),
-        os.path.join(str(tmp_path), "logrank_test.tsv")
-    ]
-    actual_files = [call[0][0] for call in mock_to_csv.call_args_list]
-    assert actual_files == expected_files
+    assert isinstance(result.curves.survival_prob, np.ndarray)
+    assert list(result.curves.labels) == ["A", "B"]
+    pd.testing.assert_frame_equal(result.curves.to_frame(), pd.read_csv(os.path.join(tmp_path, "result.tsv"), sep="\t"), check_dtype=False)
+    pd.testing.assert_frame_equal(result.censored, pd.read_csv(os.path.join(tmp_path, "censored.tsv"), sep="\t", dtype={"donor_id": str}), check_dtype=False)
+    pd.testing.assert_frame_equal(result.logrank, pd.read_csv(os.path.join(tmp_path, "logrank_test.tsv"), sep="\t"))
+    assert result.logrank_pairwise is None
+    assert len(result.validation) == 0
+
+def test_analyze_arrays():
+    """ a dictionary of arrays with days only and without donor_id """
+    result = analyze({
+        "dataset_id": np.array(["A", "A", "B", "B", "C", "C"]),
+        "status": np.array([True, False, True, True, False, True]),
+        "status_change_day": np.array([10.0, 20.0, 5.0, -1.0, 7.0, 30.0]),
+    }, {"logrank_tests": ["logrank", "gehan_wilcoxon"]})
+    assert list(result.censored.donor_id) == ["1", "4"]
+    assert list(result.logrank.test) == ["logrank", "gehan_wilcoxon"]
+    assert len(result.logrank_pairwise) == 3
+    # the negative days are excluded
+    assert list(result.validation.issue) == ["negative_survival_days"]
+    assert list(result.validation.row) == [3]
+    assert np.diff(result.grouped.row_offsets).tolist() == [2, 1, 2]
+    with pytest.raises(ValueError):
+        analyze({"status": np.array([True]), "status_change_day": np.array([1.0])}, {"backend": "R"})
+
+def test_main_endpoints(tmp_path):
+    """ every endpoint gets the results of a run on its own columns, in its subdirectory """
+    rng = np.random.default_rng(0)
+    n = 200
+    data = pd.DataFrame({
+        "dataset_id": rng.choice(["A", "B", "C"], n),
+        "donor_id": [str(i) for i in range(n)],
+        "enrolment_date": "2020-01-01",
+        "os_status": rng.random(n) < 0.5,
+        "os_status_change_date": (pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 900, n), "D")).strftime("%Y-%m-%d"),
+        "pfs_status": rng.random(n) < 0.7,
+        "pfs_status_change_day": rng.integers(0, 500, n).astype(float),
+    })
+    data.loc[0, "os_status_change_date"] = "2019-12-25"
+    process_path = os.path.join(tmp_path, "endpoints")
+    os.makedirs(process_path)
+    data.to_csv(os.path.join(process_path, "input.tsv"), sep="\t", index=False)
+    main(process_path, dict(DEFAULT_OPTIONS, endpoints=["os", "pfs"]))
+    assert sorted(os.listdir(process_path)) == ["input.tsv", "os", "pfs"]
+    for endpoint in ["os", "pfs"]:
+        single_path = os.path.join(tmp_path, endpoint)
+        os.makedirs(single_path)
+        columns = {f"{endpoint}_{c}": c for c in ["status", "status_change_date", "status_change_day"]}
+        data[["dataset_id", "donor_id", "enrolment_date"] + [c for c in columns if c in data.columns]].rename(columns=columns).to_csv(
+            os.path.join(single_path, "input.tsv"), sep="\t", index=False)
+        main(single_path)
+        files = sorted(f for f in os.listdir(single_path) if f != "input.tsv")
+        assert files == sorted(os.listdir(os.path.join(process_path, endpoint)))
+        for file in files:
+            assert open(os.path.join(single_path, file)).read() == open(os.path.join(process_path, endpoint, file)).read()
+    # the negative os duration is reported for os only
+    assert os.path.exists(os.path.join(process_path, "os", "validation.tsv"))
+    assert not os.path.exists(os.path.join(process_path, "pfs", "validation.tsv"))
+
+    results = analyze_endpoints(data, {"endpoints": ["pfs", "os"]})
+    assert list(results) == ["pfs", "os"]
+    with pytest.raises(ValueError):
+        analyze_endpoints(data, {"endpoints": ["dfs"]})
+    with pytest.raises(ValueError):
+        analyze_endpoints(data, {"endpoints": ["os", "os"]})
+
+def test_main_time_grid(mock_data_df, tmp_path):
+    mock_data_df.to_csv(os.path.join(tmp_path, "input.tsv"), sep="\t", index=False)
+    main(str(tmp_path), dict(DEFAULT_OPTIONS, time_grid=[0, 9, 12, 14], float32=True))
+    result = pd.read_csv(os.path.join(tmp_path, "result.tsv"), sep="\t")
+    with np.load(os.path.join(tmp_path, "grid.npz")) as grid:
+        assert list(grid["labels"]) == ["A", "B"]
+        assert grid["survival_prob"].dtype == np.float32 and grid["survival_prob"].shape == (2, 4)
+        # A is censored at 9 and 14, B at 20
+        np.testing.assert_array_equal(grid["survival_prob"], [[1, 1, 1, 1], [1, 1, 1, 1]])
+        assert (grid["conf_int_lower"] <= grid["survival_prob"]).all()
+    main(str(tmp_path), dict(DEFAULT_OPTIONS, time_grid=5))
+    with np.load(os.path.join(tmp_path, "grid.npz")) as grid:
+        np.testing.assert_array_equal(grid["time"], np.linspace(0, result.time.max(), 5))
+    main(str(tmp_path))
+    assert not os.path.exists(os.path.join(tmp_path, "grid.npz"))
+    for time_grid in [0, True, [-1], "daily"]:
+        with pytest.raises(ValueError):
+            analyze(mock_data_df, {"time_grid": time_grid})
+
+@pytest.mark.parametrize("file", ["input.tsv", "input.parquet"])
+def test_main_streaming(tmp_path, file):
+    """ a run in chunks writes the results of a run on the whole input """
+    rng = np.random.default_rng(1)
+    n = 3500
+    data = pd.DataFrame({
+        "dataset_id": rng.choice(["A", "B", "C"], n),
+        "donor_id": [str(i) for i in range(n)],
+        "enrolment_date": "2020-01-01",
+        "status": rng.random(n) < 0.6,
+        "status_change_date": (pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 2000, n), "D")).strftime("%Y-%m-%d"),
+        "status_change_day": rng.integers(0, 2000, n).astype(float),
+    })
+    # a group first appearing in a later chunk, invalid rows in several chunks
+    data.loc[2500:2600, "dataset_id"] = "D"
+    data.loc[[10, 1500, 3400], "status_change_date"] = "2019-12-25"
+    data.loc[[20, 2200], "status_change_date"] = "2020-13-01"
+    data.loc[[30, 3100], ["status_change_date", "status_change_day"]] = None
+    paths = {}
+    for mode, options in [("memory", DEFAULT_OPTIONS), ("streaming", dict(DEFAULT_OPTIONS, memory_budget=2))]:
+        paths[mode] = os.path.join(tmp_path, mode)
+        os.makedirs(paths[mode])
+        if file == "input.tsv":
+            data.to_csv(os.path.join(paths[mode], file), sep="\t", index=False)
+        else:
+            data.to_parquet(os.path.join(paths[mode], file), row_group_size=1000)
+        main(paths[mode], dict(options, landmarks=[100, 1000], metrics=True))
+    files = sorted(f for f in os.listdir(paths["memory"]) if f not in (file, "metrics.json"))
+    assert files == sorted(f for f in os.listdir(paths["streaming"]) if f not in (file, "metrics.json"))
+    for f in files:
+        assert open(os.path.join(paths["memory"], f)).read() == open(os.path.join(paths["streaming"], f)).read(), f
+    with open(os.path.join(paths["streaming"], "metrics.json")) as f:
+        assert json.load(f)["counts"]["chunks"] == 4
+
+    with pytest.raises(MemoryError):
+        main(paths["streaming"], dict(DEFAULT_OPTIONS, memory_budget=0.01))
+    for options in [{"memory_budget": -1}, {"memory_budget": 1, "bootstrap_replicates": 10}, {"memory_budget": 1, "endpoints": ["os"]}]:
+        with pytest.raises(ValueError):
+            check_options(dict(DEFAULT_OPTIONS, **options))
+
+def test_main_options(mock_data_df, tmp_path):
+    """ the given options are completed and checked like the ones of options.json """
+    mock_data_df.to_csv(os.path.join(tmp_path, "input.tsv"), sep="\t", index=False)
+    main(str(tmp_path), {"thinning": 0.01})
+    assert os.path.exists(os.path.join(tmp_path, "result.tsv"))
+    os.remove(os.path.join(tmp_path, "result.tsv"))
+    with pytest.raises(ValueError):
+        main(str(tmp_path), {"output_format": "xml"})
+    assert not os.path.exists(os.path.join(tmp_path, "result.tsv"))
+
+def test_load_options(tmp_path):
+    assert load_options(str(tmp_path)) == DEFAULT_OPTIONS
+    with open(os.path.join(tmp_path, "options.json"), "w") as f:
+        json.dump({"output_format": "xml"}, f)
+    with pytest.raises(ValueError):
+        load_options(str(tmp_path))
 
 def test_logrank_test(mock_survival_data):
     survival, exit_status,dataset_id = mock_survival_data
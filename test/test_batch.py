@@ -0,0 +1,67 @@
+import pytest
+import pandas as pd
+import sys
+sys.path.append("./src")
+import os
+import json
+from batch import get_process_paths, main
+import app
+
+@pytest.fixture
+def process_dirs(tmp_path):
+    data = pd.DataFrame({
+        "dataset_id": ["A", "A", "B", "B"],
+        "donor_id": ["1", "2", "3", "4"],
+        "enrolment_date": [None, None, None, None],
+        "status": [True, False, True, True],
+        "status_change_date": [None, None, None, None],
+        "status_change_day": [10, 20, 5, 30]
+    })
+    paths = []
+    for proc in ["proc-1", "proc-2", "proc-3"]:
+        os.makedirs(os.path.join(tmp_path, proc))
+        data.to_csv(os.path.join(tmp_path, proc, "input.tsv"), sep="\t", index=False)
+        paths.append(os.path.join(tmp_path, proc))
+    # a broken input without the status column
+    data.drop(columns="status").to_csv(os.path.join(paths[1], "input.tsv"), sep="\t", index=False)
+    # a directory without input
+    os.makedirs(os.path.join(tmp_path, "empty"))
+    return paths
+
+def test_get_process_paths(process_dirs, tmp_path):
+    assert get_process_paths([os.path.join(tmp_path, "*")]) == process_dirs
+    # columnar inputs are analysed as well
+    os.makedirs(os.path.join(tmp_path, "proc-4"))
+    pd.read_csv(os.path.join(process_dirs[0], "input.tsv"), sep="\t").to_parquet(os.path.join(tmp_path, "proc-4", "input.parquet"))
+    assert get_process_paths([os.path.join(tmp_path, "*")]) == process_dirs + [os.path.join(tmp_path, "proc-4")]
+    assert get_process_paths([process_dirs[0], process_dirs[0]]) == process_dirs[:1]
+
+def test_main(process_dirs):
+    statuses = main(process_dirs, 2)
+    
+    # the failing job does not affect the others
+    assert [statuses[path]["status"] for path in process_dirs] == ["ok", "error", "ok"]
+    assert "KeyError" in statuses[process_dirs[1]]["error"]
+    for path in process_dirs:
+        with open(os.path.join(path, "status.json")) as f:
+            assert json.load(f)["status"] == statuses[path]["status"]
+    assert os.path.exists(os.path.join(process_dirs[0], "result.tsv"))
+    assert os.path.exists(os.path.join(process_dirs[2], "logrank_test.tsv"))
+
+def test_main_process_killed(process_dirs, monkeypatch):
+    """ a job killing its process fails alone, the jobs sharing the pool with it are run again """
+    analyze_directory = app.main
+    def main_killed(root_path, options=None):
+        if root_path == process_dirs[0]:
+            os._exit(1)
+        analyze_directory(root_path, options)
+    monkeypatch.setattr(app, "main", main_killed)
+    statuses = main(process_dirs, 3)
+
+    assert [statuses[path]["status"] for path in process_dirs] == ["error", "error", "ok"]
+    assert statuses[process_dirs[0]]["error"] == "analysis process terminated abruptly"
+    assert "KeyError" in statuses[process_dirs[1]]["error"]
+    for path in process_dirs:
+        with open(os.path.join(path, "status.json")) as f:
+            assert json.load(f)["status"] == statuses[path]["status"]
+    assert os.path.exists(os.path.join(process_dirs[2], "result.tsv"))
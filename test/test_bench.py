@@ -0,0 +1,48 @@
+import pandas as pd
+import sys
+sys.path.append("./src")
+sys.path.append("./bench")
+import os
+from generate import generate_cohort, write_cohort
+from run import get_cases, get_case_name, compare, get_unmatched
+from app import INPUT_COLUMNS, load_data, derive_survival_days, main
+
+def test_generate_cohort():
+    data = generate_cohort(2000, 5, censored_fraction=0.3, date_fraction=0.5, seed=1)
+    assert list(data.columns) == INPUT_COLUMNS
+    assert len(data) == 2000
+    assert data.donor_id.is_unique
+    assert data.dataset_id.nunique() <= 5
+    assert abs((~data.status).mean() - 0.3) < 0.05
+    # every row has either both dates or the days
+    with_dates = data.enrolment_date.notna()
+    assert (with_dates == data.status_change_date.notna()).all()
+    assert (with_dates != data.status_change_day.notna()).all()
+    assert abs(with_dates.mean() - 0.5) < 0.05
+    pd.testing.assert_frame_equal(data, generate_cohort(2000, 5, censored_fraction=0.3, date_fraction=0.5, seed=1))
+
+def test_write_cohort(tmp_path):
+    write_cohort(str(tmp_path), 500, 3, seed=2)
+    survival_days, valid, report = derive_survival_days(load_data(os.path.join(tmp_path, "input.tsv")))
+    assert valid.all()
+    assert (survival_days >= 0).all()
+    main(str(tmp_path))
+    assert os.path.exists(os.path.join(tmp_path, "result.tsv"))
+    assert os.path.exists(os.path.join(tmp_path, "logrank_pairwise.tsv"))
+
+def test_get_cases():
+    cases = get_cases("quick")
+    names = [get_case_name(case) for case in cases]
+    assert len(names) == len(set(names))
+    assert {case["rows"] for case in cases} == {1000, 10000, 100000}
+    assert max(case["rows"] for case in get_cases("full")) == 10000000
+    assert max(case["groups"] for case in get_cases("full")) == 1000
+
+def test_compare():
+    baseline = {"results": {"a": {"stages": {"load": 1.0, "main": 2.0}}, "b": {"stages": {"load": 0.001}}}}
+    current = {"results": {"a": {"stages": {"load": 1.1, "main": 3.0}}, "b": {"stages": {"load": 0.005}}, "c": {"stages": {"load": 9.0}}}}
+    # b is slower by a factor of 5 but only by milliseconds, c has no baseline
+    assert compare(current, baseline, tolerance=1.25) == [("a", "main", 2.0, 3.0)]
+    assert get_unmatched(current, baseline) == [("c", None)]
+    current["results"]["a"]["stages"]["summary"] = 0.5
+    assert get_unmatched(current, baseline) == [("a", "summary"), ("c", None)]
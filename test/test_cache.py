@@ -0,0 +1,102 @@
+import pytest
+import pandas as pd
+import sys
+sys.path.append("./src")
+import os
+import time
+from unittest.mock import patch
+from cache import ResultCache, get_key, get_cache
+from app import main
+
+@pytest.fixture
+def mock_data_df():
+    data = pd.DataFrame({
+        "enrolment_date": ["2020-01-01", "2020-02-01", "2020-03-01"],
+        "status_change_date": ["2020-01-10", None, "2020-03-15"],
+        "status_change_day": [9, 20, 14],
+        "status": [True, True, False],
+        "dataset_id": ["A", "B", "A"],
+        "donor_id": ["1", "2", "3"]
+    })
+    return data
+
+def test_get_key(mock_data_df, tmp_path):
+    path = os.path.join(tmp_path, "input.tsv")
+    mock_data_df.to_csv(path, sep="\t", index=False)
+    key = get_key(path, {"backend": "numpy"})
+    assert get_key(path, {"backend": "numpy"}) == key
+    # the options and the version do matter
+    assert get_key(path, {"backend": "sksurv"}) != key
+    # entries of an older release are not served
+    assert get_key(path, {"backend": "numpy"}, version=0) != key
+    # and so does every byte of the input
+    changed = mock_data_df.copy()
+    changed.loc[0, "status"] = False
+    changed.to_csv(path, sep="\t", index=False)
+    assert get_key(path, {"backend": "numpy"}) != key
+
+def test_get_cache(tmp_path):
+    with patch.dict(os.environ, {}, clear=True):
+        assert get_cache() is None
+    with patch.dict(os.environ, {"UNITE_CACHE_PATH": str(tmp_path), "UNITE_CACHE_SIZE": "2", "UNITE_CACHE_AGE": "1"}):
+        cache = get_cache()
+    assert cache.max_size == 2 * 1024 * 1024
+    assert cache.max_age == 3600
+
+def test_store_restore(tmp_path):
+    cache = ResultCache(os.path.join(tmp_path, "cache"), 1024, 3600)
+    source, target = os.path.join(tmp_path, "source"), os.path.join(tmp_path, "target")
+    os.makedirs(source)
+    os.makedirs(target)
+    with open(os.path.join(source, "result.tsv"), "w") as f:
+        f.write("time\n0\n")
+    
+    assert not cache.restore("key", target)
+    cache.store("key", source, ["result.tsv", "logrank_test.tsv"])
+    assert cache.restore("key", target)
+    assert open(os.path.join(target, "result.tsv")).read() == "time\n0\n"
+    assert not os.path.exists(os.path.join(target, "logrank_test.tsv"))
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 0}
+
+def test_store_restore_subdirectories(tmp_path):
+    cache = ResultCache(os.path.join(tmp_path, "cache"), 1024, 3600)
+    source, target = os.path.join(tmp_path, "source"), os.path.join(tmp_path, "target")
+    os.makedirs(os.path.join(source, "os"))
+    with open(os.path.join(source, "os", "result.tsv"), "w") as f:
+        f.write("time\n0\n")
+    cache.store("key", source, [os.path.join("os", "result.tsv"), os.path.join("pfs", "result.tsv")])
+    assert cache.restore("key", target)
+    assert open(os.path.join(target, "os", "result.tsv")).read() == "time\n0\n"
+    assert not os.path.exists(os.path.join(target, "pfs"))
+
+def test_evict(tmp_path):
+    cache = ResultCache(os.path.join(tmp_path, "cache"), 10, 3600)
+    with open(os.path.join(tmp_path, "result.tsv"), "w") as f:
+        f.write("12345")
+    for i, key in enumerate(["a", "b", "c"]):
+        cache.store(key, str(tmp_path), ["result.tsv"])
+        os.utime(os.path.join(cache.cache_path, key), (time.time() - 10 + i, time.time() - 10 + i))
+    # evict the least recently used entry to fit into 10 bytes
+    cache.evict()
+    assert sorted(os.listdir(cache.cache_path)) == [".lock", "b", "c", "stats.json"]
+    # evict everything older than the maximum age
+    cache.max_age = 0
+    cache.evict()
+    assert not os.path.exists(os.path.join(cache.cache_path, "b"))
+    assert cache.stats()["evictions"] == 3
+
+def test_main_cached(mock_data_df, tmp_path):
+    process_path = os.path.join(tmp_path, "proc")
+    os.makedirs(process_path)
+    mock_data_df.to_csv(os.path.join(process_path, "input.tsv"), sep="\t", index=False)
+    with patch.dict(os.environ, {"UNITE_CACHE_PATH": os.path.join(tmp_path, "cache")}):
+        main(process_path)
+        result = open(os.path.join(process_path, "result.tsv")).read()
+        # the second run is served from the cache without reading or estimating anything
+        with patch("app.load_data") as mock_load_data, patch("app.group_survival") as mock_group_survival:
+            main(process_path)
+            mock_load_data.assert_not_called()
+            mock_group_survival.assert_not_called()
+        assert get_cache().stats() == {"hits": 1, "misses": 1, "evictions": 0}
+    assert open(os.path.join(process_path, "result.tsv")).read() == result
+    assert os.path.exists(os.path.join(process_path, "logrank_test.tsv"))
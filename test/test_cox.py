@@ -0,0 +1,125 @@
+import pytest
+import numpy as np
+import pandas as pd
+import sys
+sys.path.append("./src")
+import os
+from sksurv.linear_model import CoxPHSurvivalAnalysis
+from sksurv.util import Surv
+from cox import get_design_matrix, fit_cox, get_coefficients, get_global_tests
+from app import analyze, main, DEFAULT_OPTIONS
+
+@pytest.fixture
+def cohort():
+    rng = np.random.default_rng(0)
+    n = 2000
+    x = rng.normal(size=(n, 3))
+    # rounded times with many ties
+    time = np.round(rng.exponential(np.exp(-x @ np.array([0.5, -0.3, 0.0]))) * 20)
+    event = rng.random(n) < 0.7
+    return time, event, x
+
+def get_loglik(time, event, x, beta, ties):
+    """ the log partial likelihood by a loop over the event times """
+    eta = x @ beta
+    loglik = 0.0
+    for t in np.unique(time[event]):
+        tied = (time == t) & event
+        d = tied.sum()
+        at_risk = np.exp(eta[time >= t]).sum()
+        removed = np.exp(eta[tied]).sum() if ties == "efron" else 0.0
+        loglik += eta[tied].sum() - sum(np.log(at_risk - l / d * removed) for l in range(d))
+    return loglik
+
+@pytest.mark.parametrize("ties", ["efron", "breslow"])
+def test_fit_cox_parity(cohort, ties):
+    """ the coefficients and the log partial likelihood are the ones of sksurv """
+    time, event, x = cohort
+    model = fit_cox(time, event, x, ["a", "b", "c"], ties)
+    expected = CoxPHSurvivalAnalysis(ties=ties).fit(x, Surv.from_arrays(event, time))
+    np.testing.assert_allclose(model.coef, expected.coef_, atol=1e-10)
+    assert model.loglik == pytest.approx(get_loglik(time, event, x, model.coef, ties), rel=1e-12)
+    assert model.n == len(time) and model.events == event.sum()
+
+def test_cox_information(cohort):
+    """ the information is the negative Hessian of the log partial likelihood, checked by finite differences of the gradient """
+    time, event, x = cohort
+    model = fit_cox(time, event, x, ["a", "b", "c"], "efron", max_iter=0)
+    # the partial likelihood does not change with centered covariates
+    x = x - x.mean(axis=0)
+    h = 1e-4
+    steps = np.eye(3) * h
+    hessian = np.array([[
+        (get_loglik(time, event, x, a + b, "efron") - get_loglik(time, event, x, a - b, "efron")
+            - get_loglik(time, event, x, b - a, "efron") + get_loglik(time, event, x, -a - b, "efron")) / (4 * h * h)
+        for b in steps] for a in steps])
+    np.testing.assert_allclose(model.information, -hessian, rtol=1e-4)
+    tests = get_global_tests(model)
+    # without iterations the estimate is 0, so all tests are 0 but the score test
+    assert list(tests.test) == ["likelihood_ratio", "wald", "score"]
+    assert tests.chi2[0] == 0 and tests.chi2[1] == 0 and tests.chi2[2] > 0
+
+    fitted = fit_cox(time, event, x, ["a", "b", "c"], "efron")
+    coefficients = get_coefficients(fitted)
+    np.testing.assert_allclose(coefficients.hazard_ratio, np.exp(fitted.coef))
+    assert (coefficients.hr_lower < coefficients.hazard_ratio).all() and (coefficients.hazard_ratio < coefficients.hr_upper).all()
+    # the true effects are found
+    assert coefficients.p[0] < 1e-6 and coefficients.p[1] < 1e-6 and coefficients.p[2] > 1e-3
+    tests = get_global_tests(fitted)
+    np.testing.assert_allclose(tests.chi2, tests.chi2[0], rtol=0.1)
+
+def test_cox_standard_errors(cohort):
+    """ the standard errors agree with the variance of the estimates over simulated cohorts """
+    rng = np.random.default_rng(1)
+    n = 400
+    estimates, errors = [], []
+    for _ in range(200):
+        x = rng.normal(size=(n, 1))
+        time = rng.exponential(np.exp(-0.5 * x[:, 0]))
+        model = fit_cox(time, np.ones(n, dtype=bool), x, ["a"])
+        estimates.append(model.coef[0])
+        errors.append(get_coefficients(model).se[0])
+    assert np.mean(estimates) == pytest.approx(0.5, abs=0.02)
+    assert np.std(estimates) == pytest.approx(np.mean(errors), rel=0.15)
+
+def test_get_design_matrix():
+    covariates = pd.DataFrame({
+        "age": [50.0, np.nan, 70.0, 60.0],
+        "treated": [True, False, True, False],
+        "stage": ["II", "I", "III", None],
+    })
+    x, names, complete = get_design_matrix(covariates)
+    assert names == ["age", "treated", "stage=I", "stage=III"]
+    np.testing.assert_array_equal(complete, [True, False, True, False])
+    np.testing.assert_array_equal(x, [[50, 1, 0, 0], [70, 1, 0, 1]])
+
+def test_fit_cox_collinear(cohort):
+    time, event, x = cohort
+    with pytest.raises(ValueError):
+        fit_cox(time, event, np.column_stack([x[:, 0], 2 * x[:, 0]]), ["a", "b"])
+
+def test_main_cox(tmp_path):
+    rng = np.random.default_rng(2)
+    n = 300
+    data = pd.DataFrame({
+        "dataset_id": rng.choice(["A", "B"], n),
+        "status": rng.random(n) < 0.7,
+        "status_change_day": rng.integers(0, 500, n).astype(float),
+        "age": rng.normal(60, 10, n),
+        "unused": 1,
+    })
+    data.to_csv(os.path.join(tmp_path, "input.tsv"), sep="\t", index=False)
+    options = dict(DEFAULT_OPTIONS, cox_covariates=["age", "dataset_id"], cox_ties="breslow")
+    main(str(tmp_path), options)
+    cox = pd.read_csv(os.path.join(tmp_path, "cox.tsv"), sep="\t")
+    assert list(cox.covariate) == ["age", f"dataset_id={'B' if data.dataset_id[0] == 'A' else 'A'}"]
+    pd.testing.assert_frame_equal(cox, analyze(data, options).cox, check_exact=False)
+    cox_test = pd.read_csv(os.path.join(tmp_path, "cox_test.tsv"), sep="\t")
+    assert list(cox_test.columns) == ["test", "chi2", "df", "p", "n", "events"]
+    assert (cox_test.n == n).all()
+
+    assert analyze(data).cox is None
+    with pytest.raises(ValueError):
+        analyze(data, {"cox_covariates": ["weight"]})
+    with pytest.raises(ValueError):
+        analyze(data, {"cox_covariates": ["age"], "incremental": True})
@@ -0,0 +1,54 @@
+import pytest
+import pandas as pd
+import sys
+sys.path.append("./src")
+import numpy as np
+from sksurv.nonparametric import _compute_counts
+from engine import factorize_groups, build_risk_table, group_survival, get_censored_rows
+
+@pytest.fixture
+def mock_survival_data():
+    survival = pd.Series([5, 10, 15, 20, 25, 10, 5, 30])
+    exit_status = pd.Series([True, False, True, False, True, True, False, True])
+    dataset_id = pd.Series(["A", "B", "A", "B", "A", "A", "B", "C"])
+    return survival, exit_status, dataset_id
+
+def test_factorize_groups(mock_survival_data):
+    _, _, dataset_id = mock_survival_data
+    codes, labels = factorize_groups(dataset_id)
+    # labels are in the order of dataset_id.unique()
+    assert list(labels) == list(dataset_id.unique())
+    assert list(codes) == [0, 1, 0, 1, 0, 0, 1, 2]
+
+def test_group_survival(mock_survival_data):
+    survival, exit_status, dataset_id = mock_survival_data
+    grouped = group_survival(dataset_id, survival, exit_status)
+    
+    # rows are sorted by (group, time)
+    assert list(grouped.time) == [5, 10, 15, 25, 5, 10, 20, 30]
+    assert list(grouped.row_offsets) == [0, 4, 7, 8]
+    assert list(grouped.table.offsets) == [0, 4, 7, 8]
+    
+    # the table of every group matches the counts of sksurv
+    for g, l in enumerate(grouped.labels):
+        mask = np.array(dataset_id == l)
+        times, n_events, n_at_risk, n_censored = _compute_counts(exit_status[mask].values, survival[mask].values.astype(float))
+        rows = slice(grouped.table.offsets[g], grouped.table.offsets[g + 1])
+        np.testing.assert_array_equal(grouped.table.time[rows], times)
+        np.testing.assert_array_equal(grouped.table.n_events[rows], n_events)
+        np.testing.assert_array_equal(grouped.table.n_at_risk[rows], n_at_risk)
+        np.testing.assert_array_equal(grouped.table.n_censored[rows], n_censored)
+
+def test_build_risk_table_counts():
+    """ entries with counts are aggregated like the same number of single rows """
+    table = build_risk_table(np.array([0, 0, 0, 1]), np.array([1.0, 1.0, 2.0, 1.0]), np.array([1, 0, 2, 1]), np.array([2, 1, 3, 1]), np.array(["A", "B"]))
+    assert list(table.time) == [1.0, 2.0, 1.0]
+    assert list(table.n_events) == [1, 2, 1]
+    assert list(table.n_censored) == [2, 1, 0]
+    assert list(table.n_at_risk) == [6, 3, 1]
+
+def test_get_censored_rows(mock_survival_data):
+    survival, exit_status, dataset_id = mock_survival_data
+    grouped = group_survival(dataset_id, survival, exit_status)
+    # grouped by dataset_id, input order within the group
+    assert list(get_censored_rows(grouped)) == [1, 3, 6]
@@ -0,0 +1,91 @@
+import pytest
+import numpy as np
+import pandas as pd
+import sys
+sys.path.append("./src")
+import os
+from app import analyze, update_analysis, main, DEFAULT_OPTIONS
+from incremental import save_state, load_state, build_state, update_state
+
+@pytest.fixture
+def cohort():
+    rng = np.random.default_rng(0)
+    n = 500
+    return pd.DataFrame({
+        "dataset_id": rng.choice(["A", "B", "C"], n),
+        "donor_id": [f"d{i}" for i in range(n)],
+        "status": rng.random(n) < 0.6,
+        "status_change_day": rng.integers(0, 200, n).astype(float),
+    })
+
+def assert_same_results(result, expected):
+    pd.testing.assert_frame_equal(result.curves.to_frame(), expected.curves.to_frame())
+    pd.testing.assert_frame_equal(result.censored, expected.censored)
+    pd.testing.assert_frame_equal(result.logrank, expected.logrank)
+    if expected.logrank_pairwise is None:
+        assert result.logrank_pairwise is None
+    else:
+        pd.testing.assert_frame_equal(result.logrank_pairwise, expected.logrank_pairwise)
+
+def test_update_analysis(cohort):
+    """ the update gives exactly the results of a full analysis of the updated cohort """
+    state = analyze(cohort, {"incremental": True}).state
+    delta = pd.DataFrame({
+        # an updated donor moving to another dataset, an updated censoring, a new donor of a new dataset and an invalid new donor
+        "dataset_id": ["B", cohort.dataset_id[3], "D", "A"],
+        "donor_id": ["d0", "d3", "new1", "new2"],
+        "status": [True, True, False, True],
+        "status_change_day": [77.0, 5.0, 12.0, -1.0],
+    })
+    removed = pd.Series(["d1", "d2", "unknown"])
+    result = update_analysis(state, delta, removed)
+
+    expected_cohort = cohort.set_index("donor_id", drop=False)
+    expected_cohort.loc[["d0", "d3"]] = delta.set_index("donor_id", drop=False).loc[["d0", "d3"]]
+    expected_cohort = pd.concat([expected_cohort.drop(index=["d1", "d2"]), delta.iloc[2:]], ignore_index=True)
+    assert_same_results(result, analyze(expected_cohort))
+    assert list(result.validation.issue) == ["negative_survival_days"]
+    assert "D" in list(result.curves.labels)
+
+def test_update_removes_dataset(cohort):
+    state = analyze(cohort, {"incremental": True}).state
+    result = update_analysis(state, {"donor_id": [], "status": []}, cohort.donor_id[cohort.dataset_id == "A"])
+    assert list(result.curves.labels) == list(pd.unique(cohort.dataset_id[cohort.dataset_id != "A"]))
+    assert_same_results(result, analyze(cohort[cohort.dataset_id != "A"]))
+
+def test_update_state_errors(cohort):
+    state = analyze(cohort, {"incremental": True}).state
+    with pytest.raises(ValueError):
+        update_state(state, ["A", "A"], ["x", "x"], np.array([1.0, 2.0]), [True, True], [])
+    with pytest.raises(ValueError):
+        update_state(state, ["A"], ["d1"], np.array([1.0]), [True], ["d1"])
+    with pytest.raises(ValueError):
+        build_state(pd.Series(["A", "A"]), pd.Series(["x", "x"]), np.array([1.0, 2.0]), pd.Series([True, True]))
+
+def test_save_state(cohort, tmp_path):
+    state = analyze(cohort, {"incremental": True}).state
+    save_state(state, os.path.join(tmp_path, "state.npz"))
+    loaded = load_state(os.path.join(tmp_path, "state.npz"))
+    assert list(loaded.labels) == list(state.labels)
+    assert list(loaded.donor_id) == list(state.donor_id)
+    for field in ["time", "n_events", "n_censored", "n_at_risk", "offsets"]:
+        np.testing.assert_array_equal(getattr(loaded.table, field), getattr(state.table, field))
+    np.testing.assert_array_equal(loaded.survival_days, state.survival_days)
+
+def test_main_incremental(cohort, tmp_path):
+    options = dict(DEFAULT_OPTIONS, incremental=True)
+    cohort.to_csv(os.path.join(tmp_path, "input.tsv"), sep="\t", index=False)
+    main(str(tmp_path), options)
+    assert os.path.exists(os.path.join(tmp_path, "state.npz"))
+
+    cohort.iloc[:5].assign(status=True).to_csv(os.path.join(tmp_path, "delta.tsv"), sep="\t", index=False)
+    pd.DataFrame({"donor_id": ["d10"]}).to_csv(os.path.join(tmp_path, "removed.tsv"), sep="\t", index=False)
+    main(str(tmp_path), options)
+    result = pd.read_csv(os.path.join(tmp_path, "result.tsv"), sep="\t")
+    # applying the same update again changes nothing
+    main(str(tmp_path), options)
+    pd.testing.assert_frame_equal(pd.read_csv(os.path.join(tmp_path, "result.tsv"), sep="\t"), result)
+
+    expected = cohort.drop(index=10)
+    expected.loc[:4, "status"] = True
+    pd.testing.assert_frame_equal(result, analyze(expected).curves.to_frame(), check_dtype=False)
@@ -0,0 +1,85 @@
+import pytest
+import pandas as pd
+import sys
+sys.path.append("./src")
+import numpy as np
+from sksurv.nonparametric import kaplan_meier_estimator
+from engine import group_survival
+from km import kaplan_meier, segmented_accumulate, thin_curves, evaluate_curves
+from app import estimate_survival_function
+
+@pytest.fixture
+def random_survival_data():
+    rng = np.random.default_rng(0)
+    n = 2000
+    survival = pd.Series(rng.integers(0, 500, n).astype(float))
+    exit_status = pd.Series(rng.random(n) < 0.6)
+    # groups of very different sizes, one without events and one where everybody dies
+    dataset_id = pd.Series(rng.choice(["A", "B", "C", "D"], n, p=[0.7, 0.2, 0.09, 0.01]))
+    exit_status[dataset_id == "C"] = False
+    exit_status[dataset_id == "D"] = True
+    return survival, exit_status, dataset_id
+
+def test_segmented_accumulate():
+    values = np.array([1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
+    offsets = np.array([0, 3, 3, 4, 6])
+    np.testing.assert_array_equal(segmented_accumulate(np.add, values, offsets), [1, 3, 6, 4, 5, 11])
+    np.testing.assert_array_equal(segmented_accumulate(np.multiply, values, offsets), [1, 2, 6, 4, 5, 30])
+
+def test_kaplan_meier_parity(random_survival_data):
+    """ the batched estimator gives the estimates of sksurv for every group """
+    survival, exit_status, dataset_id = random_survival_data
+    curves = kaplan_meier(group_survival(dataset_id, survival, exit_status).table)
+    for g, l in enumerate(curves.labels):
+        mask = np.array(dataset_id == l)
+        time, survival_prob, conf_int = kaplan_meier_estimator(exit_status[mask], survival[mask], conf_type="log-log")
+        rows = slice(curves.offsets[g], curves.offsets[g + 1])
+        # time 0 row in front
+        assert curves.time[rows][0] == 0 and curves.survival_prob[rows][0] == 1
+        np.testing.assert_array_equal(curves.time[rows][1:], time)
+        np.testing.assert_array_equal(curves.survival_prob[rows][1:], survival_prob)
+        np.testing.assert_allclose(curves.conf_int_lower[rows][1:], conf_int[0], rtol=1e-12)
+        np.testing.assert_allclose(curves.conf_int_upper[rows][1:], conf_int[1], rtol=1e-12)
+
+@pytest.mark.parametrize("backend", ["numpy", "sksurv"])
+def test_estimate_survival_function_backend(random_survival_data, backend):
+    survival, exit_status, _ = random_survival_data
+    result = estimate_survival_function(survival, exit_status, backend)
+    expected = estimate_survival_function(survival, exit_status, "sksurv")
+    pd.testing.assert_frame_equal(result, expected, rtol=1e-12)
+
+@pytest.mark.parametrize("tolerance", [0.001, 0.01, 0.1])
+def test_thin_curves(random_survival_data, tolerance):
+    """ the thinned step curves stay within tolerance of the full ones at every time """
+    survival, exit_status, dataset_id = random_survival_data
+    curves = kaplan_meier(group_survival(dataset_id, survival, exit_status).table)
+    thinned = thin_curves(curves, tolerance)
+    assert len(thinned.time) < len(curves.time)
+    for g in range(len(curves.labels)):
+        full = slice(curves.offsets[g], curves.offsets[g + 1])
+        thin = slice(thinned.offsets[g], thinned.offsets[g + 1])
+        # first and last point are kept
+        assert thinned.time[thin][0] == curves.time[full][0] and thinned.time[thin][-1] == curves.time[full][-1]
+        # the value shown after every distinct time is the one of its last row
+        last = np.append(curves.time[full][1:] != curves.time[full][:-1], True)
+        index = np.searchsorted(thinned.time[thin], curves.time[full][last], side="right") - 1
+        for column in ["survival_prob", "conf_int_lower", "conf_int_upper"]:
+            assert np.abs(getattr(thinned, column)[thin][index] - getattr(curves, column)[full][last]).max() < tolerance
+    assert thin_curves(curves, 0) is curves
+
+def test_evaluate_curves(random_survival_data):
+    """ every curve on the grid is its step function at the grid times """
+    survival, exit_status, dataset_id = random_survival_data
+    curves = kaplan_meier(group_survival(dataset_id, survival, exit_status).table)
+    time = np.array([0, 0.5, 10, 100, 250.5, 499, 499.5, 1000])
+    grid = evaluate_curves(curves, time)
+    assert grid.survival_prob.shape == (4, len(time))
+    for g, label in enumerate(grid.labels):
+        rows = slice(curves.offsets[g], curves.offsets[g + 1])
+        index = np.searchsorted(curves.time[rows], time, side="right") - 1
+        last_time, last_survival = curves.time[rows][-1], curves.survival_prob[rows][-1]
+        known = (time <= last_time) | (last_survival == 0)
+        np.testing.assert_array_equal(grid.survival_prob[g], np.where(known, curves.survival_prob[rows][index], np.nan))
+        np.testing.assert_array_equal(grid.conf_int_upper[g], np.where(known, curves.conf_int_upper[rows][index], np.nan))
+    # everybody in D died, so its survival stays known at 0
+    assert grid.survival_prob[list(grid.labels).index("D"), -1] == 0
@@ -0,0 +1,119 @@
+import pytest
+import pandas as pd
+import sys
+sys.path.append("./src")
+import numpy as np
+from sksurv.compare import compare_survival
+from engine import group_survival
+from logrank import get_risk_matrix, get_pooled_totals, pairwise_logrank, pairwise_logrank_blocks, adjust_holm, adjust_bh, weighted_logrank, weighted_logrank_blocks
+
+@pytest.fixture
+def random_survival_data():
+    rng = np.random.default_rng(1)
+    n = 600
+    dataset_id = pd.Series(rng.choice(["A", "B", "C", "D"], n))
+    # group B has a worse survival
+    survival = pd.Series(rng.integers(1, 300, n) / np.where(dataset_id == "B", 2, 1)).round()
+    exit_status = pd.Series(rng.random(n) < 0.7)
+    return survival, exit_status, dataset_id
+
+def get_structured_array(survival, exit_status):
+    survival_data = np.zeros(len(survival), dtype=[('status', bool), ('time', float)])
+    survival_data['status'] = exit_status
+    survival_data['time'] = survival
+    return survival_data
+
+def test_get_risk_matrix():
+    grouped = group_survival(pd.Series(["A", "A", "A", "B", "B"]), pd.Series([1, 3, 5, 2, 3]), pd.Series([True, False, True, True, True]))
+    matrix = get_risk_matrix(grouped.table)
+    # the pooled event times, the censored time 3 of A is an event time of B
+    np.testing.assert_array_equal(matrix.time, [1, 2, 3, 5])
+    np.testing.assert_array_equal(matrix.n_at_risk, [[3, 2, 2, 1], [2, 2, 1, 0]])
+    np.testing.assert_array_equal(matrix.n_events, [[1, 0, 0, 1], [0, 1, 1, 0]])
+
+def test_pairwise_logrank(random_survival_data):
+    survival, exit_status, dataset_id = random_survival_data
+    grouped = group_survival(dataset_id, survival, exit_status)
+    result = pairwise_logrank(get_risk_matrix(grouped.table))
+    
+    assert list(result.columns) == ["dataset_id_1", "dataset_id_2", "chi2", "p", "p_holm", "p_bh"]
+    assert len(result) == 6
+    # every pair gives the two-sample test of sksurv on the pair only
+    for _, row in result.iterrows():
+        mask = np.array(dataset_id.isin([row.dataset_id_1, row.dataset_id_2]))
+        chi2, p = compare_survival(get_structured_array(survival[mask], exit_status[mask]), dataset_id[mask])
+        assert row.chi2 == pytest.approx(chi2, rel=1e-9)
+        assert row.p == pytest.approx(p, rel=1e-9)
+    # B differs from the others
+    assert (result.p_holm[(result.dataset_id_1 == "B") | (result.dataset_id_2 == "B")] < 0.05).all()
+
+def test_pairwise_logrank_sparse():
+    """ groups with few event times, a short follow up and no events give the tests of sksurv on every pair """
+    rng = np.random.default_rng(2)
+    dataset_id = pd.Series(np.repeat(["A", "B", "C", "D"], [200, 30, 40, 20]))
+    survival = pd.Series(np.concatenate([rng.integers(0, 500, 200), rng.integers(0, 500, 30), rng.integers(0, 10, 40), rng.integers(0, 500, 20)]).astype(float))
+    exit_status = pd.Series(np.concatenate([rng.random(200) < 0.5, rng.random(30) < 0.2, rng.random(40) < 0.5, np.zeros(20, dtype=bool)]))
+    result = pairwise_logrank(get_risk_matrix(group_survival(dataset_id, survival, exit_status).table))
+    for _, row in result.iterrows():
+        mask = np.array(dataset_id.isin([row.dataset_id_1, row.dataset_id_2]))
+        chi2, _ = compare_survival(get_structured_array(survival[mask], exit_status[mask]), dataset_id[mask])
+        assert row.chi2 == pytest.approx(chi2, rel=1e-9)
+
+def test_adjust():
+    p = np.array([0.01, 0.04, 0.03, np.nan, 0.005])
+    # values of R p.adjust
+    np.testing.assert_allclose(adjust_holm(p), [0.03, 0.06, 0.06, np.nan, 0.02])
+    np.testing.assert_allclose(adjust_bh(p), [0.02, 0.04, 0.04, np.nan, 0.02])
+
+def brute_force_logrank(survival, exit_status, dataset_id, weight):
+    """ the weighted k-sample test looping over the event times """
+    labels = sorted(dataset_id.unique())
+    statistic = np.zeros(len(labels))
+    covariance = np.zeros((len(labels), len(labels)))
+    survival_before = 1.0
+    for t in np.unique(survival[exit_status]):
+        n = np.array([(survival[dataset_id == l] >= t).sum() for l in labels], dtype=float)
+        d = np.array([((survival[dataset_id == l] == t) & exit_status[dataset_id == l]).sum() for l in labels], dtype=float)
+        N, D = n.sum(), d.sum()
+        w = weight(N, survival_before)
+        statistic += w * (d - n * D / N)
+        if N > 1:
+            covariance += w ** 2 * D * (N - D) / (N - 1) * (np.diag(n / N) - np.outer(n / N, n / N))
+        survival_before *= 1 - D / N
+    return np.linalg.solve(covariance[:-1, :-1], statistic[:-1]) @ statistic[:-1]
+
+def test_weighted_logrank(random_survival_data):
+    survival, exit_status, dataset_id = random_survival_data
+    grouped = group_survival(dataset_id, survival, exit_status)
+    tests = ["logrank", "gehan_wilcoxon", "tarone_ware", "fleming_harrington"]
+    result = weighted_logrank(get_risk_matrix(grouped.table), tests, (1, 1))
+    
+    assert list(result.columns) == ["test", "chi2", "p"]
+    assert list(result.test) == tests
+    # the unweighted test is the one of sksurv
+    chi2, p = compare_survival(get_structured_array(survival, exit_status), dataset_id)
+    assert result.chi2[0] == pytest.approx(chi2, rel=1e-9)
+    assert result.p[0] == pytest.approx(p, rel=1e-9)
+    # the weighted tests
+    weights = [lambda N, S: 1, lambda N, S: N, lambda N, S: np.sqrt(N), lambda N, S: S * (1 - S)]
+    for i, weight in enumerate(weights):
+        assert result.chi2[i] == pytest.approx(brute_force_logrank(survival, exit_status, dataset_id, weight), rel=1e-9)
+
+@pytest.mark.parametrize("max_cells", [1, 10, 1000, 1 << 20])
+def test_logrank_blocks(random_survival_data, max_cells):
+    """ summing over blocks of event times gives the tests of the whole risk matrix """
+    survival, exit_status, dataset_id = random_survival_data
+    table = group_survival(dataset_id, survival, exit_status).table
+    matrix = get_risk_matrix(table)
+    n_total, d_total = get_pooled_totals(table)
+    np.testing.assert_array_equal(n_total, matrix.n_at_risk.sum(axis=0))
+    np.testing.assert_array_equal(d_total, matrix.n_events.sum(axis=0))
+    tests = ["logrank", "gehan_wilcoxon", "tarone_ware", "fleming_harrington"]
+    pd.testing.assert_frame_equal(weighted_logrank_blocks(table, tests, (1, 1), max_cells), weighted_logrank(matrix, tests, (1, 1)), rtol=1e-12)
+    pd.testing.assert_frame_equal(pairwise_logrank_blocks(table, max_cells), pairwise_logrank(matrix), rtol=1e-12)
+
+def test_weighted_logrank_unknown_test(random_survival_data):
+    survival, exit_status, dataset_id = random_survival_data
+    grouped = group_survival(dataset_id, survival, exit_status)
+    with pytest.raises(ValueError):
+        weighted_logrank(get_risk_matrix(grouped.table), ["peto"])
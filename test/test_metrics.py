@@ -0,0 +1,61 @@
+import pytest
+import pandas as pd
+import sys
+sys.path.append("./src")
+import os
+import json
+import pstats
+from unittest.mock import patch
+from metrics import Metrics
+from app import main
+
+@pytest.fixture
+def process_dir(tmp_path):
+    data = pd.DataFrame({
+        "dataset_id": ["A", "A", "B", "B"],
+        "donor_id": ["1", "2", "3", "4"],
+        "enrolment_date": [None, None, None, None],
+        "status": [True, False, True, True],
+        "status_change_date": [None, None, None, None],
+        "status_change_day": [10, 20, 5, 30]
+    })
+    data.to_csv(os.path.join(tmp_path, "input.tsv"), sep="\t", index=False)
+    return str(tmp_path)
+
+def test_metrics():
+    metrics = Metrics(True)
+    for _ in range(2):
+        with metrics.stage("load"):
+            sum(range(1000))
+    metrics.count(rows=10)
+    result = metrics.to_dict()
+    assert result["stages"]["load"]["calls"] == 2
+    assert result["stages"]["load"]["wall_time"] > 0
+    assert result["counts"] == {"rows": 10}
+    assert result["peak_rss_mb"] > 0
+
+def test_metrics_disabled(tmp_path):
+    metrics = Metrics(False)
+    with metrics.stage("load"):
+        pass
+    metrics.count(rows=10)
+    metrics.write(os.path.join(tmp_path, "metrics.json"))
+    assert metrics.stages == {} and metrics.counts == {}
+    assert not os.path.exists(os.path.join(tmp_path, "metrics.json"))
+
+def test_main_metrics(process_dir):
+    with patch.dict(os.environ, {"UNITE_METRICS": "1", "UNITE_PROFILE": "1"}):
+        main(process_dir)
+    with open(os.path.join(process_dir, "metrics.json")) as f:
+        metrics = json.load(f)
+    assert set(metrics["stages"]) == {"load", "survival_days", "grouping", "kaplan_meier", "summary", "censored", "logrank", "write"}
+    assert metrics["stages"]["write"]["calls"] == 4
+    assert metrics["counts"] == {"rows": 4, "excluded_rows": 0, "groups": 2, "distinct_times": 4, "curve_points": 6}
+    # the profile can be read with pstats
+    assert pstats.Stats(os.path.join(process_dir, "profile.prof")).total_calls > 0
+
+def test_main_no_metrics(process_dir):
+    with patch.dict(os.environ, {"UNITE_METRICS": "", "UNITE_PROFILE": ""}):
+        main(process_dir)
+    assert not os.path.exists(os.path.join(process_dir, "metrics.json"))
+    assert not os.path.exists(os.path.join(process_dir, "profile.prof"))
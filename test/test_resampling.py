@@ -0,0 +1,88 @@
+import pytest
+import numpy as np
+import pandas as pd
+import sys
+sys.path.append("./src")
+from engine import group_survival
+from km import kaplan_meier
+from logrank import get_risk_matrix, weighted_logrank, get_weights, get_chi2
+from resampling import batch_kaplan_meier, get_time_starts, bootstrap_bands, permutation_logrank
+from app import analyze
+
+@pytest.fixture
+def grouped():
+    rng = np.random.default_rng(0)
+    n = 600
+    dataset_id = pd.Series(rng.choice(["A", "B", "C"], n))
+    survival = pd.Series(rng.integers(0, 300, n).astype(float))
+    exit_status = pd.Series(rng.random(n) < 0.6)
+    return group_survival(dataset_id, survival, exit_status)
+
+def test_batch_kaplan_meier(grouped):
+    """ with unit weights the batched estimator gives the Kaplan-Meier estimate """
+    curves = kaplan_meier(grouped.table)
+    rows = slice(grouped.row_offsets[0], grouped.row_offsets[1])
+    survival = batch_kaplan_meier(np.ones((2, rows.stop)), grouped.event[rows].astype(float), get_time_starts(grouped.time[rows]))
+    np.testing.assert_allclose(survival[1], curves.survival_prob[curves.offsets[0] + 1:curves.offsets[1]], rtol=1e-12)
+
+def test_get_chi2_batch(grouped):
+    """ the chi2 of a batch of risk matrices is the one of every matrix on its own """
+    matrix = get_risk_matrix(grouped.table)
+    tests = ["logrank", "tarone_ware"]
+    weights = get_weights(matrix, tests)
+    batch = get_chi2(np.stack([matrix.n_at_risk, matrix.n_at_risk[::-1]]), np.stack([matrix.n_events, matrix.n_events[::-1]]), weights)
+    np.testing.assert_allclose(batch[0], weighted_logrank(matrix, tests).chi2, rtol=1e-10)
+    np.testing.assert_allclose(batch[1], batch[0], rtol=1e-10)
+
+def test_bootstrap_bands(grouped):
+    bands = bootstrap_bands(grouped, 200, seed=1, threads=1)
+    curves = kaplan_meier(grouped.table).to_frame()
+    pd.testing.assert_series_equal(bands.time, curves.time)
+    pd.testing.assert_series_equal(bands.dataset_id, curves.dataset_id.astype(object), check_dtype=False)
+    assert (bands.band_lower <= curves.survival_prob + 1e-12).all() and (curves.survival_prob <= bands.band_upper + 1e-12).all()
+    # the simultaneous band is wider than the pointwise intervals somewhere
+    assert ((bands.band_upper - bands.band_lower) > (curves.conf_int_upper - curves.conf_int_lower)).any()
+    # the same seed gives the same bands with any number of threads
+    pd.testing.assert_frame_equal(bootstrap_bands(grouped, 200, seed=1, threads=3), bands)
+    assert not bootstrap_bands(grouped, 200, seed=2).equals(bands)
+
+def test_permutation_logrank(grouped):
+    matrix = get_risk_matrix(grouped.table)
+    tests = ["logrank", "gehan_wilcoxon"]
+    p = permutation_logrank(grouped, matrix, tests, replicates=2000, seed=1, threads=1)
+    np.testing.assert_array_equal(permutation_logrank(grouped, matrix, tests, replicates=2000, seed=1, threads=2), p)
+    # close to the asymptotic p-values for a cohort of this size
+    np.testing.assert_allclose(p, weighted_logrank(matrix, tests).p, atol=0.05)
+
+def test_permutation_logrank_separated():
+    """ groups without any overlap are never matched by a permutation """
+    grouped = group_survival(pd.Series(["A"] * 10 + ["B"] * 10), pd.Series(np.arange(20, dtype=float)), pd.Series([True] * 20))
+    p = permutation_logrank(grouped, get_risk_matrix(grouped.table), ["logrank"], replicates=999, seed=0)
+    assert p[0] == pytest.approx(1 / 1000)
+
+def test_analyze_resampling():
+    rng = np.random.default_rng(3)
+    data = {
+        "dataset_id": rng.choice(["A", "B"], 100),
+        "status": rng.random(100) < 0.7,
+        "status_change_day": rng.integers(0, 100, 100).astype(float),
+    }
+    result = analyze(data, {"bootstrap_replicates": 100, "permutation_replicates": 100})
+    assert list(result.logrank.columns) == ["test", "chi2", "p", "p_permutation"]
+    assert list(pd.unique(result.bands.dataset_id)) == list(result.curves.labels)
+    assert analyze(data).bands is None
+
+def test_permutation_logrank_undefined():
+    """ without events the tests are undefined, also under permutation """
+    result = analyze({"dataset_id": ["a", "a", "b", "b"], "status": [False] * 4, "status_change_day": [1.0, 2.0, 3.0, 4.0]}, {"permutation_replicates": 100})
+    assert np.isnan(result.logrank.chi2).all() and np.isnan(result.logrank.p_permutation).all()
+    # a permutation leaving a group without anyone at risk at the only event has no chi2, it counts as at least the observed
+    grouped = group_survival(pd.Series(["a", "b", "a", "b"]), pd.Series([1.0, 2.0, 3.0, 4.0]), pd.Series([False, False, True, False]))
+    p = permutation_logrank(grouped, get_risk_matrix(grouped.table), ["logrank"], replicates=99, seed=0)
+    assert p[0] == 1
+
+def test_bootstrap_bands_empty():
+    """ without any valid row the bands are empty like the other results """
+    result = analyze({"dataset_id": ["A", "B"], "status": [True, False], "status_change_day": [-1.0, np.nan]}, {"bootstrap_replicates": 10})
+    assert list(result.bands.columns) == ["time", "band_lower", "band_upper", "dataset_id"]
+    assert len(result.bands) == 0 and len(result.curves.time) == 0
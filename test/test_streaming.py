@@ -0,0 +1,60 @@
+import pytest
+import numpy as np
+import pandas as pd
+import sys
+sys.path.append("./src")
+import os
+from streaming import reduce_chunk, merge_chunks, check_analysis_memory, write_censored_run, merge_censored_runs
+
+@pytest.mark.parametrize("fan_in", [2, 3, 64])
+def test_merge_censored_runs(tmp_path, fan_in):
+    """ merging in several passes gives the single pass result and leaves no runs behind """
+    rng = np.random.default_rng(0)
+    columns = ["donor_id", "days_at_censoring", "dataset_id"]
+    paths, frames = [], []
+    for run in range(10):
+        codes = rng.integers(0, 4, 20)
+        frame = pd.DataFrame({"donor_id": [f"{run}-{i}" for i in range(20)], "days_at_censoring": rng.random(20).astype(np.float32), "dataset_id": codes.astype(str)})
+        paths.append(os.path.join(tmp_path, f"{run}.tsv"))
+        write_censored_run(paths[-1], frame, codes)
+        frames.append(frame)
+    output_path = os.path.join(tmp_path, "censored.tsv")
+    merge_censored_runs(paths, output_path, columns, fan_in)
+
+    expected = pd.concat(frames, ignore_index=True)
+    expected = expected.iloc[np.argsort(expected.dataset_id.to_numpy(), kind="stable")]
+    with open(output_path) as f:
+        assert f.read() == expected.to_csv(sep="\t", index=False)
+    assert os.listdir(tmp_path) == ["censored.tsv"]
+
+def test_merge_chunks():
+    """ merging the chunks at once and in several merges gives the table of all rows, with groups appearing in later chunks """
+    rng = np.random.default_rng(1)
+    n = 1000
+    codes = np.sort(rng.integers(0, 5, n))[rng.permutation(n)]
+    codes[:300] = np.minimum(codes[:300], 2)
+    labels = np.array(["A", "B", "C", "D", "E"], dtype=object)
+    survival_days = rng.integers(0, 50, n).astype(float)
+    exit_status = rng.random(n) < 0.6
+    expected = reduce_chunk(codes, survival_days, exit_status, labels)
+    chunks = [reduce_chunk(codes[start:start + 300], survival_days[start:start + 300], exit_status[start:start + 300], labels[:3] if start == 0 else labels)
+        for start in range(0, n, 300)]
+    table = reduce_chunk(codes[:0], survival_days[:0], exit_status[:0], labels[:0])
+    for merges in [[chunks], [chunks[:1], chunks[1:3], chunks[3:]]]:
+        merged = table
+        for merge in merges:
+            merged = merge_chunks(merged, merge, labels)
+        for field in expected._fields:
+            np.testing.assert_array_equal(getattr(merged, field), getattr(expected, field))
+
+def test_check_analysis_memory():
+    """ the steps after the last chunk are checked before they start, the blocks of the logrank tests take the memory left """
+    table = reduce_chunk(np.repeat(np.arange(100), 10), np.tile(np.arange(10.0), 100), np.ones(1000, dtype=bool), np.arange(100).astype(str).astype(object))
+    cells = check_analysis_memory(table, 0, True, 2 * 1024 ** 2)
+    assert cells >= 100
+    assert check_analysis_memory(table, 0, True, 4 * 1024 ** 2) > cells
+    # the time grid or the pairs of groups do not fit
+    with pytest.raises(MemoryError, match="time grid"):
+        check_analysis_memory(table, 1000, False, 2 * 1024 ** 2)
+    with pytest.raises(MemoryError, match="pairwise"):
+        check_analysis_memory(table, 0, True, 0.5 * 1024 ** 2)
@@ -0,0 +1,95 @@
+import pytest
+import numpy as np
+import pandas as pd
+import sys
+sys.path.append("./src")
+import os
+from sksurv.nonparametric import kaplan_meier_estimator
+from engine import group_survival
+from km import kaplan_meier
+from summary import summarize, get_first_below
+from app import main, analyze, DEFAULT_OPTIONS
+
+@pytest.fixture
+def grouped():
+    rng = np.random.default_rng(0)
+    n = 1000
+    dataset_id = pd.Series(rng.choice(["A", "B", "C"], n, p=[0.6, 0.3, 0.1]))
+    survival = pd.Series(rng.integers(0, 2000, n).astype(float))
+    exit_status = pd.Series(rng.random(n) < 0.7)
+    # everybody in C dies, A and B end censored
+    exit_status[dataset_id == "C"] = True
+    exit_status[(dataset_id != "C") & (survival >= 1990)] = False
+    return group_survival(dataset_id, survival, exit_status)
+
+def get_step_function(grouped, g):
+    """ the Kaplan-Meier estimate of a group by sksurv, starting at time 0 """
+    rows = slice(grouped.row_offsets[g], grouped.row_offsets[g + 1])
+    time, survival = kaplan_meier_estimator(grouped.event[rows], grouped.time[rows])
+    return np.append(0.0, time), np.append(1.0, survival)
+
+def test_get_first_below():
+    values = np.array([1.0, 0.6, 0.5, 0.4, 1.0, 0.9, 1.0, 0.2])
+    offsets = np.array([0, 4, 6, 8])
+    np.testing.assert_array_equal(get_first_below(values, offsets, 0.5), [2, -1, 7])
+
+def test_summarize(grouped):
+    """ median, landmark survival and RMST agree with a direct evaluation of the step functions """
+    summary = summarize(kaplan_meier(grouped.table), grouped.table, [0, 365, 1000.5], tau=1500)
+    assert list(summary.dataset_id) == list(grouped.labels)
+    for g in range(len(grouped.labels)):
+        time, survival = get_step_function(grouped, g)
+        row = summary.iloc[g]
+        assert row.n == grouped.row_offsets[g + 1] - grouped.row_offsets[g]
+        assert row.events == grouped.event[grouped.row_offsets[g]:grouped.row_offsets[g + 1]].sum()
+        assert row["median"] == time[np.argmax(survival <= 0.5)]
+        assert row.median_lower <= row["median"] <= row.median_upper
+        for landmark, column in [(0, "survival_0"), (365, "survival_365"), (1000.5, "survival_1000.5")]:
+            assert row[column] == pytest.approx(survival[np.searchsorted(time, landmark, side="right") - 1])
+            assert row[f"{column}_lower"] <= row[column] <= row[f"{column}_upper"]
+        # the area under the step function on a fine grid
+        grid = np.linspace(0, 1500, 1500001)
+        expected = (survival[np.searchsorted(time, grid[:-1], side="right") - 1] * np.diff(grid)).sum()
+        assert row.rmst == pytest.approx(expected, rel=1e-6)
+        assert row.rmst_variance > 0
+
+def test_summarize_rmst_variance():
+    """ the RMST variance of a small sample computed by hand """
+    grouped = group_survival(pd.Series(["A"] * 4), pd.Series([1.0, 2.0, 3.0, 4.0]), pd.Series([True, False, True, False]))
+    summary = summarize(kaplan_meier(grouped.table), grouped.table, [], tau=4)
+    # S = 1 on [0, 1), 3/4 on [1, 3), 3/8 on [3, 4)
+    assert summary.rmst[0] == pytest.approx(1 + 2 * 0.75 + 0.375)
+    # sum over the event times of (area from the time to tau)^2 d / (n (n - d))
+    assert summary.rmst_variance[0] == pytest.approx((2 * 0.75 + 0.375) ** 2 / (4 * 3) + 0.375 ** 2 / (2 * 1))
+
+def test_summarize_beyond_follow_up(grouped):
+    """ after the last follow up the survival is unknown unless everybody died """
+    table = grouped.table
+    summary = summarize(kaplan_meier(table), table, [5000], tau=5000)
+    died = summary.dataset_id == "C"
+    assert (summary.survival_5000[died] == 0).all() and summary.survival_5000[~died].isna().all()
+    assert summary.rmst[~died].isna().all() and summary.rmst[died].notna().all()
+    # by default the horizon is the shortest last follow up
+    summary = summarize(kaplan_meier(table), table)
+    assert summary.rmst_tau[0] == min(table.time[end - 1] for end in table.offsets[1:])
+    assert summary.rmst.notna().all()
+    assert list(summary.columns[6:9]) == ["survival_365", "survival_365_lower", "survival_365_upper"]
+
+def test_main_summary(tmp_path):
+    pd.DataFrame({
+        "dataset_id": ["A", "A", "A", "B", "B"],
+        "status": [True, True, False, True, False],
+        "status_change_day": [10, 20, 30, 5, 40],
+    }).to_csv(os.path.join(tmp_path, "input.tsv"), sep="\t", index=False)
+    main(str(tmp_path), dict(DEFAULT_OPTIONS, landmarks=[15], rmst_tau=25, thinning=0.5))
+    summary = pd.read_csv(os.path.join(tmp_path, "summary.tsv"), sep="\t")
+    assert list(summary.dataset_id) == ["A", "B"]
+    assert list(summary["median"]) == [20, 5]
+    assert list(summary.survival_15) == pytest.approx([2 / 3, 0.5])
+    assert list(summary.rmst) == pytest.approx([10 + 10 * 2 / 3 + 5 / 3, 5 + 20 * 0.5])
+
+def test_summary_options():
+    data = {"status": np.array([True]), "status_change_day": np.array([1.0])}
+    for options in [{"landmarks": [-1]}, {"landmarks": ["1y"]}, {"rmst_tau": 0}]:
+        with pytest.raises(ValueError):
+            analyze(data, options)
@@ -0,0 +1,60 @@
+import pytest
+import pandas as pd
+import sys
+sys.path.append("./src")
+import os
+import threading
+from unittest.mock import patch
+import client
+from client import submit
+from worker import WorkerServer, run_job
+
+@pytest.fixture
+def process_dir(tmp_path):
+    data = pd.DataFrame({
+        "dataset_id": ["A", "A", "A", "B", "B", "B"],
+        "donor_id": ["1", "2", "3", "4", "5", "6"],
+        "enrolment_date": ["2020-01-01", "2020-01-01", None, "2020-01-01", "2020-01-01", "2020-01-01"],
+        "status": [True, False, True, True, True, False],
+        "status_change_date": ["2020-02-01", "2020-03-01", None, "2020-01-20", "2020-04-01", "2020-05-01"],
+        "status_change_day": [None, None, 40, None, None, None]
+    })
+    data.to_csv(os.path.join(tmp_path, "input.tsv"), sep="\t", index=False)
+    return str(tmp_path)
+
+@pytest.fixture
+def worker(tmp_path):
+    socket_path = os.path.join(tmp_path, "worker.sock")
+    server = WorkerServer(socket_path, max_children=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield socket_path
+    server.shutdown()
+    server.server_close()
+
+def test_run_job(process_dir):
+    assert run_job(process_dir) == {"status": "ok"}
+    assert os.path.exists(os.path.join(process_dir, "result.tsv"))
+    assert os.path.exists(os.path.join(process_dir, "censored.tsv"))
+    assert os.path.exists(os.path.join(process_dir, "logrank_test.tsv"))
+
+def test_run_job_error(tmp_path):
+    # no input.tsv in the process directory
+    response = run_job(str(tmp_path))
+    assert response["status"] == "error"
+    assert "FileNotFoundError" in response["error"]
+
+def test_submit(worker, process_dir):
+    assert submit(process_dir, worker) == {"status": "ok"}
+    result = pd.read_csv(os.path.join(process_dir, "result.tsv"), sep="\t")
+    assert list(result.dataset_id.unique()) == ["A", "B"]
+
+def test_submit_error(worker, tmp_path):
+    response = submit(os.path.join(tmp_path, "missing"), worker)
+    assert response["status"] == "error"
+
+def test_client_without_worker(process_dir, tmp_path):
+    # the client runs the analysis itself if no worker is listening
+    with patch.dict(os.environ, {"UNITE_WORKER_SOCKET": os.path.join(tmp_path, "none.sock")}):
+        client.main(process_dir)
+    assert os.path.exists(os.path.join(process_dir, "result.tsv"))